@@ -0,0 +1,163 @@
+# Copyright (c) 2015 Gamda Software, LLC
+#
+# See the file LICENSE.txt for copying permission.
+
+import numpy as np
+from .bitboard import (FULL, DIRECTIONS, WHITE_DIRECTIONS, BLACK_DIRECTIONS,
+                       NEIGHBORS, COORDINATE_MOVES, shift)
+from .records import encode_position
+
+# Move generation for many positions at once. The masks of every position
+# are held in uint32 arrays and moved with bitboard.shift(), which works on
+# arrays as well as on ints, so each rule costs a few array operations for
+# the whole batch instead of a Python loop per position.
+
+# One record of records.POSITION, so position files can be used directly
+POSITION_DTYPE = np.dtype([('white', '<u4'), ('black', '<u4'),
+                           ('queens', '<u4'), ('flags', 'u1')])
+
+_BITS = np.arange(32, dtype=np.uint32)
+
+
+def _targets(steps):
+    # _targets(n)[d][o] is the mask of the square n steps from bit o in
+    # direction d, 0 if it is off the board
+    targets = []
+    for d in DIRECTIONS:
+        row = []
+        for o in range(32):
+            b = o
+            for i in range(steps):
+                b = NEIGHBORS[d][b] if b >= 0 else -1
+            row.append(1 << b if b >= 0 else 0)
+        targets.append(np.array(row, dtype=np.uint32))
+    return targets
+
+_STEP = _targets(1)
+_JUMP = _targets(2)
+
+
+def positions_array(data):
+    """Return an array of POSITION_DTYPE over data without copying it
+
+    Args:
+        data: bytes, memoryview or mmap holding records.POSITION records
+    """
+    return np.frombuffer(data, dtype=POSITION_DTYPE)
+
+
+def encode_models(models):
+    """Return an array of POSITION_DTYPE with the position of each Model"""
+    return positions_array(b''.join(encode_position(m) for m in models))
+
+
+def _fill(mask, direction, empty):
+    # every empty square reachable from mask in direction, and mask itself
+    for i in range(7):
+        mask = mask | shift(mask, direction) & empty
+    return mask
+
+
+def _queen_moves(queens, own, rival, empty):
+    # (quiet, jumps) masks for arrays of single queens, as
+    # Position.queen_moves_in_direction() summed over the four directions
+    quiet = np.zeros_like(queens)
+    jumps = np.zeros_like(queens)
+    for d in DIRECTIONS:
+        reach = _fill(queens, d, empty)
+        quiet |= reach & ~queens
+        landing = shift(shift(reach, d) & rival, d) & empty
+        landing = _fill(landing, d, empty)
+        # a second rival right after the landings can be jumped too
+        after = shift(shift(landing, d) & rival, d) & empty
+        jumps |= landing | np.where(landing != 0, after, 0).astype(np.uint32)
+    return quiet, jumps
+
+
+def legal_moves(positions):
+    """Return the legal moves of every position
+
+    The rules are those of Model.available_moves(): jumps are forced and a
+    chip that must keep jumping is the only one that can move.
+
+    Args:
+        positions (numpy.ndarray): array of POSITION_DTYPE
+    Returns:
+        tuple: (destinations, can_jump), where destinations[i, o] is the
+        mask of the bits the chip on bit o of position i can move to, and
+        can_jump[i] is True if the moves of position i are jumps
+
+    """
+    white = positions['white']
+    black = positions['black']
+    queens = positions['queens']
+    flags = positions['flags']
+    white_to_move = flags & 0x80 != 0
+    current = (flags & 0x3F).astype(np.uint32)
+    own = np.where(white_to_move, white, black)
+    rival = np.where(white_to_move, black, white)
+    empty = ~(white | black)
+    origins = np.where(current != 0,
+                       np.uint32(1) << (np.maximum(current, 1) - 1),
+                       np.uint32(FULL))
+
+    soldiers = own & ~queens & origins
+    zero = np.zeros_like(soldiers)
+    forward = {}
+    for directions, mask in ((WHITE_DIRECTIONS,
+                              np.where(white_to_move, soldiers, zero)),
+                             (BLACK_DIRECTIONS,
+                              np.where(white_to_move, zero, soldiers))):
+        for d in directions:
+            forward[d] = mask
+    count = len(positions)
+    regular = np.zeros((count, 32), dtype=np.uint32)
+    jumps = np.zeros((count, 32), dtype=np.uint32)
+    for d, mask in forward.items():
+        step = shift(mask, d)
+        landing = shift(step & rival, d) & empty
+        # the chip that lands on JUMP[d][o] is the one on bit o
+        jumps |= landing[:, None] & _JUMP[d][None, :]
+        regular |= (step & empty)[:, None] & _STEP[d][None, :]
+
+    mask = own & queens & origins
+    rows, bits = np.nonzero(mask[:, None] >> _BITS[None, :] & 1)
+    if len(rows):
+        quiet, landing = _queen_moves(np.uint32(1) << bits.astype(np.uint32),
+                                      own[rows], rival[rows], empty[rows])
+        regular[rows, bits] = quiet
+        jumps[rows, bits] = landing
+
+    can_jump = jumps.any(axis=1)
+    return np.where(can_jump[:, None], jumps, regular), can_jump
+
+
+def move_arrays(destinations):
+    """Flatten the result of legal_moves() into arrays of moves
+
+    Returns:
+        tuple: (position, origin, destination) arrays of indexes and bits,
+        one element per move, ordered by position
+
+    """
+    # one row of 32 * 32 bits per position, ordered by origin then
+    # destination
+    bits = np.unpackbits(destinations.astype('<u4').view(np.uint8),
+                         axis=1, bitorder='little')
+    index, flat = np.nonzero(bits)
+    return index, flat >> 5, flat & 31
+
+
+def move_lists(positions):
+    """Return a list with the moves of every position
+
+    Each element is a list of (origin, destination) Coordinate tuples, the
+    same moves that Model.available_moves() returns for the position.
+
+    """
+    index, origins, destinations = move_arrays(legal_moves(positions)[0])
+    lists = [[] for i in range(len(positions))]
+    for i, o, d in zip(index.tolist(), origins.tolist(),
+                       destinations.tolist()):
+        lists[i].append(COORDINATE_MOVES[o, d])
+    return lists
@@ -0,0 +1,531 @@
+# Copyright (c) 2015 Gamda Software, LLC
+#
+# See the file LICENSE.txt for copying permission.
+
+from gameboard.coordinate import Coordinate
+try:
+    from .tables import TOP_LEFT, TOP_RIGHT, BTM_LEFT, BTM_RIGHT, \
+                        DIRECTIONS, OPPOSITE, WHITE_DIRECTIONS, \
+                        BLACK_DIRECTIONS, WHITE_PROMOTION, \
+                        BLACK_PROMOTION, PROMOTION, NEIGHBORS, JUMPS, \
+                        RAY_MASKS, DIRECTION, BETWEEN, nearest
+except ImportError: # imported as a script module by checkers.py
+    from tables import TOP_LEFT, TOP_RIGHT, BTM_LEFT, BTM_RIGHT, \
+                       DIRECTIONS, OPPOSITE, WHITE_DIRECTIONS, \
+                       BLACK_DIRECTIONS, WHITE_PROMOTION, \
+                       BLACK_PROMOTION, PROMOTION, NEIGHBORS, JUMPS, \
+                       RAY_MASKS, DIRECTION, BETWEEN, nearest
+
+# The 32 playable squares are numbered row by row starting at a1, four per
+# row: bit = 4 * row + column // 2. A position is described by three 32-bit
+# masks (white chips, black chips, queens) plus the side to move. Soldiers
+# are moved around the board by shifting whole masks at once, while the
+# moves of a single chip are looked up in the tables of tables.py.
+
+FULL = 0xFFFFFFFF
+
+SQUARES = []        # bit -> Coordinate
+BITS = [None] * 64  # Coordinate -> bit, None for the light squares
+for _row in range(8):
+    for _column in range(_row % 2, 8, 2):
+        BITS[_column * 8 + _row] = len(SQUARES)
+        SQUARES.append(Coordinate(_column * 8 + _row))
+# (origin bit, destination bit) -> (origin Coordinate, destination Coordinate)
+COORDINATE_MOVES = {(o, d): (SQUARES[o], SQUARES[d])
+                    for o in range(32) for d in range(32)}
+
+EVEN_ROWS = 0x0F0F0F0F
+ODD_ROWS = 0xF0F0F0F0
+COLUMN_A = 0x01010101
+COLUMN_H = 0x80808080
+_EVEN_NOT_A = EVEN_ROWS & ~COLUMN_A
+_ODD_NOT_H = ODD_ROWS & ~COLUMN_H
+
+
+def shift(mask, direction):
+    """Return mask with every square moved one step in direction
+
+    Squares that would leave the board are dropped.
+
+    """
+    if direction == TOP_LEFT:
+        return ((mask & _EVEN_NOT_A) << 3 | (mask & ODD_ROWS) << 4) & FULL
+    if direction == TOP_RIGHT:
+        return ((mask & EVEN_ROWS) << 4 | (mask & _ODD_NOT_H) << 5) & FULL
+    if direction == BTM_LEFT:
+        return (mask & _EVEN_NOT_A) >> 5 | (mask & ODD_ROWS) >> 4
+    return (mask & EVEN_ROWS) >> 4 | (mask & _ODD_NOT_H) >> 3
+
+
+def bits_of(mask):
+    """Yield the index of every bit set in mask, lowest first"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+_BACK = tuple(NEIGHBORS[OPPOSITE[d]] for d in DIRECTIONS)
+
+
+def _byte_pairs(origin_of):
+    # [i][byte] -> frozenset of the Coordinate pairs of the destinations set
+    # in byte i of a mask, each coming from origin_of(destination)
+    pairs = []
+    for i in range(4):
+        part = []
+        for byte in range(256):
+            destinations = [8 * i + j for j in range(8) if byte >> j & 1]
+            part.append(frozenset(COORDINATE_MOVES[origin_of(b), b]
+                                  for b in destinations
+                                  if origin_of(b) >= 0))
+        pairs.append(tuple(part))
+    return tuple(pairs)
+
+# _STEP_PAIRS[d] turns a mask of squares reached by a soldier step in
+# direction d into Coordinate pairs a byte at a time, _JUMP_PAIRS[d] a mask
+# of squares reached by a short jump. Sets remember the hashes of their
+# items, so merging them never calls the Python-level hash of Coordinate.
+_STEP_PAIRS = tuple(_byte_pairs(back.__getitem__) for back in _BACK)
+_JUMP_PAIRS = tuple(_byte_pairs(lambda b, back=back: back[back[b]]
+                                if back[b] >= 0 else -1)
+                    for back in _BACK)
+
+
+def _submasks(mask):
+    # every mask made of some of the bits of mask, 0 included
+    sub = mask
+    while True:
+        yield sub
+        if not sub:
+            return
+        sub = (sub - 1) & mask
+
+# _RAY_PAIRS[d][bit][mask] is the frozenset of the Coordinate pairs from bit
+# to the squares of mask, for every mask of squares on the ray of bit in
+# direction d; the regular moves and the jumps of a queen in a direction
+# are such masks
+_RAY_PAIRS = tuple(tuple({sub: frozenset(COORDINATE_MOVES[bit, b]
+                                         for b in bits_of(sub))
+                          for sub in _submasks(RAY_MASKS[d][bit])}
+                         for bit in range(32))
+                   for d in DIRECTIONS)
+
+
+class Position:
+    """Compact game position made of 32-bit masks
+
+    Attributes:
+        white (int): mask of squares holding white chips
+        black (int): mask of squares holding black chips
+        queens (int): mask of squares holding queens of either color
+        white_to_move (bool): True if it is white's turn
+
+    """
+    __slots__ = ('white', 'black', 'queens', 'white_to_move')
+
+    def __init__(self, white=0, black=0, queens=0, white_to_move=True):
+        self.white = white
+        self.black = black
+        self.queens = queens
+        self.white_to_move = white_to_move
+
+    def copy(self):
+        return Position(self.white, self.black,
+                        self.queens, self.white_to_move)
+
+    def _sides(self, mask):
+        # (own, rival, soldier directions) for the chip(s) in mask
+        if mask & self.white:
+            return self.white, self.black, WHITE_DIRECTIONS
+        return self.black, self.white, BLACK_DIRECTIONS
+
+    def _soldier_moves(self, bit, rival, directions):
+        occupied = self.white | self.black
+        jumps = quiet = 0
+        for d in directions:
+            step = NEIGHBORS[d][bit]
+            if step < 0:
+                continue
+            if rival >> step & 1:
+                jump = JUMPS[d][bit]
+                if jump is not None and not occupied >> jump[1] & 1:
+                    jumps |= 1 << jump[1]
+            elif not occupied >> step & 1:
+                quiet |= 1 << step
+        if jumps:
+            return jumps, True
+        return quiet, False
+
+    def queen_moves_in_direction(self, bit, direction, own, rival):
+        """Return (regular moves mask, jumps mask) of a queen in direction
+
+        After jumping a rival, the queen may land on any empty square up to
+        the next chip. If that chip is a rival followed by an empty square,
+        the square after it is a valid landing too.
+
+        Args:
+            bit (int): the square of the queen
+            direction (int): one of DIRECTIONS
+            own (int): mask of the chips of the queen's color
+            rival (int): mask of the chips of the other color
+
+        """
+        occupied = own | rival
+        rays = RAY_MASKS[direction]
+        ray = rays[bit]
+        blockers = ray & occupied
+        if not blockers:
+            return ray, 0
+        # the squares before the first chip, not counting the ones after it
+        b = nearest(blockers, direction)
+        quiet = ray ^ rays[b] ^ 1 << b
+        if not rival >> b & 1:
+            return quiet, 0
+        beyond = rays[b]
+        blockers = beyond & occupied
+        if not blockers:
+            return quiet, beyond
+        b = nearest(blockers, direction)
+        jumps = beyond ^ rays[b] ^ 1 << b
+        if jumps and rival >> b & 1:
+            after = NEIGHBORS[direction][b]
+            if after >= 0 and not occupied >> after & 1:
+                jumps |= 1 << after
+        return quiet, jumps
+
+    def _queen_moves(self, bit, own, rival):
+        quiet = jumps = 0
+        for d in DIRECTIONS:
+            new_quiet, new_jumps = \
+                self.queen_moves_in_direction(bit, d, own, rival)
+            quiet |= new_quiet
+            jumps |= new_jumps
+        if jumps:
+            return jumps, True
+        return quiet, False
+
+    def chip_moves(self, bit):
+        """Return (destinations mask, bool can_jump) for the chip on bit
+
+        The chip moves as its own color, regardless of whose turn it is.
+
+        """
+        mask = 1 << bit
+        if not mask & (self.white | self.black):
+            return 0, False
+        own, rival, directions = self._sides(mask)
+        if mask & self.queens:
+            return self._queen_moves(bit, own, rival)
+        return self._soldier_moves(bit, rival, directions)
+
+    def _steps(self, origins):
+        # (own, rival, steps) for the side to move, where steps pairs each
+        # soldier direction with the squares its soldiers in origins step on
+        if self.white_to_move:
+            own, rival = self.white, self.black
+            soldiers = own & origins & ~self.queens
+            steps = ((TOP_LEFT, ((soldiers & _EVEN_NOT_A) << 3 |
+                                 (soldiers & ODD_ROWS) << 4) & FULL),
+                     (TOP_RIGHT, ((soldiers & EVEN_ROWS) << 4 |
+                                  (soldiers & _ODD_NOT_H) << 5) & FULL))
+        else:
+            own, rival = self.black, self.white
+            soldiers = own & origins & ~self.queens
+            steps = ((BTM_LEFT, (soldiers & _EVEN_NOT_A) >> 5 |
+                                (soldiers & ODD_ROWS) >> 4),
+                     (BTM_RIGHT, (soldiers & EVEN_ROWS) >> 4 |
+                                 (soldiers & _ODD_NOT_H) >> 3))
+        return own, rival, steps
+
+    def moves(self, origins=FULL):
+        """Return (list of (origin, destination) bits, bool can_jump)
+
+        Moves are generated for the side to move, restricted to the chips in
+        origins. If any chip can jump, only jumps are returned.
+
+        """
+        own, rival, steps = self._steps(origins)
+        empty = ~(self.white | self.black) & FULL
+        queens = own & origins & self.queens
+        jumps = []
+        for d, step in steps:
+            if step & rival:
+                back = _BACK[d]
+                landing = shift(step & rival, d) & empty
+                while landing:
+                    low = landing & -landing
+                    b = low.bit_length() - 1
+                    jumps.append((back[back[b]], b))
+                    landing ^= low
+        regular = []
+        while queens:
+            low = queens & -queens
+            q = low.bit_length() - 1
+            queens ^= low
+            for d in DIRECTIONS:
+                quiet, landing = \
+                    self.queen_moves_in_direction(q, d, own, rival)
+                if landing:
+                    jumps.extend((q, b) for b in bits_of(landing))
+                elif quiet and not jumps:
+                    regular.extend((q, b) for b in bits_of(quiet))
+        if jumps:
+            return jumps, True
+        for d, step in steps:
+            back = _BACK[d]
+            step &= empty
+            while step:
+                low = step & -step
+                b = low.bit_length() - 1
+                regular.append((back[b], b))
+                step ^= low
+        return regular, False
+
+    def coordinate_moves(self, origins=FULL):
+        """Return the moves of moves() as a set of Coordinate pairs
+
+        Soldier moves are looked up in tables a byte of a mask at a time,
+        and the moves of a queen a direction at a time, so the pairs are not
+        made and hashed one at a time.
+
+        Returns:
+            tuple: (set of (origin, destination) Coordinate tuples, bool
+            can_jump)
+
+        """
+        white, black, all_queens = self.white, self.black, self.queens
+        # the soldier steps are written out, this runs for every position
+        if self.white_to_move:
+            own, rival = white, black
+            soldiers = own & origins & ~all_queens
+            left = ((soldiers & _EVEN_NOT_A) << 3 |
+                    (soldiers & ODD_ROWS) << 4) & FULL
+            right = ((soldiers & EVEN_ROWS) << 4 |
+                     (soldiers & _ODD_NOT_H) << 5) & FULL
+            to_left, to_right = TOP_LEFT, TOP_RIGHT
+        else:
+            own, rival = black, white
+            soldiers = own & origins & ~all_queens
+            left = (soldiers & _EVEN_NOT_A) >> 5 | (soldiers & ODD_ROWS) >> 4
+            right = (soldiers & EVEN_ROWS) >> 4 | (soldiers & _ODD_NOT_H) >> 3
+            to_left, to_right = BTM_LEFT, BTM_RIGHT
+        empty = ~(white | black) & FULL
+        jumps = None
+        if (left | right) & rival:
+            for d, step in ((to_left, left), (to_right, right)):
+                landing = shift(step & rival, d) & empty
+                if landing:
+                    if jumps is None:
+                        jumps = set()
+                    t0, t1, t2, t3 = _JUMP_PAIRS[d]
+                    jumps.update(t0[landing & 255], t1[landing >> 8 & 255],
+                                 t2[landing >> 16 & 255], t3[landing >> 24])
+        queens = own & origins & all_queens
+        quiet_queens = []
+        while queens:
+            low = queens & -queens
+            q = low.bit_length() - 1
+            queens ^= low
+            for d in DIRECTIONS:
+                quiet, landing = self.queen_moves_in_direction(q, d, own,
+                                                               rival)
+                if landing:
+                    if jumps is None:
+                        jumps = set()
+                    jumps |= _RAY_PAIRS[d][q][landing]
+                elif jumps is None and quiet:
+                    quiet_queens.append(_RAY_PAIRS[d][q][quiet])
+        if jumps is not None:
+            return jumps, True
+        left &= empty
+        right &= empty
+        l0, l1, l2, l3 = _STEP_PAIRS[to_left]
+        r0, r1, r2, r3 = _STEP_PAIRS[to_right]
+        moves = set()
+        moves.update(l0[left & 255], l1[left >> 8 & 255],
+                     l2[left >> 16 & 255], l3[left >> 24],
+                     r0[right & 255], r1[right >> 8 & 255],
+                     r2[right >> 16 & 255], r3[right >> 24])
+        if quiet_queens:
+            moves.update(*quiet_queens)
+        return moves, False
+
+    def iter_moves(self, origins=FULL):
+        """Yield the (origin, destination) bits of the moves of moves()
+
+        Moves are made one at a time as the caller asks for them, so
+        stopping early skips the rest. The position must not change while
+        the moves are being yielded.
+
+        """
+        own, rival, steps = self._steps(origins)
+        empty = ~(self.white | self.black) & FULL
+        queens = own & origins & self.queens
+        if self._can_jump(own, rival, steps, queens, empty):
+            for d, step in steps:
+                back = _BACK[d]
+                for b in bits_of(shift(step & rival, d) & empty):
+                    yield back[back[b]], b
+            for q in bits_of(queens):
+                for d in DIRECTIONS:
+                    landing = self.queen_moves_in_direction(q, d, own,
+                                                            rival)[1]
+                    for b in bits_of(landing):
+                        yield q, b
+        else:
+            for d, step in steps:
+                back = _BACK[d]
+                for b in bits_of(step & empty):
+                    yield back[b], b
+            for q in bits_of(queens):
+                for d in DIRECTIONS:
+                    quiet = self.queen_moves_in_direction(q, d, own,
+                                                          rival)[0]
+                    for b in bits_of(quiet):
+                        yield q, b
+
+    def _can_jump(self, own, rival, steps, queens, empty):
+        for d, step in steps:
+            if shift(step & rival, d) & empty:
+                return True
+        for q in bits_of(queens):
+            for d in DIRECTIONS:
+                if self.queen_moves_in_direction(q, d, own, rival)[1]:
+                    return True
+        return False
+
+    def can_jump(self, origins=FULL):
+        """Return True if a chip of the side to move in origins can jump"""
+        own, rival, steps = self._steps(origins)
+        return self._can_jump(own, rival, steps, own & origins & self.queens,
+                              ~(self.white | self.black) & FULL)
+
+    def has_move(self, origins=FULL):
+        """Return True if a chip of the side to move in origins can move
+
+        Only the squares next to the chips are looked at: a chip can move if
+        one of them is empty, or holds a rival with an empty square behind.
+
+        """
+        own, rival, steps = self._steps(origins)
+        empty = ~(self.white | self.black) & FULL
+        for d, step in steps:
+            if step & empty or shift(step & rival, d) & empty:
+                return True
+        queens = own & origins & self.queens
+        if queens:
+            for d in DIRECTIONS:
+                step = shift(queens, d)
+                if step & empty or shift(step & rival, d) & empty:
+                    return True
+        return False
+
+    def count_moves(self, origins=FULL):
+        """Return len(moves(origins)[0]) without building the list"""
+        own, rival, steps = self._steps(origins)
+        empty = ~(self.white | self.black) & FULL
+        jumps = quiet = 0
+        for d, step in steps:
+            jumps += bin(shift(step & rival, d) & empty).count('1')
+            quiet += bin(step & empty).count('1')
+        for q in bits_of(own & origins & self.queens):
+            for d in DIRECTIONS:
+                new_quiet, new_jumps = \
+                    self.queen_moves_in_direction(q, d, own, rival)
+                jumps += bin(new_jumps).count('1')
+                quiet += bin(new_quiet).count('1')
+        return jumps if jumps else quiet
+
+    def is_legal(self, origin, destination, origins=FULL):
+        """Return True if (origin, destination) is one of moves(origins)"""
+        own = self.white if self.white_to_move else self.black
+        if not (own & origins) >> origin & 1:
+            return False
+        destinations, can_jump = self.chip_moves(origin)
+        if not destinations >> destination & 1:
+            return False
+        # a regular move is only legal when no other chip can jump
+        return can_jump or not self.can_jump(origins)
+
+    def turns(self, origins=FULL):
+        """Return every complete turn of the side to move
+
+        Multi-jumps are followed depth first to the end, so each turn is one
+        whole sequence of hops. Chips that reach the far row are not crowned
+        before the turn ends, as in Model.make_move().
+
+        Args:
+            origins (int): mask of the chips that may move
+        Returns:
+            list: (path, captured) tuples, where path holds the bits of the
+            origin and of every landing square, and captured the bits of
+            the chips jumped, in order
+
+        """
+        moves, can_jump = self.moves(origins)
+        if not can_jump:
+            return [((o, d), ()) for o, d in moves]
+        turns = []
+        for o, d in moves:
+            after = self.copy()
+            removed = after.move_chip(o, d)
+            after._continue_jumps((o, d), tuple(removed), turns)
+        return turns
+
+    def _continue_jumps(self, path, captured, turns):
+        # the chip on path[-1] has just jumped; extend the turn while it can
+        destinations, can_jump = self.chip_moves(path[-1])
+        if not can_jump:
+            turns.append((path, captured))
+            return
+        for d in bits_of(destinations):
+            after = self.copy()
+            removed = after.move_chip(path[-1], d)
+            after._continue_jumps(path + (d,), captured + tuple(removed),
+                                  turns)
+
+    def jumped_chips(self, origin, destination):
+        """Return a list with the bits of the chips between two squares"""
+        jumped = BETWEEN[origin][destination] & (self.white | self.black)
+        if not jumped & (jumped - 1):
+            return [jumped.bit_length() - 1] if jumped else []
+        # a queen jumped two chips: list them in the order they were met
+        jumped = list(bits_of(jumped))
+        if DIRECTION[origin][destination] >= BTM_LEFT:
+            jumped.reverse()
+        return jumped
+
+    def move_chip(self, origin, destination):
+        """Move the chip on origin to destination and return removed bits
+
+        Every chip between origin and destination is removed. Promotion and
+        the change of turn are left to the caller.
+
+        """
+        removed = self.jumped_chips(origin, destination)
+        source, target = 1 << origin, 1 << destination
+        for b in removed:
+            clear = ~(1 << b)
+            self.white &= clear
+            self.black &= clear
+            self.queens &= clear
+        if self.white & source:
+            self.white ^= source | target
+        else:
+            self.black ^= source | target
+        if self.queens & source:
+            self.queens ^= source | target
+        return removed
+
+    def promote(self, bit):
+        """Promote the chip on bit if it reached the far row; return bool"""
+        mask = 1 << bit
+        if mask & PROMOTION[self.white >> bit & 1] and \
+                not mask & self.queens:
+            self.queens |= mask
+            return True
+        return False
+
+    def next_turn(self):
+        self.white_to_move = not self.white_to_move
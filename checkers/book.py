@@ -0,0 +1,285 @@
+# Copyright (c) 2015 Gamda Software, LLC
+#
+# See the file LICENSE.txt for copying permission.
+
+import argparse
+import heapq
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from .bitboard import BITS, SQUARES
+from .model import Model, Chip
+from . import records
+
+# A book file starts with _HEADER (magic, number of entries), followed by
+# one _ENTRY (position key, origin bit, destination bit, games, points) per
+# hop played from a position, sorted by key, origin and destination. Points
+# are half points won by the side that played the hop: 2 for a win, 1 for a
+# draw.
+_MAGIC = b'CKBK'
+_HEADER = struct.Struct('<4sI')
+_ENTRY = struct.Struct('<QBBII')
+
+# origin and destination are Coordinates, games the number of games where
+# the hop was played and score the share of them won by the side that played
+# it, draws counting half
+BookMove = namedtuple('BookMove', ['origin', 'destination', 'games',
+                                   'score'])
+
+_POINTS = {Model.Gamestate.whiteWon: (2, 0),
+           Model.Gamestate.blackWon: (0, 2)}
+
+
+def _game_entries(game, max_turns):
+    # (key, origin bit, destination bit, points) of every hop played in the
+    # first max_turns turns of a GameRecord
+    model = records.fields_to_model(game.start)
+    white, black = _POINTS.get(game.result, (1, 1))
+    turns = 0
+    for origin, destination in game.moves:
+        if turns >= max_turns:
+            return
+        turn = model.turn
+        yield (model.key, BITS[origin], BITS[destination],
+               white if turn == Chip.Color.white else black)
+        model.make_move(origin, destination)
+        if model.turn != turn:
+            turns += 1
+
+
+def _write_run(counts):
+    run = tempfile.TemporaryFile()
+    for entry in sorted(counts.items()):
+        run.write(_ENTRY.pack(*(entry[0] + entry[1])))
+    counts.clear()
+    return run
+
+
+def _read_run(file, offset=0):
+    file.seek(offset)
+    while True:
+        data = file.read(_ENTRY.size * 4096)
+        if not data:
+            return
+        for entry in _ENTRY.iter_unpack(data):
+            yield entry
+
+
+def update(path, game_files, max_turns=20, chunk=1 << 20):
+    """Add the games of binary game record files to the book at path
+
+    The book is created if it does not exist. Hops are counted in memory
+    chunk entries at a time, written out as sorted runs and merged with the
+    entries already in the book, so a book grows by reading only the new
+    games. The file is replaced at the end, and books opened before keep
+    reading the old one.
+
+    Args:
+        path (str): the book file
+        game_files (list): paths of files written by records.write_game()
+        max_turns (int): turns of each game added to the book
+        chunk (int): distinct hops counted in memory at once
+    Returns:
+        int: the number of games added
+
+    """
+    runs = []
+    games = 0
+    try:
+        counts = {}
+        for name in game_files:
+            with open(name, 'rb') as f:
+                for game in records.read_games(f):
+                    games += 1
+                    for key, o, d, points in _game_entries(game, max_turns):
+                        total = counts.get((key, o, d), (0, 0))
+                        counts[key, o, d] = (total[0] + 1, total[1] + points)
+                        if len(counts) >= chunk:
+                            runs.append(_write_run(counts))
+        if counts:
+            runs.append(_write_run(counts))
+        sources = [_read_run(run) for run in runs]
+        if os.path.exists(path):
+            old = open(path, 'rb')
+            runs.append(old)
+            if _HEADER.unpack(old.read(_HEADER.size))[0] != _MAGIC:
+                raise ValueError("{} is not an opening book".format(path))
+            sources.append(_read_run(old, _HEADER.size))
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as output:
+            output.write(_HEADER.pack(_MAGIC, 0))
+            count = 0
+            last = None
+            for entry in heapq.merge(*sources):
+                if last is not None and entry[:3] == last[:3]:
+                    last = last[:3] + (last[3] + entry[3],
+                                       last[4] + entry[4])
+                    continue
+                if last is not None:
+                    output.write(_ENTRY.pack(*last))
+                    count += 1
+                last = entry
+            if last is not None:
+                output.write(_ENTRY.pack(*last))
+                count += 1
+            output.seek(0)
+            output.write(_HEADER.pack(_MAGIC, count))
+    finally:
+        for run in runs:
+            run.close()
+    os.replace(temporary, path)
+    return games
+
+
+def build(path, game_files, max_turns=20, chunk=1 << 20):
+    """Write a new book at path from binary game record files
+
+    Takes the same arguments as update() and returns the number of games.
+
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    return update(path, game_files, max_turns, chunk)
+
+
+class Book:
+    """Opening book read from a file of build() without loading it into
+    memory
+
+    Positions are found by binary search on their Zobrist key, so a probe
+    reads a few entries of the file whatever its size.
+
+    Args:
+        path (str): file written by build() or update()
+    Raises:
+        ValueError: if the file is not an opening book
+
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.entries = _HEADER.unpack_from(self._data)
+        if magic != _MAGIC or \
+                len(self._data) != _HEADER.size + self.entries * _ENTRY.size:
+            self._data.close()
+            raise ValueError("{} is not an opening book".format(path))
+
+    def close(self):
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.entries
+
+    def _entries(self, key):
+        data = self._data
+        low, high = 0, self.entries
+        while low < high: # first entry with a key not lower than key
+            middle = (low + high) // 2
+            if _ENTRY.unpack_from(data, _HEADER.size +
+                                  middle * _ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        for n in range(low, self.entries):
+            entry = _ENTRY.unpack_from(data, _HEADER.size + n * _ENTRY.size)
+            if entry[0] != key:
+                break
+            found.append(entry)
+        return found
+
+    def moves(self, model):
+        """Return the BookMoves of the position of a Model
+
+        Hops that are not legal in the position, which can only come from
+        two positions sharing a key, are left out.
+
+        Args:
+            model (Model): the position
+        Returns:
+            list: BookMoves, the most played first
+
+        """
+        found = []
+        legal = model._legal_moves()
+        for key, o, d, games, points in self._entries(model.key):
+            move = SQUARES[o], SQUARES[d]
+            if move in legal:
+                found.append(BookMove(move[0], move[1], games,
+                                      points / (2 * games)))
+        found.sort(key=lambda move: (-move.games, -move.score))
+        return found
+
+    def book_move(self, model, rng=None):
+        """Return the whole turn the book plays in the position of a Model
+
+        Every hop is the most played one, or chosen at random in proportion
+        to the games it was played in if rng is given. The model is left as
+        it was passed in.
+
+        Args:
+            model (Model): the position
+            rng (random.Random): source of the choices, if any
+        Returns:
+            list: (origin, destination) Coordinate tuples, as in
+            engine.SearchResult, or None if the book does not know how to
+            play the whole turn
+
+        """
+        turn = model.turn
+        played = []
+        try:
+            while True:
+                moves = self.moves(model)
+                if not moves:
+                    return None
+                if rng is None:
+                    move = moves[0]
+                else:
+                    move = rng.choices(moves, [m.games for m in moves])[0]
+                played.append(model.make_move(move.origin, move.destination))
+                if model.turn != turn:
+                    return [(record.origin, record.destination)
+                            for record in played]
+        finally:
+            for record in reversed(played):
+                model.unmake_move(record)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m checkers.book',
+        description='Build an opening book from binary game records, or add '
+                    'games to one.')
+    parser.add_argument('book', help='book file to write')
+    parser.add_argument('games', nargs='+',
+                        help='files written by records.write_game()')
+    parser.add_argument('--turns', type=int, default=20,
+                        help='turns of each game to add (default 20)')
+    parser.add_argument('--update', action='store_true',
+                        help='add the games to the book instead of '
+                             'replacing it')
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    write = update if args.update else build
+    games = write(args.book, args.games, args.turns)
+    with Book(args.book) as book:
+        entries = len(book)
+    print('{} games added, {} entries, {:.1f}s'.format(
+        games, entries, time.perf_counter() - start))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
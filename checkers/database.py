@@ -0,0 +1,206 @@
+# Copyright (c) 2015 Gamda Software, LLC
+#
+# See the file LICENSE.txt for copying permission.
+
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+from collections import namedtuple
+from .records import POSITION, POSITION_SIZE, unpack_fields, fields_to_model
+from . import zobrist
+
+# Read-only view of one stored position. It has the attributes of a
+# bitboard Position, so it can be passed to zobrist.position_key().
+PositionView = namedtuple('PositionView', ['white', 'black', 'queens',
+                                           'white_to_move', 'current_chip'])
+
+# The index of a database file is kept next to it, with INDEX_SUFFIX added
+# to the name. It holds one (key, record number) pair per position, sorted
+# by key.
+INDEX_SUFFIX = '.idx'
+_ENTRY = struct.Struct('<QQ')
+
+
+def position_key(view):
+    """Return the Zobrist key of a PositionView, the same as Model.key"""
+    return zobrist.position_key(view, view.current_chip)
+
+
+def _map(path):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None # empty files can not be mapped
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _read_run(file):
+    file.seek(0)
+    while True:
+        data = file.read(_ENTRY.size * 4096)
+        if not data:
+            return
+        for entry in _ENTRY.iter_unpack(data):
+            yield entry
+
+
+def build_index(path, chunk=1 << 20):
+    """Write the key index of the position file at path
+
+    Keys are sorted chunk positions at a time and the sorted runs merged,
+    so memory use does not grow with the size of the file.
+
+    Args:
+        path (str): file written by records.write_positions()
+        chunk (int): positions sorted in memory at once
+
+    """
+    runs = []
+    try:
+        with PositionDatabase(path, index=False) as db:
+            for first in range(0, len(db), chunk):
+                part = db[first:first + chunk]
+                entries = sorted((position_key(view), first + n)
+                                 for n, view in enumerate(part))
+                run = tempfile.TemporaryFile()
+                for entry in entries:
+                    run.write(_ENTRY.pack(*entry))
+                runs.append(run)
+        temporary = path + INDEX_SUFFIX + '.tmp'
+        with open(temporary, 'wb') as output:
+            for entry in heapq.merge(*[_read_run(run) for run in runs]):
+                output.write(_ENTRY.pack(*entry))
+        os.replace(temporary, path + INDEX_SUFFIX)
+    finally:
+        for run in runs:
+            run.close()
+
+
+class PositionDatabase:
+    """Read-only, memory-mapped file of positions
+
+    The file is the one written by records.write_positions(). Positions are
+    read from the mapping when they are asked for, so the file is never
+    loaded into memory as a whole.
+
+    Indexing returns a PositionView, slicing returns a PositionDatabase over
+    the same mapping without copying anything. Slices are only valid while
+    the database they were taken from is open.
+
+    Args:
+        path (str): the position file
+        index (bool): open the key index built by build_index(); by
+            default it is opened if it exists
+    Raises:
+        ValueError: if the file size is not a whole number of positions, or
+            the index does not match the file
+
+    """
+
+    def __init__(self, path, index=None):
+        self.path = path
+        self._index = None
+        self._index_map = None
+        self._map = _map(path)
+        self._view = memoryview(self._map) if self._map is not None \
+                     else memoryview(b'')
+        size = len(self._view)
+        if size % POSITION_SIZE:
+            self.close()
+            raise ValueError("{} is not a position file".format(path))
+        self._records = range(size // POSITION_SIZE)
+        if index or (index is None and os.path.exists(path + INDEX_SUFFIX)):
+            self._open_index()
+        self._root = self
+
+    def _open_index(self):
+        self._index_map = _map(self.path + INDEX_SUFFIX)
+        self._index = memoryview(self._index_map) \
+                      if self._index_map is not None else memoryview(b'')
+        if len(self._index) != _ENTRY.size * len(self._records):
+            self.close()
+            raise ValueError("index of {} is out of date".format(self.path))
+
+    def close(self):
+        """Unmap the file; the database and its slices can not be used"""
+        root = self._root if hasattr(self, '_root') else self
+        for view, mapping in ((root._view, root._map),
+                              (root._index, root._index_map)):
+            if view is not None:
+                view.release()
+            if mapping is not None:
+                mapping.close()
+        root._view = root._index = root._index_map = root._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            part = object.__new__(PositionDatabase)
+            part.__dict__.update(self.__dict__)
+            part._records = self._records[i]
+            return part
+        record = self._records[i]
+        return PositionView(*unpack_fields(
+            POSITION.unpack_from(self._view, record * POSITION_SIZE)))
+
+    def __iter__(self):
+        records = self._records
+        if records.step == 1:
+            data = self._view[records.start * POSITION_SIZE:
+                              records.stop * POSITION_SIZE]
+            try:
+                for raw in POSITION.iter_unpack(data):
+                    yield PositionView(*unpack_fields(raw))
+            finally:
+                data.release()
+        else:
+            for i in range(len(records)):
+                yield self[i]
+
+    def model(self, i, model=None):
+        """Return a Model holding position i
+
+        Args:
+            i (int): record number
+            model (Model): model to overwrite instead of creating one
+
+        """
+        return fields_to_model(self[i], model)
+
+    def find(self, key):
+        """Return the record numbers of the positions with the given key
+
+        Numbers are relative to this database, so on a slice only the
+        positions inside the slice are returned.
+
+        Raises:
+            ValueError: if the database was opened without an index
+
+        """
+        if self._index is None:
+            raise ValueError("{} has no index".format(self.path))
+        index = self._index
+        low, high = 0, len(index) // _ENTRY.size
+        while low < high: # first entry with a key not lower than key
+            middle = (low + high) // 2
+            if _ENTRY.unpack_from(index, middle * _ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        for n in range(low, len(index) // _ENTRY.size):
+            entry_key, record = _ENTRY.unpack_from(index, n * _ENTRY.size)
+            if entry_key != key:
+                break
+            if record in self._records:
+                found.append(self._records.index(record))
+        return found
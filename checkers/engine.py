@@ -0,0 +1,259 @@
+# Copyright (c) 2015 Gamda Software, LLC
+#
+# See the file LICENSE.txt for copying permission.
+
+import time
+from collections import namedtuple
+from .bitboard import BITS, PROMOTION
+from .transposition import TranspositionTable, EXACT, LOWER, UPPER
+from . import tablebase
+
+WIN = 100000
+SOLDIER = 100
+QUEEN = 250
+ADVANCED = 5
+
+# moves: list of (origin, destination) Coordinate tuples that make up the
+# whole turn, including every hop of a multi-jump. score is from the point
+# of view of the side to move.
+SearchResult = namedtuple('SearchResult', ['moves', 'score', 'depth', 'nodes'])
+
+
+def _count(mask):
+    return bin(mask).count('1')
+
+
+def material(model):
+    """Default evaluation: value of the chips on the board
+
+    Queens are worth more than soldiers, and soldiers get a small bonus once
+    they cross into the rival half of the board.
+
+    Args:
+        model (Model): the position to evaluate
+    Returns:
+        int: score from the point of view of the side to move
+
+    """
+    p = model._position
+    white_queens = p.white & p.queens
+    black_queens = p.black & p.queens
+    white = _count(p.white) * SOLDIER + \
+            _count(white_queens) * (QUEEN - SOLDIER) + \
+            _count(p.white & ~p.queens & 0xFFFF0000) * ADVANCED
+    black = _count(p.black) * SOLDIER + \
+            _count(black_queens) * (QUEEN - SOLDIER) + \
+            _count(p.black & ~p.queens & 0x0000FFFF) * ADVANCED
+    return white - black if p.white_to_move else black - white
+
+
+def _score_to_table(score, ply):
+    # wins are stored as distance from the position, not from the root
+    if score > WIN - 1000:
+        return score + ply
+    if score < 1000 - WIN:
+        return score - ply
+    return score
+
+
+def _score_from_table(score, ply):
+    if score > WIN - 1000:
+        return score - ply
+    if score < 1000 - WIN:
+        return score + ply
+    return score
+
+
+def _tablebase_score(entry, ply):
+    # a result that ends the game in distance turns scores like a search
+    # that reaches the end at ply + distance
+    if entry.result == tablebase.WIN:
+        return WIN - ply - entry.distance
+    if entry.result == tablebase.LOSS:
+        return ply + entry.distance - WIN
+    return 0
+
+
+class _Abort(Exception):
+    pass
+
+
+class Engine:
+    """Alpha-beta player with iterative deepening
+
+    Args:
+        evaluate (function): takes a Model and returns a score from the
+            point of view of the side to move
+        max_depth (int): deepest iteration, in turns
+        max_nodes (int): stop searching after this many nodes
+        max_time (float): stop searching after this many seconds
+        table (TranspositionTable): results shared between searches; a new
+            8 MB table is created if none is given
+        tablebase (Tablebase): exact results of positions with few chips,
+            used instead of searching them
+        book (Book): opening book; a position it knows is not searched and
+            its turn is returned with score 0 at depth 0
+
+    A turn counts as a single step of depth no matter how many jumps it
+    takes. The search stops at whichever limit is reached first, and the
+    result of the deepest completed iteration is returned.
+
+    """
+
+    def __init__(self, evaluate=material, max_depth=6,
+                 max_nodes=None, max_time=None, table=None, tablebase=None,
+                 book=None):
+        self.evaluate = evaluate
+        self.table = table if table is not None else TranspositionTable()
+        self.tablebase = tablebase
+        self.book = book
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.max_time = max_time
+        self.nodes = 0
+        self._next_check = 0
+        self._stopped = False
+        self._deadline = None
+        self._first_iteration = True
+        self._best_line = []
+
+    def stop(self):
+        """Ask a running search to return as soon as possible"""
+        self._stopped = True
+
+    def _check_limits(self):
+        self._next_check = self.nodes + 256
+        if self.max_nodes is not None:
+            self._next_check = min(self._next_check, self.max_nodes)
+        if self._first_iteration:
+            return # always finish depth 1 so there is a move to play
+        if self._stopped or \
+                (self.max_nodes is not None and
+                 self.nodes >= self.max_nodes) or \
+                (self._deadline is not None and
+                 time.perf_counter() >= self._deadline):
+            raise _Abort()
+
+    def _ordered_moves(self, model, ply, table_move):
+        # captures are forced by the rules, so when there is one all moves
+        # are captures; put the previous best moves first, then promotions
+        position = model._position
+        far_row = PROMOTION[position.white_to_move]
+        best = self._best_line[ply] if ply < len(self._best_line) else None
+        def priority(move):
+            if move == table_move or move == best:
+                return 0
+            destination = 1 << BITS[move[1]]
+            origin = 1 << BITS[move[0]]
+            if destination & far_row and not origin & position.queens:
+                return 1
+            return 2
+        return sorted(model._legal_moves(), key=priority)
+
+    def _search(self, model, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes >= self._next_check:
+            self._check_limits()
+        if not model._legal_moves():
+            return -WIN + ply, []
+        if ply > 0 and model._is_draw():
+            return 0, []
+        # like the table cutoff below, the hops of a multi-jump are searched
+        # so the line holds the whole turn
+        if ply > 0 and self.tablebase is not None and \
+                model._current_chip is None:
+            entry = self.tablebase.probe(model)
+            if entry is not None:
+                return _tablebase_score(entry, ply), []
+        if depth <= 0 and not model._legal_jumps:
+            return self.evaluate(model), []
+        table_move = None
+        entry = self.table.probe(model.key)
+        if entry is not None:
+            entry_depth, flag, score, table_move = entry
+            # the root and the hops of a multi-jump are always searched, so
+            # the whole turn to play ends up in the line
+            if entry_depth >= depth and ply > 0 and \
+                    model._current_chip is None:
+                score = _score_from_table(score, ply)
+                if flag == EXACT or \
+                        (flag == LOWER and score >= beta) or \
+                        (flag == UPPER and score <= alpha):
+                    return score, []
+        original_alpha = alpha
+        best_line = []
+        for move in self._ordered_moves(model, ply, table_move):
+            record = model.make_move(*move)
+            try:
+                if model._current_chip is not None:
+                    # same turn: the chip keeps jumping
+                    score, line = self._search(model, depth,
+                                               alpha, beta, ply + 1)
+                else:
+                    score, line = self._search(model, depth - 1,
+                                               -beta, -alpha, ply + 1)
+                    score = -score
+            finally:
+                model.unmake_move(record)
+            if score > alpha:
+                alpha = score
+                best_line = [move] + line
+                if alpha >= beta:
+                    break
+        flag = UPPER if alpha <= original_alpha \
+               else LOWER if alpha >= beta else EXACT
+        self.table.store(model.key, max(depth, 0), flag,
+                         _score_to_table(alpha, ply),
+                         best_line[0] if best_line else None)
+        return alpha, best_line
+
+    def search(self, model):
+        """Return the SearchResult of the best turn for the side to move
+
+        The model is left exactly as it was passed in.
+
+        Args:
+            model (Model): the position to search
+        Returns:
+            SearchResult: the best turn found, or None if the game is over
+
+        """
+        self.nodes = 0
+        self._next_check = 0
+        self._stopped = False
+        self._first_iteration = True
+        self._best_line = []
+        self.table.new_search()
+        self._deadline = time.perf_counter() + self.max_time \
+                         if self.max_time is not None else None
+        if not model._legal_moves():
+            return None
+        if self.book is not None:
+            moves = self.book.book_move(model)
+            if moves is not None:
+                return SearchResult(moves, 0, 0, 0)
+        result = None
+        for depth in range(1, self.max_depth + 1):
+            try:
+                score, line = self._search(model, depth, -WIN - 1, WIN + 1, 0)
+            except _Abort:
+                break
+            self._first_iteration = False
+            self._best_line = line
+            result = SearchResult(self._turn(line), score, depth, self.nodes)
+            if abs(score) > WIN - 1000:
+                break # forced result, searching deeper changes nothing
+            try:
+                self._check_limits()
+            except _Abort:
+                break
+        return result
+
+    def _turn(self, line):
+        # the hops at the start of line that belong to the same chip
+        turn = line[:1]
+        for move in line[1:]:
+            if move[0] != turn[-1][1]:
+                break
+            turn.append(move)
+        return turn
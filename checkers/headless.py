@@ -0,0 +1,181 @@
+# Copyright (c) 2015 Gamda Software, LLC
+#
+# See the file LICENSE.txt for copying permission.
+
+import argparse
+import io
+import json
+import os
+import sys
+import pygame
+from gameboard.coordinate import Coordinate
+from .layout import Layout
+from .model import Model
+from .renderer import Renderer, THEME
+from . import records
+
+
+def _png(surface):
+    data = io.BytesIO()
+    pygame.image.save(surface, data, 'png')
+    return data.getvalue()
+
+
+def _init_display():
+    # Surfaces only need a display to be converted to its pixel format;
+    # the dummy driver gives one without a screen.
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    if not pygame.display.get_init():
+        pygame.display.init()
+    if not pygame.font.get_init():
+        pygame.font.init()
+    if pygame.display.get_surface() is None:
+        pygame.display.set_mode((1, 1))
+
+
+class HeadlessRenderer:
+    """Draws Model positions to an off-screen surface
+
+    The image shows the board and its notation, without the side panel.
+    Between two calls to draw() only the squares that changed are drawn
+    again, so the frames of a game cost a few blits each.
+
+    Args:
+        size (int): width and height of the image in pixels
+        flipped (bool): draw the board with h8 at the bottom left
+        theme (dict): colors by name, renderer.THEME by default
+
+    """
+
+    def __init__(self, size=400, flipped=False, theme=THEME):
+        _init_display()
+        # the layout keeps a quarter of the width for the panel, which
+        # falls outside the image
+        self.layout = Layout(size * 4 // 3, size, flipped)
+        self.renderer = Renderer(self.layout.square, theme)
+        self.surface = pygame.Surface((size, size)).convert()
+        self._drawn = None
+
+    def draw(self, model, highlighted=()):
+        """Draw the position of model and return the surface
+
+        The same surface is returned every time; copy it to keep a frame.
+
+        Args:
+            model (Model): the position to draw
+            highlighted (iterable): Coordinates to draw with a border
+        Returns:
+            pygame.Surface: the image
+
+        """
+        chips = model.chips
+        state = {coord: (chip.color, chip.type) for coord, chip
+                 in chips.items()}
+        for coord in highlighted:
+            state[coord] = state.get(coord, ()) + (True,)
+        layout, renderer = self.layout, self.renderer
+        if self._drawn is None:
+            self.surface.blit(renderer.board(layout), (0, 0))
+            changed = state.keys()
+        else:
+            changed = {coord for coord in state.keys() | self._drawn.keys()
+                       if state.get(coord) != self._drawn.get(coord)}
+        for coord in changed:
+            renderer.draw_square(self.surface, layout.square_rect(coord),
+                                 layout.is_dark(coord), chips.get(coord),
+                                 coord in highlighted)
+        self._drawn = state
+        return self.surface
+
+    def png(self, model, highlighted=()):
+        """Return the image of the position of model as PNG bytes"""
+        return _png(self.draw(model, highlighted))
+
+    def game_frames(self, moves, model=None):
+        """Yield the surface of the start position and after every hop
+
+        The hop just played is highlighted. The same surface is yielded
+        every time.
+
+        Args:
+            moves (list): (origin, destination) Coordinate tuples, one per
+                hop
+            model (Model): start position, the usual one by default; it is
+                left at the end of the game
+
+        """
+        if model is None:
+            model = Model()
+        yield self.draw(model)
+        for origin, destination in moves:
+            model.make_move(origin, destination)
+            yield self.draw(model, (origin, destination))
+
+    def game_pngs(self, moves, model=None):
+        """Yield the frames of game_frames() as PNG bytes"""
+        for surface in self.game_frames(moves, model):
+            yield _png(surface)
+
+
+def read_games(path):
+    """Yield the start position and the hops of every game stored in a file
+
+    Args:
+        path (str): a self-play file of JSON lines if its name ends with
+            .jsonl, otherwise a binary file of game records
+    Yields:
+        tuple: (start, moves), where start holds the position fields of
+        records.decode_position() and moves (origin, destination)
+        Coordinate tuples, one per hop. Self-play games start from the
+        usual position.
+
+    """
+    if path.endswith('.jsonl'):
+        start = records.decode_position(records.START)
+        with open(path) as f:
+            for line in f:
+                yield start, [(Coordinate[o], Coordinate[d])
+                              for o, d in json.loads(line)['moves']]
+    else:
+        with open(path, 'rb') as f:
+            for game in records.read_games(f):
+                yield game.start, game.moves
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m checkers.headless',
+        description='Draw every position of recorded games to PNG files '
+                    'without a display.')
+    parser.add_argument('games',
+                        help='self-play .jsonl file or binary game records')
+    parser.add_argument('--output', required=True,
+                        help='directory the images are written to')
+    parser.add_argument('--size', type=int, default=400)
+    parser.add_argument('--flipped', action='store_true')
+    parser.add_argument('--last', action='store_true',
+                        help='only draw the final position of each game')
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output, exist_ok=True)
+    renderer = HeadlessRenderer(args.size, args.flipped)
+    images = 0
+    for game, (start, moves) in enumerate(read_games(args.games)):
+        model = records.fields_to_model(start)
+        if args.last:
+            for move in moves:
+                model.make_move(*move)
+            frames = [renderer.png(model, moves[-1] if moves else ())]
+        else:
+            frames = renderer.game_pngs(moves, model)
+        for hop, png in enumerate(frames):
+            name = 'game{:06d}-{:04d}.png'.format(game, hop)
+            with open(os.path.join(args.output, name), 'wb') as f:
+                f.write(png)
+            images += 1
+    print('{} images written to {}'.format(images, args.output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
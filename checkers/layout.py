@@ -0,0 +1,119 @@
+# Copyright (c) 2015 Gamda Software, LLC
+#
+# See the file LICENSE.txt for copying permission.
+
+import pygame
+from gameboard.coordinate import Coordinate
+
+_COORDINATES = [None] * 64
+for _square in Coordinate:
+    _COORDINATES[_square] = _square
+
+LETTERS = 'abcdefgh'
+
+
+class Layout:
+    """Position of the board, the squares and the side panel in the window
+
+    The board takes a square area on the left of the window, at most three
+    quarters of its width, with a margin for the notation around the
+    squares. The rest of the window is the panel.
+
+    Args:
+        width (int): window width in pixels
+        height (int): window height in pixels
+        flipped (bool): draw the board with h8 at the bottom left
+
+    """
+
+    def __init__(self, width, height, flipped=False):
+        self.flipped = flipped
+        self.size = None
+        self.resize(width, height)
+
+    def resize(self, width, height):
+        """Recompute the geometry for a new window size
+
+        Returns:
+            bool: True if the size changed
+
+        """
+        if (width, height) == self.size:
+            return False
+        self.size = (width, height)
+        side = min(height, width * 3 // 4)
+        self.margin = side // 15
+        self.square = max(1, (side - 2 * self.margin) // 8)
+        self.left = self.margin
+        self.top = self.margin
+        self.board = pygame.Rect(self.left, self.top,
+                                 8 * self.square, 8 * self.square)
+        self.panel = pygame.Rect(side, 0, width - side, height)
+        return True
+
+    def flip(self):
+        self.flipped = not self.flipped
+
+    def _cell(self, coord):
+        # (column, row) of coord counted on screen from the bottom left
+        column, row = divmod(int(coord), 8)
+        if self.flipped:
+            return 7 - column, 7 - row
+        return column, row
+
+    def square_rect(self, coord):
+        """Return the pygame.Rect of the square coord"""
+        column, row = self._cell(coord)
+        return pygame.Rect(self.left + column * self.square,
+                           self.top + (7 - row) * self.square,
+                           self.square, self.square)
+
+    def square_at(self, position):
+        """Return the Coordinate of the square at a pixel, or None"""
+        column = (position[0] - self.left) // self.square
+        row = 7 - (position[1] - self.top) // self.square
+        if not (0 <= column < 8 and 0 <= row < 8):
+            return None
+        if self.flipped:
+            column, row = 7 - column, 7 - row
+        return _COORDINATES[column * 8 + row]
+
+    def squares(self):
+        """Yield (Coordinate, pygame.Rect) for every square of the board"""
+        for coord in _COORDINATES:
+            yield coord, self.square_rect(coord)
+
+    @staticmethod
+    def is_dark(coord):
+        """Return True for the squares the chips stand on"""
+        column, row = divmod(int(coord), 8)
+        return (column + row) % 2 == 0
+
+    def button(self, row):
+        """Return the rect of a panel button level with a row of squares
+
+        Args:
+            row (int): 0 for the bottom row of the board, 7 for the top one
+
+        """
+        return pygame.Rect(self.panel.left + 10,
+                           self.top + (7 - row) * self.square,
+                           self.panel.width - 20, self.square)
+
+    def notation(self):
+        """Return the (text, position) of the labels around the board
+
+        position is a dict of pygame.Rect attributes placing the label.
+
+        """
+        labels = []
+        for n in range(8):
+            rect = self.square_rect(Coordinate(n))
+            labels.append((str(n + 1), {'centerx': self.margin // 2,
+                                        'centery': rect.centery}))
+        for i, letter in enumerate(LETTERS):
+            rect = self.square_rect(Coordinate(i * 8))
+            labels.append((letter, {'centerx': rect.centerx,
+                                    'centery': self.board.bottom +
+                                               self.margin // 2}))
+        return labels
@@ -0,0 +1,297 @@
+# Copyright (c) 2015 Gamda Software, LLC
+#
+# See the file LICENSE.txt for copying permission.
+
+import argparse
+import math
+import random
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait
+from .bitboard import Position, FULL, COORDINATE_MOVES, bits_of
+from .model import Model
+from . import records
+
+# moves: list of (origin, destination) Coordinate tuples that make up the
+# whole turn, as in engine.SearchResult. win_rate is the share of the
+# playouts through that turn won by the side to move, draws counting half.
+MCTSResult = namedtuple('MCTSResult', ['moves', 'win_rate', 'playouts',
+                                       'playouts_per_second'])
+
+# Playouts end in a draw after this many turns without a capture or a
+# soldier move, as games do with Model's default no_progress_limit
+NO_PROGRESS_LIMIT = 50
+
+
+def playout(position, current_chip=None, rng=random, max_turns=200):
+    """Play random turns from position to the end of the game
+
+    The position is changed in place instead of copied and no Model is
+    involved, so a hop costs a few mask operations. Repetitions are not
+    tracked.
+
+    Args:
+        position (Position): the start, left at the end of the playout
+        current_chip (int): bit of the chip that must keep jumping, if any
+        rng (random.Random): source of the moves
+        max_turns (int): the playout is a draw after this many turns
+    Returns:
+        float: 1 if white won, 0 if black won, 0.5 for a draw
+
+    """
+    origins = FULL if current_chip is None else 1 << current_chip
+    no_progress = 0
+    for turn in range(max_turns):
+        moves, can_jump = position.moves(origins)
+        if not moves:
+            return 0.0 if position.white_to_move else 1.0
+        origin, destination = rng.choice(moves)
+        if can_jump or not position.queens >> origin & 1:
+            no_progress = 0
+        else:
+            no_progress += 1
+            if no_progress >= NO_PROGRESS_LIMIT:
+                break
+        position.move_chip(origin, destination)
+        while can_jump:
+            destinations, can_jump = position.chip_moves(destination)
+            if can_jump:
+                origin = destination
+                destination = rng.choice(list(bits_of(destinations)))
+                position.move_chip(origin, destination)
+        position.promote(destination)
+        position.next_turn()
+        origins = FULL
+    return 0.5
+
+
+def _play_turn(position, path):
+    # play the hops of path, then crown the chip and pass the turn
+    for origin, destination in zip(path, path[1:]):
+        position.move_chip(origin, destination)
+    position.promote(path[-1])
+    position.next_turn()
+
+
+class _Node:
+    # a position of the tree, reached by playing the turn path; wins are
+    # counted for the side that played it
+    __slots__ = ('path', 'white', 'children', 'untried', 'visits', 'wins')
+
+    def __init__(self, path, white):
+        self.path = path
+        self.white = white
+        self.children = []
+        self.untried = None
+        self.visits = 0
+        self.wins = 0.0
+
+
+class _Tree:
+    # one UCT search from the position described by fields
+
+    def __init__(self, fields, exploration, rng, max_turns):
+        white, black, queens, white_to_move, current_chip = fields
+        self.start = Position(white, black, queens, white_to_move)
+        self.current_chip = current_chip
+        self.exploration = exploration
+        self.rng = rng
+        self.max_turns = max_turns
+        # the root is reached by the rival's last turn
+        self.root = _Node((), not white_to_move)
+        self.playouts = 0
+
+    def _turns(self, position, current_chip):
+        origins = FULL if current_chip is None else 1 << current_chip
+        turns = [path for path, captured in position.turns(origins)]
+        self.rng.shuffle(turns)
+        return turns
+
+    def _select(self, node):
+        log_visits = math.log(node.visits)
+        exploration = self.exploration
+        best, best_value = None, -1.0
+        for child in node.children:
+            value = child.wins / child.visits + \
+                    exploration * math.sqrt(log_visits / child.visits)
+            if value > best_value:
+                best, best_value = child, value
+        return best
+
+    def iterate(self):
+        """Select, expand, play out and back up once"""
+        position = self.start.copy()
+        current_chip = self.current_chip
+        node = self.root
+        nodes = [node]
+        # walk down while every turn of the node has a child
+        while True:
+            if node.untried is None:
+                node.untried = self._turns(position, current_chip)
+            if node.untried or not node.children:
+                break
+            node = self._select(node)
+            _play_turn(position, node.path)
+            nodes.append(node)
+            current_chip = None
+        if node.untried:
+            path = node.untried.pop()
+            child = _Node(path, position.white_to_move)
+            node.children.append(child)
+            _play_turn(position, path)
+            nodes.append(child)
+            result = playout(position, None, self.rng, self.max_turns)
+        else:
+            # no turns at all: the side to move has lost
+            result = 0.0 if position.white_to_move else 1.0
+        for node in nodes:
+            node.visits += 1
+            node.wins += result if node.white else 1.0 - result
+        self.playouts += 1
+
+    def run(self, deadline, max_playouts):
+        while self.playouts < max_playouts and time.time() < deadline:
+            self.iterate()
+        return self
+
+    def statistics(self):
+        """Return {path: (visits, wins)} for the turns of the root"""
+        return {child.path: (child.visits, child.wins)
+                for child in self.root.children}
+
+
+def _search_tree(fields, seed, deadline, max_playouts, exploration,
+                 max_turns):
+    # runs in the executor: one tree of a root-parallel search
+    tree = _Tree(fields, exploration, random.Random(seed), max_turns)
+    tree.run(deadline, max_playouts)
+    return tree.statistics(), tree.playouts
+
+
+class MCTS:
+    """Monte Carlo tree search player using UCT
+
+    Each iteration walks down a tree of whole turns, adds one turn to it
+    and ends the game with a random playout. Given an executor, more trees
+    are searched from the same position in other processes and their
+    statistics added up (root parallelization). The calling process always
+    searches a tree too, so there is a turn to play when time runs out.
+
+    Args:
+        max_time (float): seconds a search may take; trees that have not
+            reported by then are left out
+        max_playouts (int): playouts per tree, no limit if None
+        exploration (float): UCT exploration constant
+        executor (concurrent.futures.Executor): where the other trees run
+        trees (int): trees searched in the executor
+        seed: seed of the random playouts
+        max_turns (int): playouts longer than this many turns are draws
+    Raises:
+        ValueError: if both max_time and max_playouts are None
+
+    """
+
+    def __init__(self, max_time=1.0, max_playouts=None, exploration=1.4,
+                 executor=None, trees=0, seed=None, max_turns=200):
+        if max_time is None and max_playouts is None:
+            raise ValueError("MCTS needs max_time or max_playouts")
+        self.max_time = max_time
+        self.max_playouts = max_playouts
+        self.exploration = exploration
+        self.executor = executor
+        self.trees = trees if executor is not None else 0
+        self.rng = random.Random(seed)
+        self.max_turns = max_turns
+
+    def search(self, model):
+        """Return the MCTSResult of the best turn for the side to move
+
+        The model is not changed.
+
+        Args:
+            model (Model): the position to search
+        Returns:
+            MCTSResult: the most visited turn, or None if the game is over
+
+        """
+        start = time.time()
+        if not model.has_any_move():
+            return None
+        if self.max_time is None:
+            deadline = stop = float('inf')
+        else:
+            deadline = start + self.max_time
+            # leave time to collect the trees of the executor
+            stop = deadline - min(0.05, self.max_time / 10)
+        max_playouts = self.max_playouts \
+                       if self.max_playouts is not None else float('inf')
+        fields = records.position_fields(model)
+        futures = [self.executor.submit(_search_tree, fields,
+                                        self.rng.getrandbits(64), stop,
+                                        max_playouts, self.exploration,
+                                        self.max_turns)
+                   for i in range(self.trees)]
+        tree = _Tree(fields, self.exploration, self.rng, self.max_turns)
+        tree.iterate() # always have a turn to play
+        tree.run(stop, max_playouts)
+        results = [(tree.statistics(), tree.playouts)]
+        if futures:
+            timeout = None if self.max_time is None \
+                      else max(0.0, deadline - time.time())
+            done, late = wait(futures, timeout)
+            for future in late:
+                future.cancel()
+            results.extend(future.result() for future in done)
+        statistics = {}
+        playouts = 0
+        for tree_statistics, tree_playouts in results:
+            playouts += tree_playouts
+            for path, (visits, wins) in tree_statistics.items():
+                total = statistics.get(path, (0, 0.0))
+                statistics[path] = (total[0] + visits, total[1] + wins)
+        path, (visits, wins) = max(statistics.items(),
+                                   key=lambda item: item[1][0])
+        seconds = time.time() - start
+        return MCTSResult([COORDINATE_MOVES[hop]
+                           for hop in zip(path, path[1:])],
+                          wins / visits, playouts,
+                          playouts / seconds if seconds > 0 else 0.0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m checkers.mcts',
+        description='Search the start position with MCTS and report '
+                    'playouts per second.')
+    parser.add_argument('--time', type=float, default=1.0,
+                        help='seconds per search (default 1)')
+    parser.add_argument('--playouts', type=int, default=None,
+                        help='playouts per tree')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='processes searching more trees (default 0)')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    executor = None
+    if args.workers:
+        executor = ProcessPoolExecutor(args.workers)
+        # start the processes before the clock runs
+        list(executor.map(abs, range(args.workers)))
+    try:
+        player = MCTS(args.time, args.playouts, executor=executor,
+                      trees=args.workers, seed=args.seed)
+        result = player.search(Model())
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    print('best turn {}, win rate {:.3f}'.format(
+        ' '.join('{}-{}'.format(o.name, d.name) for o, d in result.moves),
+        result.win_rate))
+    print('{} playouts, {:.0f} playouts/s'.format(
+        result.playouts, result.playouts_per_second))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
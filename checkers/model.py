@@ -2,10 +2,18 @@
 #
 # See the file LICENSE.txt for copying permission.
 
+from collections import namedtuple
 from enum import Enum
 from gameboard.gameboard import Gameboard
-from gameboard.gameboard import Direction
 from gameboard.coordinate import Coordinate
+try:
+    from .bitboard import Position, SQUARES, BITS, COORDINATE_MOVES, \
+                          FULL, bits_of
+    from . import zobrist
+except ImportError: # model.py imported as a script module by checkers.py
+    from bitboard import Position, SQUARES, BITS, COORDINATE_MOVES, \
+                         FULL, bits_of
+    import zobrist
 
 class Chip:
     class Color(Enum):
@@ -15,14 +23,39 @@ class Chip:
         soldier = 0
         queen = 1 
     
-    def __init__(self, color):
-        if not isinstance(color, self.Color):
+    # Chips can not be changed, so there is one shared instance for each
+    # color and type; Chip(color) always returns the same soldier.
+    __slots__ = ('color', 'type')
+    _instances = {}
+
+    def __new__(cls, color, type=None):
+        if not isinstance(color, cls.Color):
             raise ValueError("Use Chip.Color values")
-        self.color = color
-        self.type = self.Type.soldier
+        if type is None:
+            type = cls.Type.soldier
+        elif not isinstance(type, cls.Type):
+            raise ValueError("Use Chip.Type values")
+        return cls._instances[color, type]
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Chip instances can not be changed")
+
+    def __reduce__(self):
+        return Chip, (self.color, self.type)
+
+    def __repr__(self):
+        return 'Chip({}, {})'.format(self.color, self.type)
 
     def promote(self):
-        self.type = self.Type.queen
+        """Return the queen of the same color"""
+        return Chip(self.color, self.Type.queen)
+
+for _color in Chip.Color:
+    for _type in Chip.Type:
+        _chip = object.__new__(Chip)
+        object.__setattr__(_chip, 'color', _color)
+        object.__setattr__(_chip, 'type', _type)
+        Chip._instances[_color, _type] = _chip
 
 
 class Model:
@@ -33,10 +66,34 @@ class Model:
         blackWon = 2
         tie = 3
 
+    # Everything make_move() changed, in the order unmake_move() needs it.
+    # removed holds (Coordinate, Chip) pairs in the order they were jumped.
+    MoveRecord = namedtuple('MoveRecord', ['origin', 'destination',
+                                           'removed', 'promoted',
+                                           'current_chip', 'position',
+                                           'key', 'legal', 'legal_jumps',
+                                           'no_progress', 'repetitions'])
+
+    # A whole turn: squares holds the origin and every landing square of
+    # the chip, captured the squares of the chips it jumped, in order.
+    Turn = namedtuple('Turn', ['squares', 'captured'])
+
     def new_game(self):
-        self.__init__()
+        self.__init__(self.repetition_limit, self.no_progress_limit)
     
-    def __init__(self):
+    def __init__(self, repetition_limit=3, no_progress_limit=50):
+        """Start a game from the usual position
+
+        Args:
+            repetition_limit (int): the game is a tie when the same position
+                occurs this many times; None to never stop for repetitions
+            no_progress_limit (int): the game is a tie after this many turns
+                in a row without a capture or a soldier move; None to never
+                stop for it
+
+        """
+        self.repetition_limit = repetition_limit
+        self.no_progress_limit = no_progress_limit
         self.board = Gameboard()
         self.chips = {Coordinate.a1: Chip(Chip.Color.white),
                       Coordinate.c1: Chip(Chip.Color.white),
@@ -66,132 +123,81 @@ class Model:
             self.board.set_content(k,self.chips[k])
         self.turn = Chip.Color.white
         self._current_chip = None
+        self._position = self._position_from_chips()
+        self.key = zobrist.position_key(self._position)
+        # legal moves of the current position, generated on first use
+        self._legal = None
+        self._legal_jumps = False
+        self._reset_history()
+
+    def _reset_history(self):
+        # times each position key occurred at the start of a turn, and turns
+        # played since the last capture or soldier move
+        self._repetitions = {self.key: 1}
+        self.no_progress = 0
+
+    def set_position(self, chips, turn, current_chip=None):
+        """Replace the gamestate with an arbitrary position
 
-    def _neighbor_in_direction(self, square, direction):
-        neighborSquare = self.board.neighbor_in_direction(square, direction)
-        return neighborSquare
-
-    def _next_neighbor_in_direction(self, square, direction):
-        neighbor_square = self.board.neighbor_in_direction(square, direction)
-        if neighbor_square is not None: # check the next
-            new_neighbor = \
-                self.board.neighbor_in_direction(neighbor_square, direction)
-            if new_neighbor is not None:
-                return new_neighbor
-        return None
-
-    def _enemy_in_neighbor(self, square, direction):
-        neighbor = self._neighbor_in_direction(square, direction)
-        return neighbor is not None and \
-               self.board.get_content(neighbor) is not None and \
-               self.board.get_content(neighbor).color != self.turn
-
-    def _directions_for_soldier(self):
-        white_directions = [Direction.top_left, Direction.top_right]
-        black_directions = [Direction.btm_left, Direction.btm_right]
-        return white_directions \
-               if self.turn == Chip.Color.white \
-               else black_directions
-
-    def _soldier_available_jumps(self, square):
-        jumps = set()
-        for direction in self._directions_for_soldier():
-            if self._enemy_in_neighbor(square, direction):
-                next_neighbor = \
-                    self._next_neighbor_in_direction(square, direction)
-                if next_neighbor is not None and \
-                        self.board.get_content(next_neighbor) is None:
-                    jumps.add((square, next_neighbor))
-        return jumps
-
-    def _soldier_available_regular_moves(self, square):
-        moves = set()
-        for direction in self._directions_for_soldier():
-            neighbor = self._neighbor_in_direction(square, direction)
-            if neighbor is not None and \
-                    self.board.get_content(neighbor) is None: 
-                # empty square, valid move
-                moves.add((square, neighbor))
-        return moves
-
-    def _soldier_can_jump(self, square):
-        return bool(self._soldier_available_jumps(square))
-
-    def _soldier_chip_available_moves(self, square):
-        moves = self._soldier_available_jumps(square)
-        if len(moves) > 0:
-            return moves, True
-
-        return self._soldier_available_regular_moves(square), False
-
-    def _queen_rival_found_moves(self, 
-                                 origin, 
-                                 square, 
-                                 direction, 
-                                 moves, 
-                                 can_jump):
-        my_moves = moves
-        neighbor = self._neighbor_in_direction(square, direction)
-        if neighbor is not None:
-            content = self.board.get_content(neighbor)
-            if content is None and can_jump: 
-                # another empty square after a jump
-                my_moves.add((origin, neighbor))
-                return my_moves, True
-            elif content is None and not can_jump:
-                # just found out queen can jump
-                my_moves = set([(origin, neighbor)])
-                return my_moves, True
-        return moves, can_jump # two chips in a row or out of bounds
-
-    def _queen_moves_in_direction(self, square, direction):
-        moves, can_jump = set(), False
-        neighbor = self._neighbor_in_direction(square, direction)
-        while neighbor is not None: 
-            content = self.board.get_content(neighbor)
-            if content is None: # empty
-                moves.add((square, neighbor))
-            elif content.color != self. turn: # rival
-                # rival chip found
-                old_moves = moves
-                moves, can_jump = self._queen_rival_found_moves(square, 
-                                                                neighbor, 
-                                                                direction, 
-                                                                moves, 
-                                                                can_jump)
-                neighbor = self._neighbor_in_direction(neighbor, direction)
-                if moves == old_moves:
-                    break # two chips in a row or out of bounds
-            else:
-                break # ally chip found
-            neighbor = self._neighbor_in_direction(neighbor, direction)
-        return moves, can_jump
-
-    def _queen_can_jump(self, square):
-        moves, can_jump = self._queen_chip_available_moves(square)
-        return can_jump
-
-    def _queen_chip_available_moves(self, square):
-        directions = [Direction.top_left, Direction.top_right,
-                      Direction.btm_left, Direction.btm_right]
-        moves, can_jump = set(), False
-
-        for d in directions:
-            new_moves, new_can_jump = self._queen_moves_in_direction(square, d)
-            if can_jump == new_can_jump: 
-                moves = moves | new_moves
-            elif not can_jump and new_can_jump: 
-                moves = new_moves
-                can_jump = True
-        return moves, can_jump
-
-    def _chip_can_jump(self, square):
-        if square in self.chips:
-            if self.chips[square].type == Chip.Type.soldier:
-                return self._soldier_can_jump(square)
+        Args:
+            chips (dict): Coordinate keys and Chip values
+            turn (Chip.Color): the side to move
+            current_chip (Coordinate): the chip that must keep jumping, if
+                it is in the middle of a multi-jump
+        Raises:
+            TypeError: if a key is not Coordinate or a value is not Chip
+            ValueError: if a chip is on a light square
+
+        """
+        for square, chip in chips.items():
+            if not isinstance(square, Coordinate):
+                raise TypeError("chips keys must be from Coordinate enum")
+            if not isinstance(chip, Chip):
+                raise TypeError("chips values must be Chip instances")
+            if BITS[square] is None:
+                raise ValueError("{} is not a playable square".format(
+                    square.name))
+        self.board = Gameboard()
+        self.chips = dict(chips)
+        for k in self.chips.keys():
+            self.board.set_content(k,self.chips[k])
+        self.turn = turn
+        self._current_chip = current_chip
+        self._position = self._position_from_chips()
+        self.key = zobrist.position_key(
+            self._position,
+            BITS[current_chip] if current_chip is not None else None)
+        self._legal = None
+        self._legal_jumps = False
+        self._reset_history()
+
+    def _position_from_chips(self):
+        position = Position(white_to_move=self.turn.value)
+        for coord, chip in self.chips.items():
+            mask = 1 << BITS[coord]
+            if chip.color == Chip.Color.white:
+                position.white |= mask
             else:
-                return self._queen_can_jump(square)
-        return False
+                position.black |= mask
+            if chip.type == Chip.Type.queen:
+                position.queens |= mask
+        return position
+
+    def _origins(self):
+        # mask of the chips that may move
+        if self._current_chip is not None:
+            return 1 << BITS[self._current_chip]
+        return FULL
+
+    def _legal_moves(self):
+        legal = self._legal
+        if legal is None:
+            # _origins() written out, this runs for every position
+            current = self._current_chip
+            legal, self._legal_jumps = self._position.coordinate_moves(
+                FULL if current is None else 1 << BITS[current])
+            self._legal = legal
+        return legal
 
     def chip_available_moves(self, square):
         """Return a tuple (set[available_moves], bool can_jump)
@@ -213,9 +219,9 @@ class Model:
         chip = self.chips[square]
         if chip.color != self.turn:
             return set(), False
-        if chip.type == Chip.Type.soldier:
-            return self._soldier_chip_available_moves(square)
-        return self._queen_chip_available_moves(square)
+        destinations, can_jump = self._position.chip_moves(BITS[square])
+        return set((square, SQUARES[b]) for b in bits_of(destinations)), \
+               can_jump
 
     def available_moves(self):
         """Return a set with tuples of Coordinate values of all available moves
@@ -225,69 +231,114 @@ class Model:
             have the form (Coordinate.origin, Coordinate.destination)
 
         """
-        moves = set()
-        if self._current_chip is not None:
-            moves, can_jump =  self.chip_available_moves(self._current_chip)
-            return moves
-        can_jump = False
-        for coord, chip in self.chips.items(): 
-            newMoves, newcan_jump = self.chip_available_moves(coord)
-            if can_jump == newcan_jump: 
-                moves = moves | newMoves
-            elif not can_jump and newcan_jump: # found a jump, delete old moves
-                moves = newMoves
-                can_jump = True
-            # else found regular move, but jump found previously
-        return moves
+        legal = self._legal
+        return set(legal if legal is not None else self._legal_moves())
+
+    def iter_moves(self):
+        """Yield the moves of available_moves() one at a time
+
+        Jumps are still forced. Moves are generated as they are asked for,
+        so a caller that stops early does not pay for the rest. The game
+        must not change while the moves are being yielded.
+
+        Yields:
+            tuple: (Coordinate.origin, Coordinate.destination)
+
+        """
+        if self._legal is not None:
+            yield from self._legal
+            return
+        for move in self._position.iter_moves(self._origins()):
+            yield COORDINATE_MOVES[move]
+
+    def has_any_move(self):
+        """Return True if the side to move has a legal move"""
+        if self._legal is not None:
+            return bool(self._legal)
+        return self._position.has_move(self._origins())
+
+    def count_moves(self):
+        """Return the number of moves in available_moves()"""
+        if self._legal is not None:
+            return len(self._legal)
+        return self._position.count_moves(self._origins())
+
+    def is_legal(self, origin, destination):
+        """Return True if (origin, destination) is in available_moves()
+
+        Args:
+            origin (Coordinate): the square where the chip is currently
+            destination (Coordinate): the square where the chip would end
+        Raises:
+            TypeError: if origin or destination is not Coordinate
+
+        """
+        if not isinstance(origin, Coordinate):
+            raise TypeError("origin variable must be from Coordinate enum")
+        if not isinstance(destination, Coordinate):
+            raise TypeError("destination must be from Coordinate enum")
+        if self._legal is not None:
+            return (origin, destination) in self._legal
+        o, d = BITS[origin], BITS[destination]
+        if o is None or d is None:
+            return False
+        return self._position.is_legal(o, d, self._origins())
+
+    def available_turns(self):
+        """Return a list with every legal turn as a Model.Turn
+
+        A multi-jump is a single turn listing all of its landing squares.
+        In the middle of a multi-jump, only the rest of the turn of the chip
+        that is jumping is returned.
+
+        Returns:
+            list: Model.Turn tuples of Coordinate values
+
+        """
+        return [self.Turn(tuple(SQUARES[b] for b in path),
+                          tuple(SQUARES[b] for b in captured))
+                for path, captured in self._position.turns(self._origins())]
 
     def _promote(self, square):
-        startIndex = 0 if self.turn == Chip.Color.white else 7
-        promo_squares = []
-        for i in range(startIndex, 64, 8):
-            promo_squares.append(Coordinate(i))
-        if square in promo_squares:
-            self.chips[square].promote()
+        if self._position.promote(BITS[square]):
+            queen = self.chips[square].promote()
+            self.chips[square] = queen
+            self.board.set_content(square, queen)
+            return True
+        return False
 
     def _next_turn(self):
         self.turn = Chip.Color.black \
                     if self.turn == Chip.Color.white \
                     else Chip.Color.white
+        self._position.next_turn()
 
     def _gamestate(self):
-        if len(self.available_moves()) == 0:
+        if not self.has_any_move():
             return self.Gamestate.whiteWon \
                    if self.turn == Chip.Color.black \
                    else self.Gamestate.blackWon
+        if self._is_draw():
+            return self.Gamestate.tie
         return self.Gamestate.inProgress
 
+    def _is_draw(self):
+        """Return True if a draw limit was reached at the start of a turn"""
+        if self._current_chip is not None:
+            return False
+        return (self.repetition_limit is not None and
+                self._repetitions[self.key] >= self.repetition_limit) or \
+               (self.no_progress_limit is not None and
+                self.no_progress >= self.no_progress_limit)
+
     def _remove_chips(self, origin, destination):
         removed = []
-        direction = self._direction_of_move(origin, destination)
-        squares_jumped = self.board.path_in_direction(origin, 
-                                                      destination, 
-                                                      direction)
-        for s in squares_jumped:
-            if self.board.get_content(s) != None:
-                self.board.clear_square(s)
-                del self.chips[s]
-                removed.append(s)
+        for b in self._position.move_chip(BITS[origin], BITS[destination]):
+            s = SQUARES[b]
+            removed.append((s, self.chips.pop(s)))
+            self.board.clear_square(s)
         return removed
 
-    def _direction_of_move(self, origin, destination):
-        distance = destination - origin
-        direction = None
-        if distance < 0: # moved left
-            if distance % 7 == 0: # moved top
-                direction = Direction.top_left
-            else: # distance % 9 == 0, moved btm
-                direction = Direction.btm_left
-        else: # moved right
-            if distance % 9 == 0:
-                direction = Direction.top_right
-            else:
-                direction = Direction.btm_right
-        return direction
-
     def move(self, origin, destination):
         """Perform the requested move and returns a tuple (Gamestate, list)
 
@@ -295,7 +346,8 @@ class Model:
             origin (Coordinate): the square where the chip is currently
             destination (Direction): the square where the chip will end
         Returns:
-            Gamestate: value from enum 
+            Gamestate: value from enum; invalidMove if the move is not legal
+            or the game is already a tie
             list: Coordinate values indicating the chip(s) removed
         Raises:
             TypeError: if origin or destination is not Coordinate
@@ -305,29 +357,151 @@ class Model:
             raise TypeError("origin variable must be from Coordinate enum")
         if not isinstance(destination, Coordinate):
             raise TypeError("destination must be from Coordinate enum")
-        if not (origin, destination) in self.available_moves():
+        if self._is_draw() or not self.is_legal(origin, destination):
             return self.Gamestate.invalidMove, []
-        turnFinished = True
-        _, jumped = self.chip_available_moves(origin)
-        # move chip
+        record = self.make_move(origin, destination)
+        return (self._gamestate(), [s for s, chip in record.removed])
+
+    def play_sequence(self, squares):
+        """Play a whole turn and return a tuple (Gamestate, list)
+
+        Args:
+            squares (iterable): Coordinate values of the origin and of every
+                landing square, as in Model.Turn.squares
+        Returns:
+            Gamestate: value from enum; invalidMove if squares is not a
+            complete legal turn or the game is a tie, in which case the game
+            is left unchanged
+            list: Coordinate values indicating the chip(s) removed
+
+        """
+        squares = list(squares)
+        if self._is_draw():
+            return self.Gamestate.invalidMove, []
+        records = []
+        turn = self.turn
+        for origin, destination in zip(squares, squares[1:]):
+            if self.turn != turn or not self.is_legal(origin, destination):
+                break
+            records.append(self.make_move(origin, destination))
+        else:
+            if records and self.turn != turn:
+                return (self._gamestate(),
+                        [s for r in records for s, chip in r.removed])
+        for record in reversed(records):
+            self.unmake_move(record)
+        return self.Gamestate.invalidMove, []
+
+    def make_move(self, origin, destination):
+        """Perform the requested move and return a MoveRecord to undo it
+
+        Unlike move(), the game state is not checked after the move. Pass the
+        record to unmake_move() to restore the previous position; records
+        must be undone in the reverse order they were made.
+
+        Args:
+            origin (Coordinate): the square where the chip is currently
+            destination (Coordinate): the square where the chip will end
+        Returns:
+            MoveRecord: what changed, for unmake_move()
+        Raises:
+            ValueError: if the move is not in available_moves()
+
+        """
+        if not self.is_legal(origin, destination):
+            raise ValueError("{} to {} is not a legal move".format(
+                origin.name, destination.name))
+        position = self._position
+        previous = (position.white, position.black,
+                    position.queens, position.white_to_move)
+        legal, legal_jumps = self._legal, self._legal_jumps
+        current_chip = self._current_chip
+        previous_key = self.key
+        no_progress = self.no_progress
+        repetitions = None
+        promoted = False
+        # update the key while the chips are still in place
+        o, d = BITS[origin], BITS[destination]
+        piece = zobrist.piece_on(position, o)
+        key = self.key ^ zobrist.PIECES[piece][o] ^ zobrist.PIECES[piece][d]
+        if current_chip is not None:
+            key ^= zobrist.CURRENT_CHIP[BITS[current_chip]]
+        # move chip, removing the chips jumped over
+        removed = self._remove_chips(origin, destination)
+        if removed:
+            rival = zobrist.BLACK_SOLDIER if position.white_to_move \
+                    else zobrist.WHITE_SOLDIER
+            for square, chip in removed:
+                b = BITS[square]
+                key ^= zobrist.PIECES[rival + (previous[2] >> b & 1)][b]
         self.board.move(origin, destination)
-        self.chips[destination] = self.chips[origin]
-        del self.chips[origin]
-        self._promote(destination)
-        # remove chips if jump occured
-        distance = destination - origin
-        removed = []
-        if jumped:
-            removed = self._remove_chips(origin, destination)
-            if self._chip_can_jump(destination):
-                turnFinished = False
-                self._current_chip = destination
+        self.chips[destination] = self.chips.pop(origin)
+        self._legal = None
+        turnFinished = True
+        if removed and position.chip_moves(d)[1]:
+            # only the chip that just jumped may keep moving
+            self._current_chip = destination
+            turnFinished = False
+            key ^= zobrist.CURRENT_CHIP[d]
 
         if turnFinished:
+            # chips are crowned once their turn is over
+            promoted = self._promote(destination)
+            if promoted:
+                key ^= zobrist.PIECES[piece][d] ^ zobrist.PIECES[piece + 1][d]
             self._next_turn()
             self._current_chip = None
-            self._promote(destination)
-        return (self._gamestate(), removed)
+            key ^= zobrist.WHITE_TO_MOVE
+            # jumps always capture, so a turn makes progress if its last
+            # hop does
+            if removed or piece in (zobrist.WHITE_SOLDIER,
+                                    zobrist.BLACK_SOLDIER):
+                self.no_progress = 0
+                # no position from before the turn can occur again
+                repetitions = self._repetitions
+                self._repetitions = {key: 1}
+            else:
+                self.no_progress += 1
+                self._repetitions[key] = self._repetitions.get(key, 0) + 1
+        self.key = key
+        return self.MoveRecord(origin, destination, removed, promoted,
+                               current_chip, previous, previous_key,
+                               legal, legal_jumps, no_progress, repetitions)
+
+    def unmake_move(self, record):
+        """Restore the position as it was before make_move() returned record
+
+        Args:
+            record (MoveRecord): value returned by make_move()
+
+        """
+        position = self._position
+        if record.repetitions is not None:
+            self._repetitions = record.repetitions
+        elif position.white_to_move != record.position[3]:
+            # the move ended a turn
+            count = self._repetitions[self.key] - 1
+            if count:
+                self._repetitions[self.key] = count
+            else:
+                del self._repetitions[self.key]
+        self.no_progress = record.no_progress
+        position.white, position.black, \
+            position.queens, position.white_to_move = record.position
+        self.turn = Chip.Color(position.white_to_move)
+        self._current_chip = record.current_chip
+        self.key = record.key
+        self._legal, self._legal_jumps = record.legal, record.legal_jumps
+        chip = self.chips.pop(record.destination)
+        if record.promoted:
+            chip = Chip(chip.color)
+        self.chips[record.origin] = chip
+        self.board.move(record.destination, record.origin)
+        if record.promoted:
+            self.board.set_content(record.origin, chip)
+        for square, removed_chip in record.removed:
+            self.chips[square] = removed_chip
+            self.board.set_content(square, removed_chip)
 
     def square_contains_teammate(self, square):
         """Returns True if the chip belongs to the team whose turn it is
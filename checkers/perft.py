@@ -0,0 +1,164 @@
+# Copyright (c) 2015 Gamda Software, LLC
+#
+# See the file LICENSE.txt for copying permission.
+
+import argparse
+import json
+import sys
+import time
+from gameboard.coordinate import Coordinate
+from .model import Model, Chip
+
+# Stored test positions: (name, white chips, black chips, side to move,
+# chip that must keep jumping, leaf counts for depth 1, 2, 3...).
+# Queens are written in upper case. Each depth is one hop, that is, one
+# call to Model.move(), so the hops of a multi-jump are counted separately.
+POSITIONS = [
+    ('start',
+     'a1 a3 b2 c1 c3 d2 e1 e3 f2 g1 g3 h2',
+     'a7 b6 b8 c7 d6 d8 e7 f6 f8 g7 h6 h8', 'white', None,
+     (7, 49, 302, 1469, 7361, 36768, 179255, 838248)),
+    ('opening',
+     'a1 a3 b2 c1 c3 d2 d4 e1 f4 g1 h2',
+     'a7 b6 b8 c7 d8 e7 f6 f8 g7 h6 h8', 'black', None,
+     (7, 43, 213, 1234, 5717, 30222, 145593, 764120)),
+    ('middlegame',
+     'a1 a3 b2 c1 d2 e1 g1',
+     'a7 b8 c7 d4 d8 f4 f6 f8 h8', 'white', None,
+     (7, 67, 320, 2307, 11558, 81840, 411832, 2645305)),
+    ('queens',
+     'a3 F8',
+     'E1 h4 H6 h8', 'white', None,
+     (6, 49, 389, 3887, 26448, 272731, 1857650, 19491747)),
+    ('multi-jump',
+     'a5 d4 g1 h2 h4',
+     'a7 C1 c5 c7 f6 f8 g7 h8', 'white', 'd4',
+     (1, 1, 12, 31, 171, 874, 5630, 32815)),
+]
+
+
+def perft(model, depth):
+    """Return the number of different sequences of depth hops from model
+
+    The model is left as it was passed in.
+
+    Args:
+        model (Model): the starting position
+        depth (int): number of hops to play
+    Returns:
+        int: number of leaf nodes
+
+    """
+    moves = model._legal_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in tuple(moves):
+        record = model.make_move(*move)
+        nodes += perft(model, depth - 1)
+        model.unmake_move(record)
+    return nodes
+
+
+def load_position(white, black, turn, current_chip=None):
+    """Return a Model with the position written as in POSITIONS
+
+    Args:
+        white (str): squares of the white chips, queens in upper case
+        black (str): squares of the black chips, queens in upper case
+        turn (str): 'white' or 'black'
+        current_chip (str): square of the chip that must keep jumping
+    Returns:
+        Model: the position
+
+    """
+    chips = {}
+    for color, squares in ((Chip.Color.white, white),
+                           (Chip.Color.black, black)):
+        for name in squares.split():
+            chip = Chip(color)
+            if name[0].isupper():
+                chip = chip.promote()
+            chips[Coordinate[name.lower()]] = chip
+    model = Model()
+    model.set_position(chips, Chip.Color[turn],
+                       Coordinate[current_chip] if current_chip else None)
+    return model
+
+
+def run(depth, positions=POSITIONS):
+    """Run perft on every position and return a list of result dicts
+
+    Each dict has the keys name, depth, nodes, expected (None if no count
+    is stored for depth), seconds and nps.
+
+    """
+    results = []
+    for name, white, black, turn, current_chip, counts in positions:
+        model = load_position(white, black, turn, current_chip)
+        start = time.perf_counter()
+        nodes = perft(model, depth)
+        seconds = time.perf_counter() - start
+        results.append({'name': name,
+                        'depth': depth,
+                        'nodes': nodes,
+                        'expected': counts[depth - 1]
+                                    if depth <= len(counts) else None,
+                        'seconds': seconds,
+                        'nps': nodes / seconds if seconds > 0 else 0.0})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m checkers.perft',
+        description='Count move sequences from stored positions and time '
+                    'move generation.')
+    parser.add_argument('--depth', type=int, default=5,
+                        help='hops to play from each position (default 5)')
+    parser.add_argument('--position', action='append',
+                        help='only run the named position; may be repeated')
+    parser.add_argument('--save', metavar='FILE',
+                        help='write nodes per second to FILE as JSON')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='fail if nodes per second dropped compared to '
+                             'the results saved in FILE')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='allowed slowdown for --compare (default 0.10)')
+    args = parser.parse_args(argv)
+
+    positions = [p for p in POSITIONS
+                 if args.position is None or p[0] in args.position]
+    results = run(args.depth, positions)
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    failed = False
+    for r in results:
+        if r['expected'] is None:
+            status = 'no reference'
+        elif r['nodes'] == r['expected']:
+            status = 'ok'
+        else:
+            status = 'WRONG, expected {}'.format(r['expected'])
+            failed = True
+        saved = baseline.get(r['name'], {}).get(str(r['depth']))
+        if saved is not None and r['nps'] < saved * (1 - args.tolerance):
+            status += ', SLOWER than {:.0f} nodes/s'.format(saved)
+            failed = True
+        print('{:<12} depth {:>2} {:>12} nodes {:8.3f}s {:>10.0f} nodes/s  '
+              '{}'.format(r['name'], r['depth'], r['nodes'], r['seconds'],
+                          r['nps'], status))
+
+    if args.save:
+        for r in results:
+            baseline.setdefault(r['name'], {})[str(r['depth'])] = r['nps']
+        with open(args.save, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
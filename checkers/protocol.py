@@ -0,0 +1,314 @@
+# Copyright (c) 2015 Gamda Software, LLC
+#
+# See the file LICENSE.txt for copying permission.
+
+import argparse
+import sys
+import threading
+import time
+from gameboard.coordinate import Coordinate
+from .model import Model, Chip
+from .engine import Engine
+from .transposition import TranspositionTable
+from .book import Book
+from .tablebase import Tablebase
+
+# Commands are read one per line and words are separated by spaces. Squares
+# are Coordinate names and moves are given as origin and destination pairs,
+# one pair per hop:
+#
+#   hello                       -> hello checkers
+#   isready                     -> readyok, even while searching
+#   new                         forget the game and the search results
+#   position start [moves c3 d4 f6 e5 ...]
+#   position white c3,e3 black f6 [queens e3] turn white|black
+#            [current e3] [moves ...]
+#                               lists are comma separated, '-' when empty
+#   go [time S] [depth N] [nodes N] [infinite] [ponder]
+#                               -> info depth D score S nodes N time T
+#                               -> bestmove c3 d4 [d4 f6 ...] | bestmove none
+#                               -> info string <reason>, then bestmove none,
+#                                  if the search fails
+#   stop                        end the search now and send its bestmove
+#   ponderhit                   the pondered move was played: search on for
+#                               the time given to go ponder
+#   quit
+#
+# Lines that can not be understood are answered with 'error <reason>'.
+
+# Depth of searches without a depth limit
+UNLIMITED_DEPTH = 64
+
+
+class CommandError(Exception):
+    """A command that can not be carried out; the message is sent back"""
+
+
+def _squares(word):
+    if word == '-':
+        return []
+    try:
+        return [Coordinate[name] for name in word.split(',')]
+    except KeyError:
+        raise CommandError("bad square list {!r}".format(word))
+
+
+def _hops(words):
+    if len(words) % 2:
+        raise CommandError("moves must be origin and destination pairs")
+    try:
+        squares = [Coordinate[word] for word in words]
+    except KeyError as e:
+        raise CommandError("unknown square {}".format(e))
+    return list(zip(squares[::2], squares[1::2]))
+
+
+class EngineSession:
+    """Serves the commands of one tournament manager
+
+    One Model holds the game. go starts an Engine search of it on a
+    background thread, so commands keep being read while it runs and stop
+    is answered as soon as the engine sees it, within a few hundred nodes.
+
+    Args:
+        output (file): text file the replies are written to
+        engine (Engine): the engine to search with, a new one by default
+        default_time (float): seconds per search when go gives no limit
+
+    """
+
+    def __init__(self, output, engine=None, default_time=1.0):
+        self.output = output
+        self.engine = engine if engine is not None else Engine()
+        self.default_time = default_time
+        self.model = Model()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._release = None  # set when the bestmove may be sent
+        self._timer = None
+        self._ponder_time = None
+        self._commands = {'hello': self._hello,
+                          'isready': self._isready,
+                          'new': self._new,
+                          'position': self._position,
+                          'go': self._go,
+                          'stop': self._stop,
+                          'ponderhit': self._ponderhit}
+
+    def send(self, line):
+        with self._write_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def run(self, input):
+        """Serve commands read from input until quit or end of file"""
+        for line in input:
+            if not self.handle(line):
+                break
+        self._stop_search()
+
+    def handle(self, line):
+        """Carry out one command line
+
+        Returns:
+            bool: False after quit, True otherwise
+
+        """
+        words = line.split()
+        if not words:
+            return True
+        if words[0] == 'quit':
+            self._stop_search()
+            return False
+        command = self._commands.get(words[0])
+        try:
+            if command is None:
+                raise CommandError("unknown command {!r}".format(words[0]))
+            command(words[1:])
+        except CommandError as e:
+            self.send('error {}'.format(e))
+        return True
+
+    def searching(self):
+        """Return True while a search runs or waits to send its bestmove"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def wait(self, timeout=None):
+        """Wait for the running search, if any, to send its bestmove"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _stop_search(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._thread is None:
+            return
+        self._release.set()
+        # the engine clears its stop flag when a search starts, so ask
+        # again until the thread is done
+        while self._thread.is_alive():
+            self.engine.stop()
+            self._thread.join(0.01)
+        self._thread = None
+
+    def _hello(self, words):
+        self.send('hello checkers')
+
+    def _isready(self, words):
+        self.send('readyok')
+
+    def _new(self, words):
+        self._stop_search()
+        self.model = Model()
+        self.engine.table.clear()
+
+    def _position(self, words):
+        self._stop_search()
+        fields = {}
+        key = None
+        for word in words:
+            if key == 'moves':
+                fields[key].append(word)
+            elif key is not None:
+                fields[key] = word
+                key = None
+            elif word == 'start':
+                fields[word] = True
+            elif word == 'moves':
+                fields[word] = []
+                key = word
+            elif word in ('white', 'black', 'queens', 'turn', 'current'):
+                key = word
+            else:
+                raise CommandError("unexpected {!r}".format(word))
+        if key is not None and key != 'moves':
+            raise CommandError("{} needs a value".format(key))
+        if 'start' in fields:
+            model = Model()
+        else:
+            model = self._set_up(fields)
+        for origin, destination in _hops(fields.get('moves', [])):
+            state, removed = model.move(origin, destination)
+            if state == Model.Gamestate.invalidMove:
+                raise CommandError("{} {} is not a legal move".format(
+                    origin.name, destination.name))
+        self.model = model
+
+    def _set_up(self, fields):
+        try:
+            turn = Chip.Color[fields.get('turn', 'white')]
+        except KeyError:
+            raise CommandError("turn must be white or black")
+        queens = set(_squares(fields.get('queens', '-')))
+        chips = {}
+        for color in Chip.Color:
+            for square in _squares(fields.get(color.name, '-')):
+                chip = Chip(color)
+                chips[square] = chip.promote() if square in queens else chip
+        current = fields.get('current')
+        if current is not None:
+            current = _squares(current)
+            if len(current) != 1 or current[0] not in chips or \
+                    chips[current[0]].color != turn:
+                raise CommandError("current must be a chip of the side to "
+                                   "move")
+            current = current[0]
+        model = Model()
+        try:
+            model.set_position(chips, turn, current)
+        except (TypeError, ValueError) as e:
+            raise CommandError(str(e))
+        return model
+
+    def _go(self, words):
+        self._stop_search()
+        limits = {'time': None, 'depth': None, 'nodes': None}
+        infinite = ponder = False
+        words = iter(words)
+        for word in words:
+            if word == 'infinite':
+                infinite = True
+            elif word == 'ponder':
+                ponder = True
+            elif word in limits:
+                try:
+                    limits[word] = (float if word == 'time' else int)(
+                        next(words))
+                except (StopIteration, ValueError):
+                    raise CommandError("{} needs a number".format(word))
+            else:
+                raise CommandError("unexpected {!r}".format(word))
+        if not infinite and \
+                all(limit is None for limit in limits.values()):
+            limits['time'] = self.default_time
+        engine = self.engine
+        # the engine always finishes depth 1, as with time 0 or nodes 0
+        engine.max_depth = UNLIMITED_DEPTH if limits['depth'] is None \
+                           else max(limits['depth'], 1)
+        engine.max_nodes = limits['nodes']
+        # a ponder search has no time limit until ponderhit
+        engine.max_time = None if infinite or ponder else limits['time']
+        self._ponder_time = limits['time'] if ponder else None
+        self._release = threading.Event()
+        if not ponder:
+            self._release.set()
+        self._thread = threading.Thread(target=self._search,
+                                        args=(self._release,), daemon=True)
+        self._thread.start()
+
+    def _search(self, release):
+        start = time.perf_counter()
+        try:
+            result = self.engine.search(self.model)
+        except Exception as e:
+            # the manager waits for a bestmove whatever happens
+            self.send('info string search failed: {!r}'.format(e))
+            result = None
+        # a finished ponder search keeps its move until ponderhit or stop
+        release.wait()
+        if result is None:
+            self.send('bestmove none')
+            return
+        self.send('info depth {} score {} nodes {} time {:.3f}'.format(
+            result.depth, result.score, result.nodes,
+            time.perf_counter() - start))
+        self.send('bestmove {}'.format(' '.join(
+            '{} {}'.format(o.name, d.name) for o, d in result.moves)))
+
+    def _stop(self, words):
+        self._stop_search()
+
+    def _ponderhit(self, words):
+        if self._release is None or self._release.is_set():
+            raise CommandError("not pondering")
+        if self._ponder_time is not None:
+            self._timer = threading.Timer(self._ponder_time, self.engine.stop)
+            self._timer.daemon = True
+            self._timer.start()
+        self._release.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m checkers.protocol',
+        description='Run an engine that reads commands from standard input '
+                    'and writes its moves to standard output.')
+    parser.add_argument('--time', type=float, default=1.0,
+                        help='seconds per search when go gives no limit '
+                             '(default 1)')
+    parser.add_argument('--hash', type=int, default=8,
+                        help='transposition table size in MB (default 8)')
+    parser.add_argument('--book', help='opening book file')
+    parser.add_argument('--tablebase', help='endgame tablebase file')
+    args = parser.parse_args(argv)
+    book = Book(args.book) if args.book else None
+    tablebase = Tablebase(args.tablebase) if args.tablebase else None
+    engine = Engine(table=TranspositionTable(args.hash), book=book,
+                    tablebase=tablebase)
+    EngineSession(sys.stdout, engine, args.time).run(sys.stdin)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
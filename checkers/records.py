@@ -0,0 +1,155 @@
+# Copyright (c) 2015 Gamda Software, LLC
+#
+# See the file LICENSE.txt for copying permission.
+
+import struct
+from collections import namedtuple
+from gameboard.coordinate import Coordinate
+from .bitboard import SQUARES, BITS, bits_of
+from .model import Model, Chip
+
+# A position takes 13 bytes: the white, black and queens masks as
+# little-endian 32-bit integers, then a flags byte. Bit 7 of the flags is
+# set when white is to move, bits 0-5 hold 1 + the bit of the chip that
+# must keep jumping, or 0 if there is none.
+POSITION = struct.Struct('<IIIB')
+POSITION_SIZE = POSITION.size
+
+# A game record is the length of the rest of the record as an unsigned
+# 16-bit integer, the start position, the final Gamestate value as a signed
+# byte and one (origin, destination) byte pair per hop, where squares are
+# Coordinate values.
+_LENGTH = struct.Struct('<H')
+_RESULT = struct.Struct('<b')
+
+GameRecord = namedtuple('GameRecord', ['start', 'moves', 'result'])
+
+_COORDINATES = [None] * 64
+for _square in Coordinate:
+    _COORDINATES[_square] = _square
+
+
+def position_fields(model):
+    """Return (white, black, queens, white_to_move, current_chip bit)"""
+    p = model._position
+    current = model._current_chip
+    return (p.white, p.black, p.queens, p.white_to_move,
+            BITS[current] if current is not None else None)
+
+
+def pack_fields(white, black, queens, white_to_move, current_chip):
+    flags = 0x80 if white_to_move else 0
+    if current_chip is not None:
+        flags |= current_chip + 1
+    return POSITION.pack(white, black, queens, flags)
+
+
+def encode_position(model):
+    """Return the 13 bytes that describe the position of model"""
+    return pack_fields(*position_fields(model))
+
+
+def unpack_fields(raw):
+    """Turn a (white, black, queens, flags) tuple into position fields"""
+    white, black, queens, flags = raw
+    current = flags & 0x3F
+    return (white, black, queens, bool(flags & 0x80),
+            current - 1 if current else None)
+
+
+def decode_position(data, offset=0):
+    """Return the fields of the position stored in data at offset"""
+    return unpack_fields(POSITION.unpack_from(data, offset))
+
+
+def fields_to_model(fields, model=None):
+    """Load position fields into model, or into a new Model
+
+    Args:
+        fields (tuple): as returned by decode_position()
+        model (Model): the model to overwrite, if any
+    Returns:
+        Model: the model holding the position
+
+    """
+    white, black, queens, white_to_move, current = fields
+    chips = {}
+    for mask, color in ((white, Chip.Color.white), (black, Chip.Color.black)):
+        for b in bits_of(mask):
+            chip = Chip(color)
+            if queens >> b & 1:
+                chip = chip.promote()
+            chips[SQUARES[b]] = chip
+    if model is None:
+        model = Model()
+    model.set_position(chips, Chip.Color(white_to_move),
+                       SQUARES[current] if current is not None else None)
+    return model
+
+
+def write_positions(file, models):
+    """Write the position of every model to a binary file"""
+    for model in models:
+        file.write(encode_position(model))
+
+
+def read_positions(file, block=4096):
+    """Yield the fields of every position stored in a binary file
+
+    The file is read block positions at a time and unpacked without
+    building any Model.
+
+    """
+    while True:
+        data = file.read(POSITION_SIZE * block)
+        if not data:
+            return
+        if len(data) % POSITION_SIZE:
+            raise ValueError("file ends in the middle of a position")
+        for raw in POSITION.iter_unpack(data):
+            yield unpack_fields(raw)
+
+
+START = encode_position(Model())
+
+
+def write_game(file, moves, result, start=START):
+    """Append one game record to a binary file
+
+    Args:
+        file: binary file open for writing
+        moves (list): (origin, destination) Coordinate tuples, one per hop
+        result (Model.Gamestate): how the game ended
+        start (bytes): encoded start position, the usual one by default
+
+    """
+    body = bytearray(start)
+    body += _RESULT.pack(result.value)
+    for origin, destination in moves:
+        body.append(origin)
+        body.append(destination)
+    file.write(_LENGTH.pack(len(body)))
+    file.write(body)
+
+
+def read_games(file):
+    """Yield a GameRecord for every game stored in a binary file
+
+    start holds the fields of the start position, moves a list of
+    (origin, destination) Coordinate tuples and result a Model.Gamestate.
+
+    """
+    while True:
+        header = file.read(_LENGTH.size)
+        if not header:
+            return
+        size, = _LENGTH.unpack(header)
+        body = file.read(size)
+        if len(body) < size:
+            raise ValueError("file ends in the middle of a game")
+        start = decode_position(body)
+        result = Model.Gamestate(_RESULT.unpack_from(body, POSITION_SIZE)[0])
+        hops = body[POSITION_SIZE + 1:]
+        moves = [(_COORDINATES[hops[i]], _COORDINATES[hops[i + 1]])
+                 for i in range(0, len(hops), 2)]
+        yield GameRecord(start, moves, result)
@@ -0,0 +1,159 @@
+# Copyright (c) 2015 Gamda Software, LLC
+#
+# See the file LICENSE.txt for copying permission.
+
+import pygame
+
+# Colors of the board, chips and side panel
+THEME = {'background': (147, 75, 0),
+         'dark_square': (211, 154, 62),
+         'light_square': (234, 249, 217),
+         'highlight': (255, 215, 0),
+         'white_chip': (255, 0, 0),
+         'black_chip': (0, 0, 0),
+         'queen_center': (127, 127, 127),
+         'panel': (226, 132, 19),
+         'button': (246, 152, 39),
+         'text': (0, 0, 0)}
+
+# Sizes at the original square size of 65 pixels, scaled with the squares
+_SQUARE = 65
+_CHIP_RADIUS = 25
+_QUEEN_RADIUS = 15
+_HIGHLIGHT_BORDER = 4
+_FONT_SIZE = 36
+
+
+class Renderer:
+    """Builds the surfaces of the board once and blits them afterwards
+
+    Tiles, chips, text and the empty board are drawn once for the current
+    square size and kept until resize() changes it.
+
+    Args:
+        square_size (int): side of a square in pixels
+        theme (dict): colors by name, THEME by default
+
+    """
+
+    def __init__(self, square_size, theme=THEME):
+        self.theme = dict(theme)
+        self.square_size = None
+        self.resize(square_size)
+
+    def _scale(self, length):
+        return max(1, length * self.square_size // _SQUARE)
+
+    def resize(self, square_size):
+        """Rebuild the cache for a new square size; return True if it did"""
+        if square_size == self.square_size:
+            return False
+        self.square_size = square_size
+        self.font = pygame.font.SysFont(None, self._scale(_FONT_SIZE))
+        self._texts = {}
+        self._board = None
+        self._tiles = {}
+        size = (square_size, square_size)
+        for dark in (True, False):
+            color = self.theme['dark_square' if dark else 'light_square']
+            tile = pygame.Surface(size)
+            tile.fill(color)
+            self._tiles[dark, False] = tile
+            tile = pygame.Surface(size)
+            tile.fill(self.theme['highlight'])
+            border = self._scale(_HIGHLIGHT_BORDER)
+            tile.fill(color, tile.get_rect().inflate(-2 * border,
+                                                    -2 * border))
+            self._tiles[dark, True] = tile
+        self._chips = {}
+        center = (square_size // 2, square_size // 2)
+        for color in ('white', 'black'):
+            for kind in ('soldier', 'queen'):
+                sprite = pygame.Surface(size, pygame.SRCALPHA)
+                pygame.draw.circle(sprite, self.theme[color + '_chip'],
+                                   center, self._scale(_CHIP_RADIUS))
+                if kind == 'queen':
+                    pygame.draw.circle(sprite, self.theme['queen_center'],
+                                       center, self._scale(_QUEEN_RADIUS))
+                self._chips[color, kind] = sprite
+        if pygame.display.get_surface() is not None:
+            # blits are faster in the pixel format of the display
+            for key, tile in self._tiles.items():
+                self._tiles[key] = tile.convert()
+            for key, sprite in self._chips.items():
+                self._chips[key] = sprite.convert_alpha()
+        return True
+
+    def board(self, layout):
+        """Return the empty board, drawn again only when layout changes
+
+        Args:
+            layout (Layout): the geometry of the window
+        Returns:
+            pygame.Surface: the squares and notation over the background,
+            as large as the window
+
+        """
+        key = layout.size, layout.flipped
+        if self._board is None or self._board_key != key:
+            board = pygame.Surface(layout.size)
+            board.fill(self.theme['background'])
+            for coord, rect in layout.squares():
+                board.blit(self._tiles[layout.is_dark(coord), False], rect)
+            for text, position in layout.notation():
+                self.draw_text(board, text, 'background', **position)
+            if pygame.display.get_surface() is not None:
+                board = board.convert()
+            self._board = board
+            self._board_key = key
+        return self._board
+
+    def tile(self, dark, highlighted=False):
+        return self._tiles[dark, highlighted]
+
+    def chip(self, color, kind):
+        """Return the sprite of a chip
+
+        Args:
+            color: Chip.Color of the chip
+            kind: Chip.Type of the chip
+
+        """
+        return self._chips[color.name, kind.name]
+
+    def text(self, text, background):
+        """Return text rendered over the theme color named background"""
+        key = text, background
+        if key not in self._texts:
+            self._texts[key] = self.font.render(text, True,
+                                                self.theme['text'],
+                                                self.theme[background])
+        return self._texts[key]
+
+    def draw_square(self, surface, rect, dark, chip=None, highlighted=False):
+        """Blit a square and the chip on it, if any; return the rect drawn
+
+        Args:
+            surface (pygame.Surface): where to draw
+            rect (pygame.Rect): the square, square_size pixels wide
+            dark (bool): True for the squares chips stand on
+            chip (Chip): the chip on the square
+            highlighted (bool): draw the square with a highlighted border
+
+        """
+        surface.blit(self._tiles[dark, highlighted], rect)
+        if chip is not None:
+            surface.blit(self._chips[chip.color.name, chip.type.name], rect)
+        return rect
+
+    def draw_text(self, surface, text, background, **position):
+        """Blit text placed by pygame.Rect attributes, e.g. center=(x, y)
+
+        Returns:
+            pygame.Rect: the area drawn
+
+        """
+        rendered = self.text(text, background)
+        rect = rendered.get_rect(**position)
+        surface.blit(rendered, rect)
+        return rect
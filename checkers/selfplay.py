@@ -0,0 +1,228 @@
+# Copyright (c) 2015 Gamda Software, LLC
+#
+# See the file LICENSE.txt for copying permission.
+
+import argparse
+import json
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from gameboard.coordinate import Coordinate
+from .model import Model
+from .engine import Engine
+from .mcts import MCTS
+
+
+class RandomPlayer:
+    """Plays a random legal hop every time"""
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def play(self, model):
+        return [self.rng.choice(sorted(model.available_moves()))]
+
+
+class EnginePlayer:
+    """Plays the turn chosen by an Engine
+
+    Args:
+        rng (random.Random): unused. An engine limited by depth or nodes
+            plays the same turns on every run, but with a time limit its
+            turns depend on the speed and load of the machine
+        **options: passed to Engine
+
+    """
+
+    def __init__(self, rng, **options):
+        self.engine = Engine(**options)
+
+    def play(self, model):
+        return self.engine.search(model).moves
+
+
+class MCTSPlayer:
+    """Plays the turn chosen by an MCTS search in this process
+
+    Args:
+        rng (random.Random): seeds the playouts
+        **options: passed to MCTS
+
+    """
+
+    def __init__(self, rng, **options):
+        options.setdefault('max_playouts', 1000)
+        options.setdefault('max_time', None)
+        self.mcts = MCTS(seed=rng.getrandbits(64), **options)
+
+    def play(self, model):
+        return self.mcts.search(model).moves
+
+
+PLAYERS = {'random': RandomPlayer, 'engine': EnginePlayer,
+           'mcts': MCTSPlayer}
+# short names accepted in player specs, and the option they set
+ENGINE_OPTIONS = {'depth': ('max_depth', int),
+                  'nodes': ('max_nodes', int),
+                  'time': ('max_time', float)}
+MCTS_OPTIONS = {'playouts': ('max_playouts', int),
+                'time': ('max_time', float)}
+PLAYER_OPTIONS = {'random': {}, 'engine': ENGINE_OPTIONS,
+                  'mcts': MCTS_OPTIONS}
+
+
+def make_player(spec, rng):
+    """Return a player from a spec such as 'random' or 'engine:depth=4'
+
+    Engine specs take comma separated depth, nodes and time options, MCTS
+    specs playouts and time. Players with a time option do not play the
+    same games from the same seed.
+
+    Raises:
+        ValueError: if the spec does not name a known player or option
+
+    """
+    name, _, options = spec.partition(':')
+    if name not in PLAYERS:
+        raise ValueError("unknown player '{}'".format(name))
+    kwargs = {}
+    for option in filter(None, options.split(',')):
+        key, _, value = option.partition('=')
+        if key not in PLAYER_OPTIONS[name]:
+            raise ValueError("unknown option '{}' for {}".format(key, name))
+        argument, kind = PLAYER_OPTIONS[name][key]
+        kwargs[argument] = kind(value)
+    return PLAYERS[name](rng, **kwargs)
+
+
+def game_seed(seed, game):
+    """Return the seed of game number game in a run started with seed"""
+    return '{}:{}'.format(seed, game)
+
+
+def play_game(white, black, seed, max_turns=400, opening=()):
+    """Play one game and return its record as a dict
+
+    Args:
+        white (str): player spec for white
+        black (str): player spec for black
+        seed (str): seed for the random players
+        max_turns (int): stop after this many turns; such games end with
+            the state inProgress
+        opening (list): [origin, destination] Coordinate names of hops
+            played from the start position before the players take over
+    Returns:
+        dict: seed, white, black, moves (list of [origin, destination]
+        Coordinate names, one per hop, opening included) and result
+        (Gamestate name)
+    Raises:
+        ValueError: if a hop of the opening is not legal
+
+    """
+    rng = random.Random(seed)
+    players = {True: make_player(white, rng), False: make_player(black, rng)}
+    model = Model()
+    moves = []
+    state = model.Gamestate.inProgress
+    for origin, destination in opening:
+        state, _ = model.move(Coordinate[origin], Coordinate[destination])
+        if state == model.Gamestate.invalidMove:
+            raise ValueError("{}-{} is not a legal move".format(origin,
+                                                               destination))
+        moves.append([origin, destination])
+    turns = 0
+    while state == model.Gamestate.inProgress and turns < max_turns:
+        for origin, destination in players[model.turn.value].play(model):
+            state, _ = model.move(origin, destination)
+            moves.append([origin.name, destination.name])
+        turns += 1
+    return {'seed': seed, 'white': white, 'black': black,
+            'moves': moves, 'result': state.name}
+
+
+def _play_chunk(first, last, white, black, seed, max_turns):
+    records = []
+    for game in range(first, last):
+        record = play_game(white, black, game_seed(seed, game), max_turns)
+        record['game'] = game
+        records.append(record)
+    return records
+
+
+def run(games, white, black, output, seed=0, workers=None, max_turns=400,
+        chunk=8):
+    """Play games in a process pool and append each one to output
+
+    Games are written as one JSON object per line as soon as their chunk
+    finishes, so they are never held in memory. Only a few chunks per
+    worker are queued at any time. The results do not depend on the number
+    of workers, unless a player has a time limit: only players limited by
+    depth, nodes or playouts replay the same games.
+
+    Args:
+        games (int): number of games to play
+        white (str): player spec for white
+        black (str): player spec for black
+        output (file): text file open for writing
+        seed (int): seed of the run; game n uses game_seed(seed, n)
+        workers (int): processes to use, os.cpu_count() by default
+        max_turns (int): turn limit for every game
+        chunk (int): games played by a worker per task; larger chunks
+            cost less inter-process traffic for short games
+    Returns:
+        dict: number of games for each result
+
+    """
+    workers = workers or os.cpu_count() or 1
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        next_game = 0
+        while next_game < games or pending:
+            while next_game < games and len(pending) < 4 * workers:
+                last = min(next_game + chunk, games)
+                pending.add(pool.submit(_play_chunk, next_game, last, white,
+                                        black, seed, max_turns))
+                next_game = last
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for record in future.result():
+                    output.write(json.dumps(record) + '\n')
+                    results[record['result']] = \
+                        results.get(record['result'], 0) + 1
+            output.flush()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m checkers.selfplay',
+        description='Play many games in parallel and write them as JSON '
+                    'lines.')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--white', default='random',
+                        help="player spec, e.g. 'random', "
+                             "'engine:depth=4,time=0.1' or "
+                             "'mcts:playouts=500'")
+    parser.add_argument('--black', default='random')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-turns', type=int, default=400)
+    parser.add_argument('--chunk', type=int, default=8,
+                        help='games per task (default 8)')
+    parser.add_argument('--output', required=True,
+                        help='file the games are appended to')
+    args = parser.parse_args(argv)
+    # fail before starting the pool if a spec is wrong
+    make_player(args.white, random.Random())
+    make_player(args.black, random.Random())
+    with open(args.output, 'a') as output:
+        results = run(args.games, args.white, args.black, output,
+                      args.seed, args.workers, args.max_turns, args.chunk)
+    print(', '.join('{} {}'.format(k, v) for k, v in sorted(results.items())))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
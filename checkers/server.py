@@ -0,0 +1,402 @@
+# Copyright (c) 2015 Gamda Software, LLC
+#
+# See the file LICENSE.txt for copying permission.
+
+import argparse
+import asyncio
+import json
+import struct
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from gameboard.coordinate import Coordinate
+from .model import Model
+from .engine import Engine
+from . import records
+from .selfplay import ENGINE_OPTIONS
+
+# Requests and responses are JSON objects, one per line. A request names an
+# operation in 'op' and may carry an 'id' that is copied to its response.
+# Responses have 'ok' set to true, or to false with the reason in 'error'.
+# Updates of subscribed games are sent as {"event": "update", ...} lines.
+
+# Longest request line accepted, in bytes
+MAX_LINE = 4096
+
+# A parked game is its encoded position, its no_progress count as _COUNT
+# and one _SEEN (key, times) per position of its draw history
+_COUNT = struct.Struct('<I')
+_SEEN = struct.Struct('<QI')
+
+
+class RequestError(Exception):
+    """A request that can not be served; the message is sent back"""
+
+
+def _search(data, options):
+    # runs in the executor: search the position encoded in data
+    model = records.fields_to_model(records.decode_position(data))
+    result = Engine(**options).search(model)
+    if result is None:
+        return [], None
+    return [[o.name, d.name] for o, d in result.moves], result.score
+
+
+def describe(model, state=None):
+    """Return a JSON-ready dict with the position of model
+
+    Args:
+        model (Model): the game
+        state (Model.Gamestate): the state to report; computed if None
+
+    """
+    if state is None:
+        state = model._gamestate()
+    current = model._current_chip
+    return {'turn': model.turn.name,
+            'state': state.name,
+            'current_chip': current.name if current is not None else None,
+            'chips': {square.name: [chip.color.name, chip.type.name]
+                      for square, chip in model.chips.items()}}
+
+
+class GameStore:
+    """Games by id, with at most live_games of them kept as Models
+
+    Games that have not been used for a while are parked as one bytes
+    object, loaded again when they are asked for: the 13 bytes of their
+    encoded position, 4 for the turns without progress and 12 per position
+    seen since the last capture or soldier move. With its dict entry, an
+    idle game takes about 150 bytes, plus 12 for every such position.
+
+    Args:
+        max_games (int): games that can exist at once
+        live_games (int): games kept as Models
+
+    """
+
+    def __init__(self, max_games=100000, live_games=1000):
+        self.max_games = max_games
+        self.live_games = live_games
+        self._live = OrderedDict()  # id -> Model, least recently used first
+        self._parked = {}           # id -> bytes of _park()
+        self._next_id = 1
+
+    def __len__(self):
+        return len(self._live) + len(self._parked)
+
+    def __contains__(self, game):
+        return game in self._live or game in self._parked
+
+    def new(self):
+        """Create a game and return its id"""
+        if len(self) >= self.max_games:
+            raise RequestError("too many games")
+        game = self._next_id
+        self._next_id += 1
+        self._add(game, Model())
+        return game
+
+    def _add(self, game, model):
+        self._live[game] = model
+        while len(self._live) > self.live_games:
+            old, old_model = self._live.popitem(last=False)
+            self._parked[old] = self._park(old_model)
+
+    @staticmethod
+    def _park(model):
+        return records.encode_position(model) + \
+               _COUNT.pack(model.no_progress) + \
+               b''.join(_SEEN.pack(key, times)
+                        for key, times in model._repetitions.items())
+
+    @staticmethod
+    def _unpark(data):
+        model = records.fields_to_model(records.decode_position(data))
+        model.no_progress, = _COUNT.unpack_from(data, records.POSITION_SIZE)
+        seen = data[records.POSITION_SIZE + _COUNT.size:]
+        model._repetitions = dict(_SEEN.iter_unpack(seen))
+        return model
+
+    def get(self, game):
+        """Return the Model of a game
+
+        Raises:
+            RequestError: if there is no such game
+
+        """
+        model = self._live.get(game)
+        if model is not None:
+            self._live.move_to_end(game)
+            return model
+        parked = self._parked.pop(game, None)
+        if parked is None:
+            raise RequestError("unknown game {!r}".format(game))
+        model = self._unpark(parked)
+        self._add(game, model)
+        return model
+
+    def delete(self, game):
+        if self._live.pop(game, None) is None and \
+                self._parked.pop(game, None) is None:
+            raise RequestError("unknown game {!r}".format(game))
+
+
+class GameServer:
+    """Serves games to any number of clients
+
+    Engine searches run in executor, a process pool by default, on a copy
+    of the position, so the event loop keeps serving other games.
+
+    Args:
+        store (GameStore): the games, a new GameStore by default
+        executor (concurrent.futures.Executor): where engines run
+        max_engine_time (float): longest search a client can ask for
+
+    """
+
+    def __init__(self, store=None, executor=None, max_engine_time=10.0):
+        self.store = store if store is not None else GameStore()
+        self.executor = executor
+        self.max_engine_time = max_engine_time
+        self._subscribers = {}  # game id -> set of StreamWriters
+        self._operations = {'new': self._new,
+                            'state': self._state,
+                            'moves': self._moves,
+                            'move': self._move,
+                            'turns': self._turns,
+                            'sequence': self._sequence,
+                            'engine': self._engine,
+                            'subscribe': self._subscribe,
+                            'unsubscribe': self._unsubscribe,
+                            'close': self._close}
+
+    def start(self, host='127.0.0.1', port=0, path=None):
+        """Return a coroutine that starts listening and gives the server
+
+        Listens on a Unix socket if path is given, on TCP otherwise.
+
+        """
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor()
+        if path is not None:
+            return asyncio.start_unix_server(self.handle, path,
+                                             limit=MAX_LINE)
+        return asyncio.start_server(self.handle, host, port, limit=MAX_LINE)
+
+    async def handle(self, reader, writer):
+        """Serve one connection until the client closes it"""
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError: # longer than MAX_LINE
+                    self._send(writer, {'ok': False,
+                                        'error': "request too long"})
+                    break
+                if not line:
+                    break
+                response = await self.request(line, writer)
+                self._send(writer, response)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for writers in self._subscribers.values():
+                writers.discard(writer)
+            writer.close()
+
+    async def request(self, line, writer=None):
+        """Serve one request line and return the response dict"""
+        message = None
+        try:
+            try:
+                message = json.loads(line.decode() if isinstance(line, bytes)
+                                     else line)
+            except ValueError:
+                raise RequestError("request is not valid JSON")
+            if not isinstance(message, dict):
+                raise RequestError("request must be a JSON object")
+            operation = self._operations.get(message.get('op'))
+            if operation is None:
+                raise RequestError("unknown op {!r}".format(message.get('op')))
+            response = operation(message, writer)
+            if asyncio.iscoroutine(response):
+                response = await response
+            response['ok'] = True
+        except RequestError as e:
+            response = {'ok': False, 'error': str(e)}
+        except Exception as e:
+            # a bug must not cost the client its connection
+            response = {'ok': False,
+                        'error': "internal error: {!r}".format(e)}
+        if isinstance(message, dict) and 'id' in message:
+            response['id'] = message['id']
+        return response
+
+    @staticmethod
+    def _send(writer, message):
+        writer.write(json.dumps(message).encode() + b'\n')
+
+    def _publish(self, game, message):
+        message = dict(message, event='update', game=game)
+        for writer in list(self._subscribers.get(game, ())):
+            if writer.transport.is_closing():
+                self._subscribers[game].discard(writer)
+            else:
+                self._send(writer, message)
+
+    @staticmethod
+    def _game_id(message):
+        game = message.get('game')
+        if not isinstance(game, int) or isinstance(game, bool):
+            raise RequestError("game must be a game id")
+        return game
+
+    def _game(self, message):
+        game = self._game_id(message)
+        return game, self.store.get(game)
+
+    @staticmethod
+    def _square(message, key):
+        try:
+            return Coordinate[message[key]]
+        except (KeyError, TypeError):
+            raise RequestError("{} must be a square name".format(key))
+
+    def _new(self, message, writer):
+        game = self.store.new()
+        response = describe(self.store.get(game))
+        response['game'] = game
+        return response
+
+    def _state(self, message, writer):
+        game, model = self._game(message)
+        return describe(model)
+
+    def _moves(self, message, writer):
+        game, model = self._game(message)
+        return {'moves': sorted([o.name, d.name]
+                                for o, d in model.available_moves())}
+
+    def _turns(self, message, writer):
+        game, model = self._game(message)
+        turns = [{'squares': [s.name for s in turn.squares],
+                  'captured': [s.name for s in turn.captured]}
+                 for turn in model.available_turns()]
+        return {'turns': sorted(turns, key=lambda t: t['squares'])}
+
+    def _play(self, game, model, origin, destination):
+        state, removed = model.move(origin, destination)
+        if state == Model.Gamestate.invalidMove:
+            raise RequestError("{}-{} is not a legal move".format(
+                origin.name, destination.name))
+        update = describe(model, state)
+        update['move'] = [origin.name, destination.name]
+        update['removed'] = [square.name for square in removed]
+        self._publish(game, update)
+        return update
+
+    def _move(self, message, writer):
+        game, model = self._game(message)
+        return self._play(game, model, self._square(message, 'origin'),
+                          self._square(message, 'destination'))
+
+    def _sequence(self, message, writer):
+        game, model = self._game(message)
+        names = message.get('squares')
+        if not isinstance(names, list):
+            raise RequestError("squares must be a list of square names")
+        squares = [self._square({'square': name}, 'square') for name in names]
+        state, removed = model.play_sequence(squares)
+        if state == Model.Gamestate.invalidMove:
+            raise RequestError("{} is not a legal turn".format('-'.join(
+                names)))
+        update = describe(model, state)
+        update['sequence'] = names
+        update['removed'] = [square.name for square in removed]
+        self._publish(game, update)
+        return update
+
+    async def _engine(self, message, writer):
+        game, model = self._game(message)
+        if model._gamestate() != Model.Gamestate.inProgress:
+            raise RequestError("game is over")
+        options = {'max_time': self.max_engine_time}
+        for key, (argument, kind) in ENGINE_OPTIONS.items():
+            if key in message:
+                try:
+                    options[argument] = kind(message[key])
+                except (TypeError, ValueError):
+                    raise RequestError("bad value for {}".format(key))
+        options['max_time'] = min(options['max_time'], self.max_engine_time)
+        key = model.key
+        loop = asyncio.get_running_loop()
+        moves, score = await loop.run_in_executor(
+            self.executor, _search, records.encode_position(model), options)
+        response = {'moves': moves, 'score': score}
+        if message.get('play'):
+            model = self.store.get(game)
+            if model.key != key:
+                raise RequestError("the game changed during the search")
+            for origin, destination in moves:
+                update = self._play(game, model, Coordinate[origin],
+                                    Coordinate[destination])
+            if moves:
+                response.update(update)
+        return response
+
+    def _subscribe(self, message, writer):
+        game, model = self._game(message)
+        self._subscribers.setdefault(game, set()).add(writer)
+        return describe(model)
+
+    def _unsubscribe(self, message, writer):
+        writers = self._subscribers.get(self._game_id(message), set())
+        writers.discard(writer)
+        return {}
+
+    def _close(self, message, writer):
+        game = self._game_id(message)
+        self.store.delete(game)
+        self._subscribers.pop(game, None)
+        return {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m checkers.server',
+        description='Serve games over newline-delimited JSON.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', metavar='PATH',
+                        help='listen on a Unix socket instead of TCP')
+    parser.add_argument('--max-games', type=int, default=100000)
+    parser.add_argument('--live-games', type=int, default=1000,
+                        help='games kept in memory as Models (default 1000)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='engine processes, os.cpu_count() by default')
+    args = parser.parse_args(argv)
+
+    server = GameServer(GameStore(args.max_games, args.live_games),
+                        ProcessPoolExecutor(args.workers))
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    listener = loop.run_until_complete(
+        server.start(args.host, args.port, args.unix))
+    print('listening on {}'.format(args.unix or '{}:{}'.format(args.host,
+                                                               args.port)))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        loop.run_until_complete(listener.wait_closed())
+        server.executor.shutdown()
+        loop.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,435 @@
+# Copyright (c) 2015 Gamda Software, LLC
+#
+# See the file LICENSE.txt for copying permission.
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import combinations
+from .bitboard import Position, BITS, WHITE_PROMOTION, BLACK_PROMOTION
+
+# Positions are stored as seen by the side to move: when black is to move,
+# the board is turned around and the colors swapped, so black's soldiers
+# move up the board like white's. Turning the board around takes bit b to
+# bit 31 - b.
+#
+# A slice holds every position with the same material, named by a key
+# (own soldiers, own queens, rival soldiers, rival queens). Each position
+# of a slice takes one byte: 0 for a draw, otherwise 1 + the number of
+# turns left until the side to move has no moves, if both sides play
+# their best. The side to move wins when that number is odd.
+#
+# The index of a position in its slice combines the ranks of its four
+# groups of chips, each group ranked among the sets of as many squares.
+
+WIN, DRAW, LOSS = 1, 0, -1
+
+# result: WIN, DRAW or LOSS for the side to move; distance: turns until
+# the game ends, None for a draw
+TablebaseResult = namedtuple('TablebaseResult', ['result', 'distance'])
+
+# A file starts with a header and a directory with the key and the offset
+# of every slice, followed by the slices themselves.
+_HEADER = struct.Struct('<4sBH')
+_ENTRY = struct.Struct('<4BQ')
+_MAGIC = b'CKTB'
+_MAX_DISTANCE = 254
+
+_REVERSED = bytes(int('{:08b}'.format(i)[::-1], 2) for i in range(256))
+
+
+def _flip(mask):
+    # mask seen from the other side of the board
+    return _REVERSED[mask & 255] << 24 | _REVERSED[mask >> 8 & 255] << 16 | \
+           _REVERSED[mask >> 16 & 255] << 8 | _REVERSED[mask >> 24]
+
+
+def _count(mask):
+    return bin(mask).count('1')
+
+
+_SUBSETS = {}  # chips -> masks of that many squares, by rank
+_RANKS = {}    # mask -> rank among the masks with as many squares
+
+
+def _subsets(chips):
+    if chips not in _SUBSETS:
+        # in numeric order, which ranks the sets of squares the same way
+        # whatever the number of squares on the board
+        masks = sorted(sum(1 << b for b in squares)
+                       for squares in combinations(range(32), chips))
+        for rank, mask in enumerate(masks):
+            _RANKS[mask] = rank
+        _SUBSETS[chips] = masks
+    return _SUBSETS[chips]
+
+
+def slice_size(key):
+    """Return the number of entries of the slice named by key"""
+    size = 1
+    for chips in key:
+        size *= len(_subsets(chips))
+    return size
+
+
+def _locate(own, rival, queens):
+    # (key, index) of a position seen by the side to move
+    groups = (own & ~queens, own & queens, rival & ~queens, rival & queens)
+    key = tuple(_count(mask) for mask in groups)
+    index = 0
+    for chips, mask in zip(key, groups):
+        index = index * len(_subsets(chips)) + _RANKS[mask]
+    return key, index
+
+
+def _positions(key):
+    # yield (index, own, rival, queens) for the positions of a slice that
+    # can start a turn: soldiers are never on the row where they crown
+    own_soldiers, own_queens, rival_soldiers, rival_queens = \
+        [_subsets(chips) for chips in key]
+    index = -1
+    for a in own_soldiers:
+        for b in own_queens:
+            for c in rival_soldiers:
+                for d in rival_queens:
+                    index += 1
+                    if a & b or c & d or (a | b) & (c | d) or \
+                            a & WHITE_PROMOTION or c & BLACK_PROMOTION:
+                        continue
+                    yield index, a | b, c | d, b | d
+
+
+def slice_keys(pieces):
+    """Return the keys of every slice of positions with up to pieces chips
+
+    Both sides have at least one chip.
+
+    """
+    keys = []
+    for total in range(2, pieces + 1):
+        for own in range(1, total):
+            for own_queens in range(own + 1):
+                for rival_queens in range(total - own + 1):
+                    keys.append((own - own_queens, own_queens,
+                                 total - own - rival_queens, rival_queens))
+    return keys
+
+
+def _unit(key):
+    # slices that must be solved together: quiet moves lead from a slice to
+    # the one with the sides swapped
+    return tuple(sorted({key, key[2:] + key[:2]}))
+
+
+def _successor_keys(key):
+    # slices a turn from key can lead to, seen by the next side to move
+    soldiers, queens, rival_soldiers, rival_queens = key
+    keys = set()
+    for promoted in range(min(soldiers, 1) + 1):
+        for left_soldiers in range(rival_soldiers + 1):
+            for left_queens in range(rival_queens + 1):
+                if left_soldiers + left_queens:
+                    keys.add((left_soldiers, left_queens,
+                              soldiers - promoted, queens + promoted))
+    return keys
+
+
+def _play_turn(position, path):
+    for origin, destination in zip(path, path[1:]):
+        position.move_chip(origin, destination)
+    position.promote(path[-1])
+
+
+class _Slices:
+    # slices already solved, read from the files of a directory
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._data = {}
+
+    def get(self, key):
+        if key not in self._data:
+            with open(_slice_path(self.directory, key), 'rb') as f:
+                self._data[key] = f.read()
+        return self._data[key]
+
+
+def _slice_path(directory, key):
+    return os.path.join(directory, '{}-{}-{}-{}'.format(*key))
+
+
+def _solve(unit, directory):
+    # runs in the executor: solve the slices of unit by retrograde analysis
+    # and write each one to directory, where the slices it leads to are
+    offsets = {}
+    size = 0
+    for key in unit:
+        offsets[key] = size
+        size += slice_size(key)
+    solved = _Slices(directory)
+    values = bytearray(size)
+    remaining = array('H', [0]) * size
+    # events[d] holds the positions with a turn to a position that ends the
+    # game in d turns; done[d] the positions found to end it in d turns
+    events = {}
+    done = {0: []}
+    sources = array('I')
+    targets = array('I')
+    for key in unit:
+        base = offsets[key]
+        for index, own, rival, queens in _positions(key):
+            p = base + index
+            position = Position(own, rival, queens, True)
+            turns = position.turns()
+            if not turns:
+                values[p] = 1
+                done[0].append(p)
+                continue
+            remaining[p] = len(turns)
+            for path, captured in turns:
+                after = position.copy()
+                _play_turn(after, path)
+                if not after.black:
+                    events.setdefault(0, []).append(p)
+                    continue
+                # the rival moves next
+                next_key, next_index = _locate(_flip(after.black),
+                                               _flip(after.white),
+                                               _flip(after.queens))
+                if next_key in offsets:
+                    sources.append(offsets[next_key] + next_index)
+                    targets.append(p)
+                else:
+                    value = solved.get(next_key)[next_index]
+                    if value:
+                        events.setdefault(value - 1, []).append(p)
+
+    # the positions with a turn to each position, grouped by position
+    first = array('I', [0]) * (size + 1)
+    for s in sources:
+        first[s + 1] += 1
+    for i in range(size):
+        first[i + 1] += first[i]
+    predecessors = array('I', [0]) * len(sources)
+    filled = array('I', first)
+    for s, t in zip(sources, targets):
+        predecessors[filled[s]] = t
+        filled[s] += 1
+    del sources, targets, filled
+
+    # positions are found in the order of their distance, so a win is
+    # found by its shortest turn and a loss by its longest one
+    distance = 0
+    while done or events:
+        pending = events.pop(distance, [])
+        for p in done.pop(distance, []):
+            pending.extend(predecessors[first[p]:first[p + 1]])
+        for q in pending:
+            if values[q]:
+                continue
+            if distance % 2:
+                # the position is lost once all of its turns lead to a win
+                remaining[q] -= 1
+                if remaining[q]:
+                    continue
+            if distance + 1 > _MAX_DISTANCE:
+                raise ValueError("distance too long to store")
+            values[q] = distance + 2
+            done.setdefault(distance + 1, []).append(q)
+        distance += 1
+
+    for key in unit:
+        with open(_slice_path(directory, key), 'wb') as f:
+            f.write(values[offsets[key]:offsets[key] + slice_size(key)])
+    return unit
+
+
+def generate(path, pieces=3, workers=None, progress=None):
+    """Solve every position with up to pieces chips and write them to path
+
+    Slices are solved by retrograde analysis in a process pool, every slice
+    as soon as the ones it leads to are done, and written to one file.
+
+    Args:
+        path (str): the tablebase file
+        pieces (int): most chips on the board, both sides together
+        workers (int): processes to use, os.cpu_count() by default
+        progress (function): called with the keys of every solved unit
+
+    """
+    keys = slice_keys(pieces)
+    units = sorted({_unit(key) for key in keys})
+    needs = {}
+    for unit in units:
+        needs[unit] = {_unit(k) for key in unit
+                       for k in _successor_keys(key)} - {unit}
+    with tempfile.TemporaryDirectory(
+            dir=os.path.dirname(os.path.abspath(path))) as directory:
+        with ProcessPoolExecutor(workers) as pool:
+            finished = set()
+            running = {}
+            while len(finished) < len(units):
+                for unit in units:
+                    if unit not in finished and \
+                            unit not in running.values() and \
+                            needs[unit] <= finished:
+                        running[pool.submit(_solve, unit, directory)] = unit
+                ready, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in ready:
+                    future.result()
+                    unit = running.pop(future)
+                    finished.add(unit)
+                    if progress is not None:
+                        progress(unit)
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as output:
+            output.write(_HEADER.pack(_MAGIC, pieces, len(keys)))
+            offset = _HEADER.size + _ENTRY.size * len(keys)
+            for key in keys:
+                output.write(_ENTRY.pack(*key, offset))
+                offset += slice_size(key)
+            for key in keys:
+                with open(_slice_path(directory, key), 'rb') as f:
+                    output.write(f.read())
+        os.replace(temporary, path)
+
+
+def _result(value):
+    if not value:
+        return TablebaseResult(DRAW, None)
+    distance = value - 1
+    return TablebaseResult(WIN if distance % 2 else LOSS, distance)
+
+
+def _best(results):
+    # the result of a position from the results of the positions its turns
+    # lead to, seen by the other side
+    wins = [r.distance for r in results if r.result == LOSS]
+    if wins:
+        return TablebaseResult(WIN, min(wins) + 1)
+    if any(r.result == DRAW for r in results):
+        return TablebaseResult(DRAW, None)
+    return TablebaseResult(LOSS, max(r.distance for r in results) + 1)
+
+
+class Tablebase:
+    """Results of the positions with few chips, read from a file of
+    generate() without loading it into memory
+
+    The results assume that both sides play their best and do not count
+    repetitions or turns without progress.
+
+    Args:
+        path (str): file written by generate()
+    Raises:
+        ValueError: if the file is not a tablebase
+
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.pieces, count = _HEADER.unpack_from(self._data)
+        if magic != _MAGIC:
+            self._data.close()
+            raise ValueError("{} is not a tablebase".format(path))
+        self._slices = {}
+        for i in range(count):
+            entry = _ENTRY.unpack_from(self._data,
+                                       _HEADER.size + i * _ENTRY.size)
+            self._slices[entry[:4]] = entry[4]
+        for chips in range(self.pieces):
+            _subsets(chips)
+
+    def close(self):
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def probe_position(self, white, black, queens, white_to_move=True):
+        """Return the TablebaseResult of a position at the start of a turn
+
+        Returns:
+            TablebaseResult: or None if the position is not in the file
+
+        """
+        if _count(white | black) > self.pieces:
+            return None
+        if white_to_move:
+            own, rival = white, black
+        else:
+            own, rival, queens = _flip(black), _flip(white), _flip(queens)
+        if not own:
+            return TablebaseResult(LOSS, 0)
+        if not rival:
+            return None
+        key, index = _locate(own, rival, queens)
+        return _result(self._data[self._slices[key] + index])
+
+    def probe(self, model):
+        """Return the TablebaseResult of the position of a Model
+
+        In the middle of a multi-jump, the result is that of the best way
+        to end the turn.
+
+        Args:
+            model (Model): the position
+        Returns:
+            TablebaseResult: or None if the position is not in the file
+
+        """
+        position = model._position
+        if model._current_chip is None:
+            return self.probe_position(position.white, position.black,
+                                       position.queens,
+                                       position.white_to_move)
+        # the turn only removes rival chips
+        own = position.white if position.white_to_move else position.black
+        if _count(own) >= self.pieces:
+            return None
+        results = []
+        for path, captured in position.turns(1 << BITS[model._current_chip]):
+            after = position.copy()
+            _play_turn(after, path)
+            result = self.probe_position(after.white, after.black,
+                                         after.queens,
+                                         not after.white_to_move)
+            if result is None:
+                return None
+            results.append(result)
+        return _best(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m checkers.tablebase',
+        description='Solve the positions with few chips and write them to '
+                    'a tablebase file.')
+    parser.add_argument('output', help='tablebase file to write')
+    parser.add_argument('--pieces', type=int, default=3,
+                        help='most chips on the board (default 3)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='processes to use, os.cpu_count() by default')
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    def progress(unit):
+        print('solved {} in {:.1f}s'.format(
+            ', '.join('{}-{}-{}-{}'.format(*key) for key in unit),
+            time.perf_counter() - start))
+    generate(args.output, args.pieces, args.workers, progress)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
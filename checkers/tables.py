@@ -0,0 +1,84 @@
+# Copyright (c) 2015 Gamda Software, LLC
+#
+# See the file LICENSE.txt for copying permission.
+
+# Move tables for the 32 playable squares, built once at import so move
+# generation looks squares up instead of computing them. Squares are the
+# bits of bitboard: bit = 4 * row + column // 2, row by row from a1.
+
+TOP_LEFT, TOP_RIGHT, BTM_LEFT, BTM_RIGHT = range(4)
+DIRECTIONS = (TOP_LEFT, TOP_RIGHT, BTM_LEFT, BTM_RIGHT)
+OPPOSITE = (BTM_RIGHT, BTM_LEFT, TOP_RIGHT, TOP_LEFT)
+WHITE_DIRECTIONS = (TOP_LEFT, TOP_RIGHT)
+BLACK_DIRECTIONS = (BTM_LEFT, BTM_RIGHT)
+# (row step, column step) of each direction
+_STEPS = ((1, -1), (1, 1), (-1, -1), (-1, 1))
+
+
+def _bit(row, column):
+    if 0 <= row < 8 and 0 <= column < 8:
+        return 4 * row + column // 2
+    return -1
+
+
+def _row_column(bit):
+    row = bit >> 2
+    return row, 2 * (bit & 3) + (row & 1)
+
+
+def _ray(bit, direction):
+    row, column = _row_column(bit)
+    row_step, column_step = _STEPS[direction]
+    ray = []
+    while True:
+        row, column = row + row_step, column + column_step
+        b = _bit(row, column)
+        if b < 0:
+            return tuple(ray)
+        ray.append(b)
+
+# RAYS[direction][bit] holds the bits from bit to the edge of the board,
+# nearest first, and RAY_MASKS[direction][bit] is the mask of the same bits
+RAYS = tuple(tuple(_ray(b, d) for b in range(32)) for d in DIRECTIONS)
+RAY_MASKS = tuple(tuple(sum(1 << r for r in ray) for ray in rays)
+                  for rays in RAYS)
+
+# NEIGHBORS[direction][bit] is the bit one step away, or -1 if off the board
+NEIGHBORS = tuple(tuple(ray[0] if ray else -1 for ray in rays)
+                  for rays in RAYS)
+
+# JUMPS[direction][bit] is the (jumped bit, landing bit) pair of a short
+# jump, or None if the landing square is off the board
+JUMPS = tuple(tuple(ray[:2] if len(ray) > 1 else None for ray in rays)
+              for rays in RAYS)
+
+# Rows where soldiers are crowned, by color; PROMOTION[white_to_move]
+WHITE_PROMOTION = 0xF0000000 # row 8
+BLACK_PROMOTION = 0x0000000F # row 1
+PROMOTION = (BLACK_PROMOTION, WHITE_PROMOTION)
+
+# DIRECTION[origin][destination] is the direction leading from one bit to
+# the other, or -1 if they are not on the same diagonal
+DIRECTION = tuple(tuple(next((d for d in DIRECTIONS if destination in
+                              RAYS[d][origin]), -1)
+                        for destination in range(32))
+                  for origin in range(32))
+
+# BETWEEN[origin][destination] is the mask of the bits strictly between two
+# bits on the same diagonal, 0 otherwise
+BETWEEN = tuple(tuple(RAY_MASKS[d][origin] & ~RAY_MASKS[d][destination] &
+                      ~(1 << destination) if d >= 0 else 0
+                      for destination, d in enumerate(DIRECTION[origin]))
+                for origin in range(32))
+
+
+def nearest(mask, direction):
+    """Return the bit of mask met first going in direction
+
+    Bits grow towards the top of the board, so going up the nearest bit
+    is the lowest one and going down it is the highest one.
+
+    """
+    if direction < BTM_LEFT:
+        return (mask & -mask).bit_length() - 1
+    return mask.bit_length() - 1
@@ -4,8 +4,46 @@
 
 import unittest
 import random
+import contextlib
+import io
+import json
+import os
+import tempfile
+import pickle
+import asyncio
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+import pygame
 from checkers.model import Model, Chip
+from checkers.engine import Engine, WIN
+from checkers import zobrist
+from checkers.perft import perft, load_position, POSITIONS, \
+                           main as perft_main
+from checkers import selfplay
+from checkers import mcts
+from checkers import tournament
+from checkers import records
+from checkers.database import PositionDatabase, build_index, position_key
+from checkers import tablebase
+from checkers.tablebase import Tablebase
+from checkers import book
+from checkers.protocol import EngineSession
+from checkers.layout import Layout
+from checkers.headless import HeadlessRenderer
+from checkers import headless
+from checkers.server import GameServer, GameStore
+from checkers import server
+from checkers.transposition import TranspositionTable, EXACT, LOWER
+from checkers.bitboard import Position, BITS, SQUARES, shift, \
+                              TOP_LEFT, TOP_RIGHT, BTM_LEFT, BTM_RIGHT, \
+                              COORDINATE_MOVES, FULL
+from checkers import tables
 from gameboard.coordinate import Coordinate
+try:
+    from checkers import batch
+except ImportError: # NumPy is optional
+    batch = None
 
 class TestChip(unittest.TestCase):
 
@@ -20,8 +58,135 @@ class TestChip(unittest.TestCase):
 
     def test_promote(self):
         chip = Chip(Chip.Color.white)
-        chip.promote()
-        self.assertEqual(chip.type, Chip.Type.queen)
+        queen = chip.promote()
+        self.assertEqual(queen.type, Chip.Type.queen)
+        self.assertEqual(queen.color, Chip.Color.white)
+        self.assertEqual(chip.type, Chip.Type.soldier)
+
+    def test_shared_instances(self):
+        self.assertIs(Chip(Chip.Color.black), Chip(Chip.Color.black))
+        self.assertIs(Chip(Chip.Color.black).promote(),
+                      Chip(Chip.Color.black, Chip.Type.queen))
+        self.assertRaises(AttributeError, setattr, Chip(Chip.Color.white),
+                          'type', Chip.Type.queen)
+        self.assertFalse(hasattr(Chip(Chip.Color.white), '__dict__'))
+        self.assertIs(pickle.loads(pickle.dumps(Chip(Chip.Color.white))),
+                      Chip(Chip.Color.white))
+
+class TestPosition(unittest.TestCase):
+
+    def mask(self, *squares):
+        result = 0
+        for s in squares:
+            result |= 1 << BITS[s]
+        return result
+
+    def test_squares_and_bits_agree(self):
+        self.assertEqual(len(SQUARES), 32)
+        for b, s in enumerate(SQUARES):
+            self.assertEqual(BITS[s], b)
+        self.assertIsNone(BITS[Coordinate.b1])
+
+    def test_shift(self):
+        self.assertEqual(shift(self.mask(Coordinate.c3), TOP_LEFT),
+                         self.mask(Coordinate.b4))
+        self.assertEqual(shift(self.mask(Coordinate.c3), TOP_RIGHT),
+                         self.mask(Coordinate.d4))
+        self.assertEqual(shift(self.mask(Coordinate.c3), BTM_LEFT),
+                         self.mask(Coordinate.b2))
+        self.assertEqual(shift(self.mask(Coordinate.c3), BTM_RIGHT),
+                         self.mask(Coordinate.d2))
+        # squares leaving the board are dropped
+        self.assertEqual(shift(self.mask(Coordinate.a3), TOP_LEFT), 0)
+        self.assertEqual(shift(self.mask(Coordinate.h2), BTM_RIGHT), 0)
+        self.assertEqual(shift(self.mask(Coordinate.b8), TOP_RIGHT), 0)
+        self.assertEqual(shift(self.mask(Coordinate.a1), BTM_LEFT), 0)
+
+    def test_soldier_jump_is_forced(self):
+        position = Position(white=self.mask(Coordinate.c3, Coordinate.g3),
+                            black=self.mask(Coordinate.d4))
+        moves, can_jump = position.moves()
+        self.assertTrue(can_jump)
+        self.assertEqual(moves, [(BITS[Coordinate.c3], BITS[Coordinate.e5])])
+
+    def test_queen_jump_along_long_diagonal(self):
+        position = Position(white=self.mask(Coordinate.h8),
+                            black=self.mask(Coordinate.c3),
+                            queens=self.mask(Coordinate.h8))
+        destinations, can_jump = position.chip_moves(BITS[Coordinate.h8])
+        self.assertTrue(can_jump)
+        self.assertEqual(destinations,
+                         self.mask(Coordinate.b2, Coordinate.a1))
+        removed = position.move_chip(BITS[Coordinate.h8],
+                                     BITS[Coordinate.a1])
+        self.assertEqual(removed, [BITS[Coordinate.c3]])
+        self.assertEqual(position.black, 0)
+        self.assertEqual(position.queens, self.mask(Coordinate.a1))
+
+    def test_jumped_chips_in_order(self):
+        position = Position(white=self.mask(Coordinate.h8),
+                            black=self.mask(Coordinate.f6, Coordinate.c3),
+                            queens=self.mask(Coordinate.h8))
+        self.assertEqual(position.jumped_chips(BITS[Coordinate.h8],
+                                               BITS[Coordinate.a1]),
+                         [BITS[Coordinate.f6], BITS[Coordinate.c3]])
+        self.assertEqual(position.jumped_chips(BITS[Coordinate.a1],
+                                               BITS[Coordinate.h8]),
+                         [BITS[Coordinate.c3], BITS[Coordinate.f6]])
+
+    def test_coordinate_moves_agree_with_moves(self):
+        rng = random.Random(3)
+        for n in range(500):
+            squares = rng.sample(range(32), rng.randrange(2, 16))
+            split = rng.randrange(1, len(squares))
+            position = Position(
+                white=sum(1 << b for b in squares[:split]),
+                black=sum(1 << b for b in squares[split:]),
+                queens=sum(1 << b for b in squares if rng.random() < 0.3),
+                white_to_move=rng.random() < 0.5)
+            origins = rng.choice([FULL, 1 << squares[0]])
+            moves, can_jump = position.moves(origins)
+            self.assertEqual(position.coordinate_moves(origins),
+                             ({COORDINATE_MOVES[m] for m in moves},
+                              can_jump))
+
+class TestTables(unittest.TestCase):
+
+    def test_neighbors_agree_with_shift(self):
+        for d in tables.DIRECTIONS:
+            for b in range(32):
+                n = tables.NEIGHBORS[d][b]
+                self.assertEqual(shift(1 << b, d), 1 << n if n >= 0 else 0)
+
+    def test_rays(self):
+        ray = tables.RAYS[TOP_RIGHT][BITS[Coordinate.a1]]
+        self.assertEqual([SQUARES[b] for b in ray],
+                         [Coordinate.b2, Coordinate.c3, Coordinate.d4,
+                          Coordinate.e5, Coordinate.f6, Coordinate.g7,
+                          Coordinate.h8])
+        self.assertEqual(tables.RAYS[BTM_LEFT][BITS[Coordinate.a1]], ())
+        self.assertEqual(tables.RAY_MASKS[TOP_RIGHT][BITS[Coordinate.a1]],
+                         sum(1 << b for b in ray))
+
+    def test_jumps(self):
+        self.assertEqual(tables.JUMPS[TOP_LEFT][BITS[Coordinate.c3]],
+                         (BITS[Coordinate.b4], BITS[Coordinate.a5]))
+        self.assertIsNone(tables.JUMPS[TOP_LEFT][BITS[Coordinate.b2]])
+
+    def test_direction_and_between(self):
+        h8, a1 = BITS[Coordinate.h8], BITS[Coordinate.a1]
+        self.assertEqual(tables.DIRECTION[h8][a1], BTM_LEFT)
+        self.assertEqual(tables.DIRECTION[a1][h8], TOP_RIGHT)
+        self.assertEqual(tables.DIRECTION[a1][BITS[Coordinate.c1]], -1)
+        self.assertEqual(tables.BETWEEN[a1][BITS[Coordinate.d4]],
+                         1 << BITS[Coordinate.b2] | 1 << BITS[Coordinate.c3])
+        self.assertEqual(tables.BETWEEN[a1][BITS[Coordinate.b2]], 0)
+
+    def test_nearest(self):
+        mask = 1 << BITS[Coordinate.c3] | 1 << BITS[Coordinate.f6]
+        self.assertEqual(tables.nearest(mask, TOP_RIGHT), BITS[Coordinate.c3])
+        self.assertEqual(tables.nearest(mask, BTM_LEFT), BITS[Coordinate.f6])
+
 
 class TestModel(unittest.TestCase):
 
@@ -247,6 +412,144 @@ class TestModel(unittest.TestCase):
         answer = set([(Coordinate.f6, Coordinate.d8)])
         self.assertEqual(moves, answer)
 
+    def double_jump_position(self):
+        for origin, destination in (('c3', 'd4'), ('d6', 'c5'), ('b2', 'c3'),
+                                    ('c7', 'd6'), ('c3', 'b4'), ('d8', 'c7'),
+                                    ('d2', 'c3'), ('f6', 'e5')):
+            self.model.move(Coordinate[origin], Coordinate[destination])
+
+    def test_available_turns(self):
+        self.assertEqual(len(self.model.available_turns()), 7)
+        self.assertIn(self.model.Turn((Coordinate.a3, Coordinate.b4), ()),
+                      self.model.available_turns())
+        self.double_jump_position()
+        turn = self.model.Turn((Coordinate.d4, Coordinate.f6, Coordinate.d8),
+                               (Coordinate.e5, Coordinate.e7))
+        self.assertEqual(self.model.available_turns(), [turn])
+        self.model.move(Coordinate.d4, Coordinate.f6)
+        self.assertEqual(self.model.available_turns(),
+                         [self.model.Turn(turn.squares[1:],
+                                          turn.captured[1:])])
+
+    def test_play_sequence(self):
+        self.double_jump_position()
+        key = self.model.key
+        squares = (Coordinate.d4, Coordinate.f6, Coordinate.d8)
+        for wrong in (squares[:2], squares + (Coordinate.c7,), squares[:1],
+                      (Coordinate.a3, Coordinate.b4)):
+            state, removed = self.model.play_sequence(wrong)
+            self.assertEqual(state, self.model.Gamestate.invalidMove)
+            self.assertEqual(self.model.key, key)
+            self.assertEqual(self.model.turn, Chip.Color.white)
+        state, removed = self.model.play_sequence(squares)
+        self.assertEqual(state, self.model.Gamestate.inProgress)
+        self.assertEqual(removed, [Coordinate.e5, Coordinate.e7])
+        self.assertEqual(self.model.turn, Chip.Color.black)
+        self.assertEqual(self.model.chips[Coordinate.d8].type,
+                         Chip.Type.queen)
+
+    def two_queens(self, **limits):
+        model = Model(**limits)
+        white = Chip(Chip.Color.white, Chip.Type.queen)
+        black = Chip(Chip.Color.black, Chip.Type.queen)
+        model.set_position({Coordinate.a1: white, Coordinate.h2: black},
+                           Chip.Color.white)
+        return model
+
+    SHUFFLE = ((Coordinate.a1, Coordinate.b2), (Coordinate.h2, Coordinate.g1),
+               (Coordinate.b2, Coordinate.a1), (Coordinate.g1, Coordinate.h2))
+
+    def test_tie_by_repetition(self):
+        model = self.two_queens()
+        states = [model.move(*move)[0] for move in self.SHUFFLE * 2]
+        self.assertEqual(states[:-1], [model.Gamestate.inProgress] * 7)
+        self.assertEqual(states[-1], model.Gamestate.tie)
+        model = self.two_queens(repetition_limit=None)
+        states = [model.move(*move)[0] for move in self.SHUFFLE * 2]
+        self.assertEqual(states[-1], model.Gamestate.inProgress)
+
+    def test_tie_without_progress(self):
+        model = self.two_queens(repetition_limit=None, no_progress_limit=5)
+        states = [model.move(*move)[0] for move in self.SHUFFLE * 2]
+        self.assertEqual(states[3:5], [model.Gamestate.inProgress,
+                                       model.Gamestate.tie])
+        self.model.move(Coordinate.c3, Coordinate.d4)
+        self.assertEqual(self.model.no_progress, 0)
+
+    def test_no_move_after_tie(self):
+        model = self.two_queens(repetition_limit=None, no_progress_limit=2)
+        for move in self.SHUFFLE[:2]:
+            state, removed = model.move(*move)
+        self.assertEqual(state, model.Gamestate.tie)
+        key = model.key
+        self.assertEqual(model.move(*self.SHUFFLE[2]),
+                         (model.Gamestate.invalidMove, []))
+        self.assertEqual(model.play_sequence(self.SHUFFLE[2]),
+                         (model.Gamestate.invalidMove, []))
+        self.assertEqual(model.key, key)
+
+    def test_progress_clears_repetitions(self):
+        model = Model()
+        key = model.key
+        record = model.make_move(Coordinate.c3, Coordinate.d4)
+        self.assertEqual(model._repetitions, {model.key: 1})
+        model.unmake_move(record)
+        self.assertEqual(model._repetitions, {key: 1})
+        model = self.two_queens()
+        for move in self.SHUFFLE:
+            model.move(*move)
+        self.assertEqual(model._repetitions[model.key], 2)
+
+    def test_unmake_restores_draw_history(self):
+        model = self.two_queens()
+        for move in self.SHUFFLE:
+            model.move(*move)
+        history = dict(model._repetitions), model.no_progress
+        records = [model.make_move(*move) for move in self.SHUFFLE]
+        self.assertEqual(model._gamestate(), model.Gamestate.tie)
+        for record in reversed(records):
+            model.unmake_move(record)
+        self.assertEqual((model._repetitions, model.no_progress), history)
+
+    def test_move_queries(self):
+        # the queries must agree with available_moves() whether or not the
+        # moves were already generated
+        self.double_jump_position()
+        self.model._legal = None
+        self.assertTrue(self.model.has_any_move())
+        self.assertEqual(self.model.count_moves(), 1)
+        self.assertEqual(list(self.model.iter_moves()),
+                         [(Coordinate.d4, Coordinate.f6)])
+        self.assertTrue(self.model.is_legal(Coordinate.d4, Coordinate.f6))
+        # a regular move is not legal while a jump is available
+        self.assertFalse(self.model.is_legal(Coordinate.a3, Coordinate.b4))
+        self.assertFalse(self.model.is_legal(Coordinate.d4, Coordinate.c1))
+        self.assertIsNone(self.model._legal)
+        self.assertEqual(set(self.model.iter_moves()),
+                         self.model.available_moves())
+        self.assertRaises(TypeError, self.model.is_legal, 'd4', Coordinate.f6)
+        self.model.new_game()
+        self.assertEqual(self.model.count_moves(), 7)
+        self.assertFalse(self.model.is_legal(Coordinate.a7, Coordinate.b6))
+
+    def test_has_any_move_when_blocked(self):
+        white = Chip(Chip.Color.white)
+        black = Chip(Chip.Color.black)
+        self.model.set_position({Coordinate.a1: white, Coordinate.b2: black,
+                                 Coordinate.c3: black}, Chip.Color.white)
+        self.assertFalse(self.model.has_any_move())
+        self.assertEqual(self.model.count_moves(), 0)
+        self.assertEqual(list(self.model.iter_moves()), [])
+        self.assertEqual(self.model._gamestate(),
+                         self.model.Gamestate.blackWon)
+
+    def test_available_moves_returns_copy(self):
+        moves = self.model.available_moves()
+        moves.clear()
+        self.assertEqual(len(self.model.available_moves()), 7)
+        move, removed = self.model.move(Coordinate.a3, Coordinate.b4)
+        self.assertEqual(move, self.model.Gamestate.inProgress)
+
     def test_move_raises_TypeError(self):
         self.assertRaises(TypeError, self.model.move,
             origin = "notCoordinate",
@@ -409,6 +712,104 @@ class TestModel(unittest.TestCase):
         # between white and black queens, there is no need to test
         # black chips' behavior separately.
 
+    def snapshot(self):
+        return ({k: (id(c), c.color, c.type)
+                 for k, c in self.model.chips.items()},
+                {k: self.model.board.get_content(k) for k in Coordinate},
+                self.model.turn,
+                self.model._current_chip,
+                self.model.available_moves())
+
+    def test_make_move_raises_ValueError(self):
+        self.assertRaises(ValueError, self.model.make_move,
+                          Coordinate.a3, Coordinate.c4)
+
+    def test_unmake_move_restores_jumps_and_promotion(self):
+        moves = [(Coordinate.c3, Coordinate.d4),
+                 (Coordinate.d6, Coordinate.c5),
+                 (Coordinate.b2, Coordinate.c3),
+                 (Coordinate.c7, Coordinate.d6),
+                 (Coordinate.c3, Coordinate.b4),
+                 (Coordinate.d8, Coordinate.c7),
+                 (Coordinate.d2, Coordinate.c3),
+                 (Coordinate.f6, Coordinate.e5),
+                 (Coordinate.d4, Coordinate.f6),
+                 (Coordinate.f6, Coordinate.d8)]
+        snapshots, records = [], []
+        for origin, destination in moves:
+            snapshots.append(self.snapshot())
+            records.append(self.model.make_move(origin, destination))
+        self.assertEqual(self.model._current_chip, None)
+        self.assertTrue(records[-1].promoted)
+        self.assertEqual(self.model.chips[Coordinate.d8].type,
+                         Chip.Type.queen)
+        # the first hop of the double jump leaves the turn with white
+        self.assertEqual(records[-1].current_chip, Coordinate.f6)
+        while records:
+            self.model.unmake_move(records.pop())
+            self.assertEqual(self.snapshot(), snapshots.pop())
+
+    def full_key(self):
+        current = self.model._current_chip
+        return zobrist.position_key(self.model._position,
+                                    BITS[current] if current else None)
+
+    def test_key_follows_moves(self):
+        start = self.model.key
+        self.assertEqual(start, self.full_key())
+        self.model.move(Coordinate.c3, Coordinate.d4)
+        after_one = self.model.key
+        self.assertNotEqual(after_one, start)
+        self.assertEqual(after_one, self.full_key())
+        # same chips reached in a different order give the same key
+        self.model.new_game()
+        for move in [(Coordinate.g3, Coordinate.h4),
+                     (Coordinate.h6, Coordinate.g5),
+                     (Coordinate.a3, Coordinate.b4),
+                     (Coordinate.d6, Coordinate.e5)]:
+            self.model.move(*move)
+        other = Model()
+        for move in [(Coordinate.a3, Coordinate.b4),
+                     (Coordinate.d6, Coordinate.e5),
+                     (Coordinate.g3, Coordinate.h4),
+                     (Coordinate.h6, Coordinate.g5)]:
+            other.move(*move)
+        self.assertEqual(self.model.key, other.key)
+        self.assertEqual(self.model.key, self.full_key())
+
+    def test_key_marks_pending_jump(self):
+        for move in [(Coordinate.c3, Coordinate.d4),
+                     (Coordinate.d6, Coordinate.c5),
+                     (Coordinate.b2, Coordinate.c3),
+                     (Coordinate.c7, Coordinate.d6),
+                     (Coordinate.c3, Coordinate.b4),
+                     (Coordinate.d8, Coordinate.c7),
+                     (Coordinate.d2, Coordinate.c3),
+                     (Coordinate.f6, Coordinate.e5)]:
+            self.model.move(*move)
+        before = self.model.key
+        record = self.model.make_move(Coordinate.d4, Coordinate.f6)
+        self.assertEqual(self.model._current_chip, Coordinate.f6)
+        self.assertEqual(self.model.key, self.full_key())
+        self.model.unmake_move(record)
+        self.assertEqual(self.model.key, before)
+
+    def test_set_position(self):
+        queen = Chip(Chip.Color.black).promote()
+        self.model.set_position({Coordinate.c3: Chip(Chip.Color.white),
+                                 Coordinate.h8: queen},
+                                Chip.Color.black)
+        self.assertEqual(self.model.turn, Chip.Color.black)
+        self.assertIs(self.model.board.get_content(Coordinate.h8), queen)
+        self.assertIsNone(self.model.board.get_content(Coordinate.a1))
+        self.assertEqual(self.model.available_moves(),
+                         set([(Coordinate.h8, Coordinate.b2),
+                              (Coordinate.h8, Coordinate.a1)]))
+        self.assertRaises(ValueError, self.model.set_position,
+                          {Coordinate.b1: queen}, Chip.Color.white)
+        self.assertRaises(TypeError, self.model.set_position,
+                          {"c3": queen}, Chip.Color.white)
+
     def test_square_has_ally_chip_raises_TypeError(self):
         self.assertRaises(TypeError, 
                           self.model.square_contains_teammate, 
@@ -474,6 +875,979 @@ class TestModel(unittest.TestCase):
         move, removed = self.model.move(Coordinate.g5, Coordinate.e3)
         self.assertEqual(move, self.model.Gamestate.blackWon)
 
+class TestPerft(unittest.TestCase):
+
+    def test_reference_counts(self):
+        for name, white, black, turn, current_chip, counts in POSITIONS:
+            model = load_position(white, black, turn, current_chip)
+            key = model.key
+            for depth in range(1, 5):
+                self.assertEqual(perft(model, depth), counts[depth - 1],
+                                 "{} depth {}".format(name, depth))
+            self.assertEqual(model.key, key)
+
+    def test_benchmark_gate(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'perft.json')
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                self.assertEqual(perft_main(['--depth', '3', '--save', path,
+                                             '--position', 'start']), 0)
+                self.assertIn('ok', output.getvalue())
+                with open(path) as f:
+                    saved = json.load(f)
+                saved['start']['3'] *= 1000 # pretend it used to be faster
+                with open(path, 'w') as f:
+                    json.dump(saved, f)
+                self.assertEqual(perft_main(['--depth', '3',
+                                             '--compare', path,
+                                             '--position', 'start']), 1)
+                self.assertIn('SLOWER', output.getvalue())
+
+class TestSelfPlay(unittest.TestCase):
+
+    def replay(self, record):
+        model = Model()
+        state = model.Gamestate.inProgress
+        for origin, destination in record['moves']:
+            state, _ = model.move(Coordinate[origin], Coordinate[destination])
+            self.assertNotEqual(state, model.Gamestate.invalidMove)
+        return state.name
+
+    def test_make_player(self):
+        player = selfplay.make_player('engine:depth=3,time=0.5', None)
+        self.assertEqual(player.engine.max_depth, 3)
+        self.assertEqual(player.engine.max_time, 0.5)
+        self.assertRaises(ValueError, selfplay.make_player, 'human', None)
+        self.assertRaises(ValueError, selfplay.make_player,
+                          'random:depth=2', None)
+        player = selfplay.make_player('mcts:playouts=50', random.Random(0))
+        self.assertEqual(player.mcts.max_playouts, 50)
+        self.assertIsNone(player.mcts.max_time)
+        self.assertRaises(ValueError, selfplay.make_player,
+                          'mcts:depth=2', None)
+
+    def test_play_game_is_reproducible(self):
+        first = selfplay.play_game('random', 'engine:depth=1', 'seed')
+        second = selfplay.play_game('random', 'engine:depth=1', 'seed')
+        self.assertEqual(first, second)
+        self.assertEqual(self.replay(first), first['result'])
+
+    def test_run_streams_every_game(self):
+        output = io.StringIO()
+        results = selfplay.run(5, 'random', 'random', output, seed=7,
+                               workers=2, chunk=2)
+        records = [json.loads(line) for line in
+                   output.getvalue().splitlines()]
+        self.assertEqual(sorted(r['game'] for r in records), list(range(5)))
+        self.assertEqual(sum(results.values()), 5)
+        for r in records:
+            self.assertEqual(r, dict(selfplay.play_game(
+                'random', 'random', selfplay.game_seed(7, r['game'])),
+                game=r['game']))
+
+    def test_play_game_from_opening(self):
+        game = selfplay.play_game('random', 'random', 'seed',
+                                  opening=[['c3', 'd4'], ['f6', 'e5']])
+        self.assertEqual(game['moves'][:2], [['c3', 'd4'], ['f6', 'e5']])
+        self.assertEqual(self.replay(game), game['result'])
+        self.assertRaises(ValueError, selfplay.play_game, 'random',
+                          'random', 'seed', opening=[['c3', 'c4']])
+
+class TestTournament(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'match.jsonl')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read(self, path):
+        with open(path) as f:
+            return sorted((json.loads(line) for line in f),
+                          key=lambda r: r['game'])
+
+    def test_statistics(self):
+        rating, margin = tournament.elo(75, 0, 25)
+        self.assertAlmostEqual(rating, 190.85, places=2)
+        self.assertGreater(margin, 0)
+        self.assertEqual(tournament.elo(10, 5, 10)[0], 0)
+        self.assertEqual(tournament.sprt(30, 40, 30, 0, 10)[1], None)
+        self.assertEqual(tournament.sprt(300, 400, 100, 0, 10)[1], 'H1')
+        self.assertEqual(tournament.sprt(100, 400, 300, 0, 10)[1], 'H0')
+        # a match won every time is decided as well
+        self.assertEqual(tournament.sprt(20, 0, 0, 0, 50)[1], 'H1')
+
+    def test_openings(self):
+        openings = tournament.default_openings()
+        self.assertEqual(len(openings), 49)
+        self.assertEqual(openings[0], [['a3', 'b4'], ['b6', 'a5']])
+        text = io.StringIO('# two openings\nc3 d4 f6 e5\n\ne3 f4\n')
+        self.assertEqual(tournament.read_openings(text),
+                         [[['c3', 'd4'], ['f6', 'e5']], [['e3', 'f4']]])
+        self.assertRaises(ValueError, tournament.read_openings,
+                          io.StringIO('c3 d4 f6\n'))
+
+    def test_broken_player(self):
+        class BrokenPlayer:
+            def __init__(self, rng):
+                pass
+
+            def play(self, model):
+                return [(Coordinate.c3, Coordinate.c4)]
+        selfplay.PLAYERS['broken'] = BrokenPlayer
+        selfplay.PLAYER_OPTIONS['broken'] = {}
+        try:
+            # an illegal move is not scored as a draw
+            self.assertRaises(ValueError, tournament.match_game, 0,
+                              'broken', 'random', [[]], 0, 10)
+            record = tournament.match_game(1, 'broken', 'random', [[]], 0,
+                                           0)
+            self.assertEqual(record['result'], 'inProgress')
+            self.assertEqual(record['score'], 0.5)
+        finally:
+            del selfplay.PLAYERS['broken'], selfplay.PLAYER_OPTIONS['broken']
+
+    def test_resume(self):
+        openings = [[['c3', 'd4']], [['e3', 'f4']]]
+        full = os.path.join(self.directory.name, 'full.jsonl')
+        result = tournament.run('random', 'engine:depth=1', full, games=6,
+                                openings=openings, workers=2)
+        self.assertEqual(result.games, 6)
+        tournament.run('random', 'engine:depth=1', self.path, games=3,
+                       openings=openings, workers=1)
+        # a line cut short by a crash is played again
+        with open(self.path, 'a') as f:
+            f.write('{"game": 3, "whi')
+        resumed = tournament.run('random', 'engine:depth=1', self.path,
+                                 games=6, openings=openings, workers=2)
+        self.assertEqual(resumed, result)
+        self.assertEqual(self.read(self.path), self.read(full))
+        for record in self.read(full):
+            first_white = record['game'] % 2 == 0
+            self.assertEqual(record['white'] == 'random', first_white)
+            self.assertEqual(record['moves'][0],
+                             openings[record['game'] // 2 % 2][0])
+        self.assertRaises(ValueError, tournament.run, 'random',
+                          'engine:depth=2', self.path, games=8)
+
+    def test_sprt_stops_early(self):
+        result = tournament.run('engine:depth=2', 'random', self.path,
+                                games=200, sprt_bounds=(0, 200),
+                                workers=1, max_turns=100)
+        self.assertEqual(result.decision, 'H1')
+        self.assertLess(result.games, 200)
+        self.assertEqual(len(self.read(self.path)), result.games)
+
+class TestRecords(unittest.TestCase):
+
+    def test_position_round_trip(self):
+        models = [Model(), load_position(*POSITIONS[3][1:5]),
+                  load_position(*POSITIONS[4][1:5])]
+        self.assertLess(records.POSITION_SIZE, 16)
+        data = io.BytesIO()
+        records.write_positions(data, models)
+        self.assertEqual(len(data.getvalue()),
+                         3 * records.POSITION_SIZE)
+        data.seek(0)
+        loaded = [records.fields_to_model(fields)
+                  for fields in records.read_positions(data, block=2)]
+        for model, copy in zip(models, loaded):
+            self.assertEqual(copy.key, model.key)
+            self.assertEqual(copy.turn, model.turn)
+            self.assertEqual(copy._current_chip, model._current_chip)
+            self.assertEqual(copy.available_moves(), model.available_moves())
+            self.assertEqual({k: (c.color, c.type)
+                              for k, c in copy.chips.items()},
+                             {k: (c.color, c.type)
+                              for k, c in model.chips.items()})
+
+    def test_truncated_positions(self):
+        data = io.BytesIO(records.encode_position(Model())[:-1])
+        self.assertRaises(ValueError, list, records.read_positions(data))
+
+    def test_game_round_trip(self):
+        games = [selfplay.play_game('random', 'random', str(seed))
+                 for seed in range(3)]
+        data = io.BytesIO()
+        for game in games:
+            moves = [(Coordinate[o], Coordinate[d]) for o, d in game['moves']]
+            records.write_game(data, moves, Model.Gamestate[game['result']])
+        data.seek(0)
+        loaded = list(records.read_games(data))
+        self.assertEqual(len(loaded), 3)
+        for game, record in zip(games, loaded):
+            self.assertEqual(record.result.name, game['result'])
+            self.assertEqual([[o.name, d.name] for o, d in record.moves],
+                             game['moves'])
+            self.assertEqual(record.start,
+                             records.position_fields(Model()))
+
+class TestBook(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'openings.book')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_games(self, name, seeds):
+        games = [selfplay.play_game('random', 'random', str(seed))
+                 for seed in seeds]
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'wb') as f:
+            for game in games:
+                moves = [(Coordinate[o], Coordinate[d])
+                         for o, d in game['moves']]
+                records.write_game(f, moves, Model.Gamestate[game['result']])
+        return path, games
+
+    def test_counts(self):
+        path, games = self.write_games('games.bin', range(10))
+        self.assertEqual(book.build(self.path, [path], max_turns=4), 10)
+        first = {}
+        for game in games:
+            hop = tuple(game['moves'][0])
+            first[hop] = first.get(hop, 0) + 1
+        with book.Book(self.path) as opening:
+            moves = opening.moves(Model())
+            self.assertEqual({(m.origin.name, m.destination.name): m.games
+                              for m in moves}, first)
+            self.assertEqual(sorted((m.games for m in moves), reverse=True),
+                             [m.games for m in moves])
+            for move in moves:
+                self.assertTrue(0.0 <= move.score <= 1.0)
+            model = Model()
+            turn = opening.book_move(model)
+            self.assertEqual(turn[0], (moves[0].origin,
+                                       moves[0].destination))
+            self.assertEqual(model.key, Model().key)
+            turn = opening.book_move(model, random.Random(0))
+            self.assertIn(turn[0], [(m.origin, m.destination)
+                                    for m in moves])
+            # positions after max_turns turns are left out
+            model = Model()
+            hops = iter(games[0]['moves'])
+            for turn in range(4):
+                color = model.turn
+                while model.turn == color:
+                    model.move(*(Coordinate[s] for s in next(hops)))
+            self.assertIsNone(opening.book_move(model))
+            self.assertEqual(Engine(book=opening).search(Model()),
+                             (opening.book_move(Model()), 0, 0, 0))
+
+    def test_update(self):
+        first, games = self.write_games('first.bin', range(6))
+        second, games = self.write_games('second.bin', range(6, 12))
+        combined = os.path.join(self.directory.name, 'combined.book')
+        book.build(combined, [first, second])
+        book.build(self.path, [first])
+        self.assertEqual(book.update(self.path, [second], chunk=16), 6)
+        with open(self.path, 'rb') as f, open(combined, 'rb') as g:
+            self.assertEqual(f.read(), g.read())
+
+    def test_not_a_book(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a book')
+        self.assertRaises(ValueError, book.Book, self.path)
+
+class TestPositionDatabase(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'positions.bin')
+        self.models = [load_position(*p[1:5]) for p in POSITIONS]
+        self.models.append(Model()) # the start position appears twice
+        with open(self.path, 'wb') as f:
+            records.write_positions(f, self.models)
+
+    def test_random_access(self):
+        with PositionDatabase(self.path) as db:
+            self.assertEqual(len(db), len(self.models))
+            for i, model in enumerate(self.models):
+                self.assertEqual(db.model(i).key, model.key)
+                self.assertEqual(position_key(db[i]), model.key)
+            self.assertEqual(db[-1], db[0])
+            part = db[1:5:2]
+            self.assertEqual(len(part), 2)
+            self.assertEqual(list(part), [db[1], db[3]])
+            self.assertRaises(IndexError, db.__getitem__, len(self.models))
+            self.assertRaises(ValueError, db.find, 0)
+
+    def test_index(self):
+        build_index(self.path, chunk=2)
+        with PositionDatabase(self.path) as db:
+            start = Model().key
+            self.assertEqual(db.find(start), [0, len(self.models) - 1])
+            self.assertEqual(db[1:].find(start), [len(self.models) - 2])
+            self.assertEqual(db.find(self.models[3].key), [3])
+            self.assertEqual(db.find(12345), [])
+
+    def test_bad_files(self):
+        build_index(self.path)
+        with open(self.path, 'ab') as f:
+            records.write_positions(f, [Model()])
+        self.assertRaises(ValueError, PositionDatabase, self.path)
+        with open(self.path, 'ab') as f:
+            f.write(b'x')
+        self.assertRaises(ValueError, PositionDatabase, self.path, False)
+
+@unittest.skipIf(batch is None, 'NumPy is not installed')
+class TestBatch(unittest.TestCase):
+
+    def test_matches_model(self):
+        rng = random.Random(3)
+        models = [load_position(*p[1:5]) for p in POSITIONS]
+        for game in range(10):
+            model = Model()
+            for hop in range(rng.randrange(120)):
+                moves = sorted(model.available_moves())
+                if not moves:
+                    break
+                model.move(*rng.choice(moves))
+                if hop % 5 == 0:
+                    models.append(records.fields_to_model(
+                        records.position_fields(model)))
+        positions = batch.encode_models(models)
+        lists = batch.move_lists(positions)
+        destinations, can_jump = batch.legal_moves(positions)
+        for model, moves, jump in zip(models, lists, can_jump):
+            self.assertEqual(set(moves), model.available_moves())
+            self.assertEqual(len(moves), len(model.available_moves()))
+            model._legal_moves()
+            self.assertEqual(bool(jump), model._legal_jumps)
+
+    def test_records_file(self):
+        data = io.BytesIO()
+        records.write_positions(data, [Model(), Model()])
+        positions = batch.positions_array(data.getvalue())
+        index, origins, destinations = \
+            batch.move_arrays(batch.legal_moves(positions)[0])
+        self.assertEqual(list(index), [0] * 7 + [1] * 7)
+        self.assertEqual({(SQUARES[o], SQUARES[d])
+                          for o, d in zip(origins[:7], destinations[:7])},
+                         Model().available_moves())
+
+class TestTablebase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.directory.name, 'two.tb')
+        tablebase.generate(cls.path, pieces=2, workers=1)
+        cls.tablebase = Tablebase(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tablebase.close()
+        cls.directory.cleanup()
+
+    def model(self, turn, *chips):
+        model = Model()
+        model.set_position(dict(chips), turn)
+        return model
+
+    def test_results(self):
+        white = Chip(Chip.Color.white)
+        black = Chip(Chip.Color.black)
+        # the soldier on a7 is stuck
+        model = self.model(Chip.Color.white, (Coordinate.a7, white),
+                           (Coordinate.b8, black))
+        self.assertEqual(self.tablebase.probe(model),
+                         (tablebase.LOSS, 0))
+        model = self.model(Chip.Color.black, (Coordinate.c3, white),
+                           (Coordinate.b4, black))
+        self.assertEqual(self.tablebase.probe(model), (tablebase.WIN, 1))
+        self.assertIsNone(self.tablebase.probe(Model()))
+
+    def test_best_play(self):
+        # every result follows from the results its turns lead to
+        rng = random.Random(0)
+        dark = [square for square in Coordinate if BITS[square] is not None]
+        for i in range(100):
+            squares = rng.sample(dark, 2)
+            chips = [Chip(color, rng.choice(list(Chip.Type)))
+                     for color in Chip.Color]
+            if BITS[squares[0]] >= 28 and chips[0].type == Chip.Type.soldier \
+                    or BITS[squares[1]] < 4 and \
+                    chips[1].type == Chip.Type.soldier:
+                continue
+            turn = rng.choice(list(Chip.Color))
+            model = self.model(turn, *zip(squares, chips))
+            result = self.tablebase.probe(model)
+            after = []
+            for t in model.available_turns():
+                model.play_sequence(t.squares)
+                after.append(self.tablebase.probe(model))
+                model = self.model(turn, *zip(squares, chips))
+            if not after:
+                self.assertEqual(result, (tablebase.LOSS, 0))
+            elif any(r.result == tablebase.LOSS for r in after):
+                self.assertEqual(result, (tablebase.WIN, 1 + min(
+                    r.distance for r in after
+                    if r.result == tablebase.LOSS)))
+            elif any(r.result == tablebase.DRAW for r in after):
+                self.assertEqual(result, (tablebase.DRAW, None))
+            else:
+                self.assertEqual(result, (tablebase.LOSS, 1 + max(
+                    r.distance for r in after)))
+
+    def test_multi_jump(self):
+        white = Chip(Chip.Color.white)
+        black = Chip(Chip.Color.black)
+        model = Model()
+        model.set_position({Coordinate.e5: white, Coordinate.d6: black,
+                            Coordinate.f6: black}, Chip.Color.white,
+                           Coordinate.e5)
+        model.move(Coordinate.e5, Coordinate.g7)
+        after = self.tablebase.probe(model)
+        model.set_position({Coordinate.e5: white, Coordinate.d6: black,
+                            Coordinate.f6: black}, Chip.Color.white,
+                           Coordinate.e5)
+        result = self.tablebase.probe(model)
+        self.assertEqual(result.result, tablebase.WIN)
+        self.assertLessEqual(result.distance, after.distance + 1)
+
+    def test_engine(self):
+        # the engine scores a won position by the distance to the end
+        white = Chip(Chip.Color.white, Chip.Type.queen)
+        black = Chip(Chip.Color.black)
+        model = self.model(Chip.Color.white, (Coordinate.a1, white),
+                           (Coordinate.e7, black))
+        result = self.tablebase.probe(model)
+        self.assertEqual(result.result, tablebase.WIN)
+        search = Engine(max_depth=1, tablebase=self.tablebase).search(model)
+        self.assertEqual(search.score, WIN - result.distance)
+
+    def test_engine_plays_whole_multi_jump(self):
+        white = Chip(Chip.Color.white)
+        black = Chip(Chip.Color.black)
+        model = self.model(Chip.Color.white, (Coordinate.c3, white),
+                           (Coordinate.d4, black), (Coordinate.f6, black))
+        search = Engine(max_depth=2, tablebase=self.tablebase).search(model)
+        self.assertEqual(search.moves, [(Coordinate.c3, Coordinate.e5),
+                                        (Coordinate.e5, Coordinate.g7)])
+
+    def test_not_a_tablebase(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'positions.bin')
+            with open(path, 'wb') as f:
+                records.write_positions(f, [Model()])
+            self.assertRaises(ValueError, Tablebase, path)
+
+
+class TestLayout(unittest.TestCase):
+
+    def test_original_geometry(self):
+        layout = Layout(800, 600)
+        self.assertEqual(layout.square, 65)
+        self.assertEqual(layout.square_rect(Coordinate.a1).topleft, (40, 495))
+        self.assertEqual(layout.square_rect(Coordinate.h8).topleft, (495, 40))
+        self.assertEqual(layout.panel.left, 600)
+
+    def test_square_at(self):
+        for size in ((800, 600), (1280, 960), (500, 700)):
+            for flipped in (False, True):
+                layout = Layout(*size, flipped=flipped)
+                for coord, rect in layout.squares():
+                    self.assertEqual(layout.square_at(rect.topleft), coord)
+                    self.assertEqual(layout.square_at(rect.center), coord)
+                    self.assertEqual(layout.square_at(
+                        (rect.right - 1, rect.bottom - 1)), coord)
+                board = layout.board
+                for point in ((board.left - 1, board.top), (board.right,
+                              board.top), (board.left, board.bottom),
+                              (board.left, board.top - 1)):
+                    self.assertIsNone(layout.square_at(point))
+
+    def test_resize_and_flip(self):
+        layout = Layout(800, 600)
+        self.assertFalse(layout.resize(800, 600))
+        self.assertTrue(layout.resize(1600, 1200))
+        self.assertEqual(layout.square, 130)
+        bottom_left = layout.square_rect(Coordinate.a1).topleft
+        layout.flip()
+        self.assertEqual(layout.square_rect(Coordinate.h8).topleft,
+                         bottom_left)
+        self.assertEqual(layout.notation()[0][0], '1')
+        self.assertLess(layout.notation()[0][1]['centery'],
+                        layout.notation()[7][1]['centery'])
+
+class TestHeadlessRenderer(unittest.TestCase):
+
+    def image(self, surface):
+        return pygame.image.tostring(surface, 'RGB')
+
+    def test_png(self):
+        data = HeadlessRenderer(120).png(Model())
+        self.assertEqual(data[:8], b'\x89PNG\r\n\x1a\n')
+        surface = pygame.image.load(io.BytesIO(data))
+        self.assertEqual(surface.get_size(), (120, 120))
+
+    def test_frames_match_full_redraw(self):
+        game = selfplay.play_game('random', 'random', 'frames')
+        moves = [(Coordinate[o], Coordinate[d]) for o, d in game['moves']]
+        renderer = HeadlessRenderer(160, flipped=True)
+        model = Model()
+        frames = renderer.game_frames(moves)
+        self.assertEqual(self.image(next(frames)),
+                         self.image(HeadlessRenderer(160, True).draw(model)))
+        for move, frame in zip(moves, frames):
+            model.make_move(*move)
+            if model.key % 8 == 0: # compare a sample of the frames
+                fresh = HeadlessRenderer(160, True).draw(model, move)
+                self.assertEqual(self.image(frame), self.image(fresh))
+
+    def test_games_with_custom_start(self):
+        model = Model()
+        model.set_position({Coordinate.d4: Chip(Chip.Color.white),
+                            Coordinate.h8: Chip(Chip.Color.black)},
+                           Chip.Color.white)
+        moves = [(Coordinate.d4, Coordinate.e5),
+                 (Coordinate.h8, Coordinate.g7)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'games.bin')
+            with open(path, 'wb') as f:
+                records.write_game(f, moves, Model.Gamestate.inProgress,
+                                   records.encode_position(model))
+            (start, loaded), = headless.read_games(path)
+            self.assertEqual(start, records.position_fields(model))
+            self.assertEqual(loaded, moves)
+            output = os.path.join(directory, 'frames')
+            with contextlib.redirect_stdout(io.StringIO()):
+                headless.main([path, '--output', output, '--size', '80'])
+                headless.main([path, '--output', output + '-last',
+                               '--size', '80', '--last'])
+            renderer = HeadlessRenderer(80)
+            expected = [renderer.png(model)]
+            for move in moves:
+                model.make_move(*move)
+                expected.append(HeadlessRenderer(80).png(model, move))
+            for hop, png in enumerate(expected):
+                name = 'game000000-{:04d}.png'.format(hop)
+                with open(os.path.join(output, name), 'rb') as f:
+                    self.assertEqual(self.image(pygame.image.load(f)),
+                                     self.image(pygame.image.load(
+                                         io.BytesIO(png))))
+            name = os.path.join(output + '-last', 'game000000-0000.png')
+            with open(name, 'rb') as f:
+                self.assertEqual(self.image(pygame.image.load(f)),
+                                 self.image(pygame.image.load(
+                                     io.BytesIO(expected[-1]))))
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        executor = ThreadPoolExecutor(1)
+        self.addCleanup(executor.shutdown)
+        self.server = GameServer(GameStore(max_games=3, live_games=1),
+                                 executor)
+
+    def run_client(self, client):
+        async def run():
+            listener = await self.server.start()
+            port = listener.sockets[0].getsockname()[1]
+            connections = []
+
+            async def connect():
+                reader, writer = await asyncio.open_connection('127.0.0.1',
+                                                               port)
+                connections.append(writer)
+
+                async def ask(**message):
+                    writer.write(json.dumps(message).encode() + b'\n')
+                    return json.loads((await reader.readline()).decode())
+
+                async def receive():
+                    return json.loads((await reader.readline()).decode())
+                return ask, receive
+            try:
+                await client(connect)
+            finally:
+                for writer in connections:
+                    writer.close()
+                listener.close()
+                await listener.wait_closed()
+                await asyncio.sleep(0.01) # let the handlers see the EOF
+        self.loop.run_until_complete(run())
+
+    def test_game(self):
+        async def client(connect):
+            ask, receive = await connect()
+            watch, updates = await connect()
+            game = await ask(op='new', id=7)
+            self.assertEqual((game['ok'], game['id'], game['turn']),
+                             (True, 7, 'white'))
+            self.assertTrue((await watch(op='subscribe',
+                                         game=game['game']))['ok'])
+            moves = await ask(op='moves', game=game['game'])
+            self.assertEqual(len(moves['moves']), 7)
+            played = await ask(op='move', game=game['game'],
+                               origin='c3', destination='d4')
+            self.assertEqual(played['turn'], 'black')
+            update = await updates()
+            self.assertEqual((update['event'], update['move']),
+                             ('update', ['c3', 'd4']))
+            illegal = await ask(op='move', game=game['game'],
+                                origin='c3', destination='d4')
+            self.assertFalse(illegal['ok'])
+            engine = await ask(op='engine', game=game['game'], depth=2,
+                               play=True)
+            self.assertEqual(engine['turn'], 'white')
+            self.assertEqual((await updates())['move'], engine['moves'][-1])
+        self.run_client(client)
+
+    def test_turns(self):
+        async def client(connect):
+            ask, receive = await connect()
+            game = (await ask(op='new'))['game']
+            turns = (await ask(op='turns', game=game))['turns']
+            self.assertEqual(turns[0], {'squares': ['a3', 'b4'],
+                                        'captured': []})
+            played = await ask(op='sequence', game=game,
+                               squares=['c3', 'd4'])
+            self.assertEqual(played['turn'], 'black')
+            wrong = await ask(op='sequence', game=game, squares=['f6'])
+            self.assertFalse(wrong['ok'])
+        self.run_client(client)
+
+    def test_store_limits(self):
+        async def client(connect):
+            ask, receive = await connect()
+            first = (await ask(op='new'))['game']
+            await ask(op='move', game=first, origin='c3', destination='d4')
+            second = (await ask(op='new'))['game'] # parks the first game
+            await ask(op='new')
+            self.assertEqual((await ask(op='new'))['error'], 'too many games')
+            state = await ask(op='state', game=first)
+            self.assertEqual((state['turn'], state['chips']['d4']),
+                             ('black', ['white', 'soldier']))
+            self.assertTrue((await ask(op='close', game=second))['ok'])
+            self.assertFalse((await ask(op='state', game=second))['ok'])
+            self.assertFalse((await ask(op='nothing'))['ok'])
+        self.run_client(client)
+
+    def test_parked_games_keep_draw_history(self):
+        store = GameStore(live_games=1)
+        first = store.new()
+        model = store.get(first)
+        white = Chip(Chip.Color.white, Chip.Type.queen)
+        black = Chip(Chip.Color.black, Chip.Type.queen)
+        model.set_position({Coordinate.a1: white, Coordinate.h2: black},
+                           Chip.Color.white)
+        shuffle = ((Coordinate.a1, Coordinate.b2),
+                   (Coordinate.h2, Coordinate.g1),
+                   (Coordinate.b2, Coordinate.a1),
+                   (Coordinate.g1, Coordinate.h2))
+        for move in shuffle + shuffle[:3]:
+            model.move(*move)
+        store.new() # parks the first game
+        model = store.get(first)
+        self.assertEqual(model.no_progress, 7)
+        self.assertEqual(model.move(*shuffle[3])[0], Model.Gamestate.tie)
+
+    def test_parked_games_are_compact(self):
+        store = GameStore(live_games=1)
+        tracemalloc.start()
+        try:
+            for n in range(2000):
+                store.new()
+            size = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        self.assertLess(size / len(store), 250)
+        self.assertTrue(all(isinstance(data, bytes)
+                            for data in store._parked.values()))
+
+    def test_finished_game(self):
+        async def client(connect):
+            ask, receive = await connect()
+            game = (await ask(op='new'))['game']
+            self.server.store.get(game).set_position(
+                {Coordinate.c3: Chip(Chip.Color.white)}, Chip.Color.black)
+            over = await ask(op='engine', game=game, depth=2)
+            self.assertEqual(over, {'ok': False, 'error': 'game is over'})
+            # the connection is still served
+            self.assertEqual((await ask(op='state', game=game))['state'],
+                             'whiteWon')
+        self.run_client(client)
+
+    def test_bad_game_ids(self):
+        async def client(connect):
+            ask, receive = await connect()
+            for game in ([1], {'a': 1}, '1', True, None):
+                for op in ('state', 'engine', 'unsubscribe', 'close'):
+                    reply = await ask(op=op, game=game)
+                    self.assertEqual(reply['error'], 'game must be a game id')
+        self.run_client(client)
+
+    def test_unexpected_errors(self):
+        def fail(message, writer):
+            raise KeyError('boom')
+        self.server._operations['fail'] = fail
+        async def client(connect):
+            ask, receive = await connect()
+            reply = await ask(op='fail', id=3)
+            self.assertEqual((reply['ok'], reply['id']), (False, 3))
+            self.assertIn('internal error', reply['error'])
+            self.assertTrue((await ask(op='new'))['ok'])
+        self.run_client(client)
+
+    def test_search_of_finished_game(self):
+        model = Model()
+        model.set_position({Coordinate.c3: Chip(Chip.Color.white)},
+                           Chip.Color.black)
+        self.assertEqual(server._search(records.encode_position(model),
+                                        {'max_depth': 2}), ([], None))
+
+class TestTranspositionTable(unittest.TestCase):
+
+    def test_memory_cap(self):
+        table = TranspositionTable(megabytes=1)
+        self.assertEqual(table.capacity, 2 ** 20 // 16)
+
+    def test_store_and_probe(self):
+        table = TranspositionTable(megabytes=0.01)
+        self.assertIsNone(table.probe(12345))
+        table.store(12345, 3, EXACT, -250, (Coordinate.c3, Coordinate.d4))
+        self.assertEqual(table.probe(12345),
+                         (3, EXACT, -250, (Coordinate.c3, Coordinate.d4)))
+        table.store(777, 0, LOWER, WIN)
+        self.assertEqual(table.probe(777), (0, LOWER, WIN, None))
+
+    def test_deeper_result_is_kept(self):
+        table = TranspositionTable(megabytes=0.00001)
+        self.assertEqual(table.capacity, 2) # a single bucket
+        table.store(1, 5, EXACT, 10)
+        table.store(2, 1, EXACT, 20)
+        table.store(3, 1, EXACT, 30)
+        self.assertEqual(table.probe(1), (5, EXACT, 10, None))
+        self.assertIsNone(table.probe(2))
+        self.assertEqual(table.probe(3), (1, EXACT, 30, None))
+        # results of an older search give way
+        table.new_search()
+        table.store(4, 1, EXACT, 40)
+        self.assertIsNone(table.probe(1))
+        self.assertEqual(table.probe(4), (1, EXACT, 40, None))
+
+class TestEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.model = Model()
+
+    def test_search_leaves_model_unchanged(self):
+        chips = dict(self.model.chips)
+        moves = self.model.available_moves()
+        result = Engine(max_depth=3).search(self.model)
+        self.assertIn(result.moves[0], moves)
+        self.assertEqual(result.depth, 3)
+        self.assertEqual(chips, self.model.chips)
+        self.assertEqual(moves, self.model.available_moves())
+        self.assertEqual(self.model.turn, Chip.Color.white)
+
+    def test_double_jump_is_one_turn(self):
+        for move in [(Coordinate.c3, Coordinate.d4),
+                     (Coordinate.d6, Coordinate.c5),
+                     (Coordinate.b2, Coordinate.c3),
+                     (Coordinate.c7, Coordinate.d6),
+                     (Coordinate.c3, Coordinate.b4),
+                     (Coordinate.d8, Coordinate.c7),
+                     (Coordinate.d2, Coordinate.c3),
+                     (Coordinate.f6, Coordinate.e5)]:
+            self.model.move(*move)
+        result = Engine(max_depth=2).search(self.model)
+        self.assertEqual(result.moves, [(Coordinate.d4, Coordinate.f6),
+                                        (Coordinate.f6, Coordinate.d8)])
+
+    def test_finds_win(self):
+        self.model.set_position({Coordinate.c3: Chip(Chip.Color.white),
+                                 Coordinate.d4: Chip(Chip.Color.black)},
+                                Chip.Color.black)
+        result = Engine(max_depth=4).search(self.model)
+        self.assertEqual(result.moves, [(Coordinate.d4, Coordinate.b2)])
+        self.assertEqual(result.score, WIN - 1)
+
+    def test_node_limit(self):
+        engine = Engine(max_depth=50, max_nodes=500)
+        result = engine.search(self.model)
+        self.assertLess(result.depth, 50)
+        self.assertLessEqual(engine.nodes, 500)
+
+class TestEngineSession(unittest.TestCase):
+
+    def setUp(self):
+        self.output = io.StringIO()
+        self.session = EngineSession(self.output, Engine(), default_time=5)
+
+    def tearDown(self):
+        self.session.handle('quit')
+
+    def replies(self, *lines):
+        for line in lines:
+            self.session.handle(line)
+        self.session.wait(10)
+        replies = self.output.getvalue().splitlines()
+        self.output.seek(0)
+        self.output.truncate()
+        return replies
+
+    def test_go(self):
+        self.assertEqual(self.replies('hello', 'isready'),
+                         ['hello checkers', 'readyok'])
+        replies = self.replies('position start moves c3 d4 f6 e5',
+                               'go depth 2')
+        self.assertTrue(replies[0].startswith('info depth 2 '))
+        # the only move is to take e5
+        self.assertEqual(replies[1], 'bestmove d4 f6')
+        self.assertEqual(self.session.model.turn, Chip.Color.white)
+
+    def test_zero_limits(self):
+        # a limit of 0 is a limit, not the default time
+        for limit in ('time 0', 'nodes 0', 'depth 0'):
+            start = time.perf_counter()
+            replies = self.replies('position start', 'go ' + limit)
+            self.assertLess(time.perf_counter() - start, 2.0)
+            self.assertTrue(replies[0].startswith('info depth 1 '))
+            self.assertTrue(replies[1].startswith('bestmove '))
+            self.assertNotEqual(replies[1], 'bestmove none')
+
+    def test_failed_search(self):
+        class FailingEngine(Engine):
+            def search(self, model):
+                raise RuntimeError('out of memory')
+        self.session.handle('quit')
+        self.session = EngineSession(self.output, FailingEngine())
+        self.assertEqual(self.replies('position start', 'go depth 1'),
+                         ["info string search failed: "
+                          "RuntimeError('out of memory')",
+                          'bestmove none'])
+
+    def test_position(self):
+        replies = self.replies('position white c1,e3 black f4 queens c1 '
+                               'turn black moves f4 d2', 'go depth 1')
+        # black took e3, the white queen takes back
+        self.assertIn(replies[-1], ['bestmove c1 e3', 'bestmove c1 f4',
+                                    'bestmove c1 g5', 'bestmove c1 h6'])
+        self.assertEqual(self.session.model.chips[Coordinate.d2].color,
+                         Chip.Color.black)
+        self.assertEqual(self.replies('position white - black f4 '
+                                      'turn white', 'go'),
+                         ['bestmove none'])
+
+    def test_errors(self):
+        replies = self.replies('fly', 'position start moves c3 c4',
+                               'position white z9 black f4',
+                               'position start moves c3',
+                               'go depth x', 'ponderhit')
+        self.assertEqual(len(replies), 6)
+        for reply in replies:
+            self.assertTrue(reply.startswith('error '))
+
+    def test_stop(self):
+        self.session.handle('position start')
+        self.session.handle('go infinite')
+        time.sleep(0.1)
+        self.assertTrue(self.session.searching())
+        start = time.perf_counter()
+        self.session.handle('stop')
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertFalse(self.session.searching())
+        self.assertTrue(self.replies()[-1].startswith('bestmove '))
+
+    def test_ponder(self):
+        self.session.handle('position start moves c3 d4')
+        self.session.handle('go ponder depth 1')
+        time.sleep(0.1)
+        # the search is done but keeps its move until ponderhit
+        self.assertEqual(self.output.getvalue(), '')
+        self.assertTrue(self.session.searching())
+        replies = self.replies('ponderhit')
+        self.assertTrue(replies[-1].startswith('bestmove '))
+        self.session.handle('go ponder time 0.2')
+        time.sleep(0.1)
+        self.assertTrue(self.session.searching())
+        start = time.perf_counter()
+        replies = self.replies('ponderhit')
+        self.assertLess(time.perf_counter() - start, 2.0)
+        self.assertTrue(replies[-1].startswith('bestmove '))
+
+class TestMCTS(unittest.TestCase):
+
+    def setUp(self):
+        self.model = Model()
+
+    def test_playout_plays_legal_hops(self):
+        moves = []
+        position = self.model._position
+        class Recorder(Position):
+            __slots__ = ()
+            def move_chip(self, origin, destination):
+                moves.append((SQUARES[origin], SQUARES[destination]))
+                return Position.move_chip(self, origin, destination)
+        position = Recorder(position.white, position.black,
+                            position.queens, position.white_to_move)
+        result = mcts.playout(position, rng=random.Random(3))
+        for move in moves:
+            self.model.make_move(*move)
+        self.assertEqual(self.model._position.white, position.white)
+        self.assertEqual(self.model._position.black, position.black)
+        if result != 0.5:
+            self.assertFalse(self.model.has_any_move())
+            self.assertEqual(result, 0.0 if position.white_to_move else 1.0)
+
+    def test_search_is_reproducible(self):
+        moves = self.model.available_moves()
+        first = mcts.MCTS(None, 200, seed=1).search(self.model)
+        second = mcts.MCTS(None, 200, seed=1).search(self.model)
+        self.assertEqual(first.moves, second.moves)
+        self.assertIn(first.moves[0], moves)
+        self.assertEqual(first.playouts, 200)
+        self.assertGreater(first.playouts_per_second, 0)
+        self.assertEqual(moves, self.model.available_moves())
+
+    def test_finds_win(self):
+        self.model.set_position({Coordinate.c3: Chip(Chip.Color.white),
+                                 Coordinate.d4: Chip(Chip.Color.black),
+                                 Coordinate.h8: Chip(Chip.Color.black)},
+                                Chip.Color.black)
+        result = mcts.MCTS(None, 300, seed=0).search(self.model)
+        self.assertEqual(result.moves, [(Coordinate.d4, Coordinate.b2)])
+        self.assertEqual(result.win_rate, 1.0)
+
+    def test_whole_turn(self):
+        for origin, destination in (('c3', 'd4'), ('d6', 'c5'), ('b2', 'c3'),
+                                    ('c7', 'd6'), ('c3', 'b4'), ('d8', 'c7'),
+                                    ('d2', 'c3'), ('f6', 'e5')):
+            self.model.move(Coordinate[origin], Coordinate[destination])
+        result = mcts.MCTS(None, 20, seed=0).search(self.model)
+        self.assertEqual(result.moves, [(Coordinate.d4, Coordinate.f6),
+                                        (Coordinate.f6, Coordinate.d8)])
+        self.model.move(Coordinate.d4, Coordinate.f6)
+        result = mcts.MCTS(None, 20, seed=0).search(self.model)
+        self.assertEqual(result.moves, [(Coordinate.f6, Coordinate.d8)])
+
+    def test_time_budget_with_executor(self):
+        with ThreadPoolExecutor(2) as executor:
+            player = mcts.MCTS(0.3, executor=executor, trees=2, seed=0)
+            start = time.perf_counter()
+            result = player.search(self.model)
+            self.assertLess(time.perf_counter() - start, 0.4)
+        self.assertIn(result.moves[0], self.model.available_moves())
+        self.assertGreater(result.playouts, 0)
+
+    def test_game_over(self):
+        self.model.set_position({Coordinate.a1: Chip(Chip.Color.white)},
+                                Chip.Color.black)
+        self.assertIsNone(mcts.MCTS(None, 10).search(self.model))
+        self.model.new_game()
+        result = mcts.MCTS(0.0001).search(self.model)
+        self.assertIn(result.moves[0], self.model.available_moves())
+        self.assertRaises(ValueError, mcts.MCTS, None, None)
+
 # (1) Originally, tests would be added to make sure that a queen takes
 #     a double jump if available. However, no source could be found
 #     to confim that a queen must take a double jump over a single
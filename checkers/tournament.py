@@ -0,0 +1,346 @@
+# Copyright (c) 2015 Gamda Software, LLC
+#
+# See the file LICENSE.txt for copying permission.
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from gameboard.coordinate import Coordinate
+from .model import Model
+from .selfplay import make_player, play_game, game_seed
+
+# Outcome of a match for the first player. elo and margin give the rating
+# difference and its 95% error bar; llr is the log-likelihood ratio of the
+# SPRT and decision 'H1' (first is better by elo1), 'H0' (by no more than
+# elo0) or None while the test goes on.
+MatchResult = namedtuple('MatchResult', ['games', 'wins', 'draws', 'losses',
+                                         'elo', 'margin', 'llr',
+                                         'decision'])
+
+# Points of the first player by final Gamestate name, when it plays white.
+# inProgress is a game stopped at the turn limit; any other state, such as
+# invalidMove, means a player is broken and must not count.
+_WHITE_SCORES = {'whiteWon': 1.0, 'blackWon': 0.0, 'tie': 0.5,
+                 'inProgress': 0.5}
+
+
+def default_openings(turns=2):
+    """Return every sequence of the first turns of a game
+
+    Returns:
+        list: openings as lists of [origin, destination] Coordinate names,
+        in a fixed order
+
+    """
+    openings = [[]]
+    for turn in range(turns):
+        longer = []
+        for opening in openings:
+            model = Model()
+            for origin, destination in opening:
+                model.move(*(Coordinate[square]
+                             for square in (origin, destination)))
+            for path in sorted(model.available_turns(),
+                               key=lambda t: [s.name for s in t.squares]):
+                longer.append(opening + [[o.name, d.name] for o, d in
+                                         zip(path.squares, path.squares[1:])])
+        openings = longer
+    return openings
+
+
+def read_openings(file):
+    """Return the openings of a text file, one per line
+
+    Each line holds the origin and destination names of the hops played
+    from the start position, separated by spaces, as in 'c3 d4 f6 e5'.
+    Empty lines and lines starting with # are skipped.
+
+    Raises:
+        ValueError: if a line has an odd number of squares
+
+    """
+    openings = []
+    for line in file:
+        words = line.split()
+        if not words or words[0].startswith('#'):
+            continue
+        if len(words) % 2:
+            raise ValueError("opening {!r} is not made of origin and "
+                             "destination pairs".format(line.strip()))
+        openings.append([list(pair) for pair in zip(words[::2],
+                                                    words[1::2])])
+    return openings
+
+
+def elo(wins, draws, losses):
+    """Return the Elo difference of a score and its 95% error bar
+
+    Returns:
+        tuple: (elo, margin); infinite elo if one side scored every point
+
+    """
+    games = wins + draws + losses
+    if not games:
+        return 0.0, float('inf')
+    score = (wins + draws / 2) / games
+    if score in (0.0, 1.0):
+        return _elo(score), float('inf')
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 +
+                losses * score ** 2) / games
+    deviation = 1.96 * math.sqrt(variance / games)
+    high = _elo(min(score + deviation, 1.0))
+    low = _elo(max(score - deviation, 0.0))
+    return _elo(score), (high - low) / 2
+
+
+def _elo(score):
+    if score <= 0.0:
+        return float('-inf')
+    if score >= 1.0:
+        return float('inf')
+    return -400 * math.log10(1 / score - 1)
+
+
+def _score(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def sprt(wins, draws, losses, elo0, elo1, alpha=0.05, beta=0.05):
+    """Return the state of a sequential probability ratio test
+
+    Tests H0, the first player is elo0 stronger, against H1, it is elo1
+    stronger, with the normal approximation of the game scores.
+
+    Args:
+        elo0 (float): Elo difference of H0
+        elo1 (float): Elo difference of H1, higher than elo0
+        alpha (float): chance of accepting H1 when H0 is true
+        beta (float): chance of accepting H0 when H1 is true
+    Returns:
+        tuple: (llr, decision), where decision is 'H1' or 'H0' once llr
+        crosses a bound and None before
+
+    """
+    games = wins + draws + losses
+    lower = math.log(beta / (1 - alpha))
+    upper = math.log((1 - beta) / alpha)
+    if not games:
+        return 0.0, None
+    score = (wins + draws / 2) / games
+    # half a game of each result keeps the variance above zero, so a match
+    # that one side wins every game of is decided too
+    variance = ((wins + 0.5) * (1 - score) ** 2 +
+                (draws + 0.5) * (0.5 - score) ** 2 +
+                (losses + 0.5) * score ** 2) / (games + 1.5)
+    score0, score1 = _score(elo0), _score(elo1)
+    llr = games * (score1 - score0) * (2 * score - score0 - score1) / \
+          (2 * variance)
+    if llr >= upper:
+        return llr, 'H1'
+    if llr <= lower:
+        return llr, 'H0'
+    return llr, None
+
+
+def match_game(game, first, second, openings, seed, max_turns):
+    """Play game number game of a match and return its record
+
+    Games go in pairs: both play the same opening, the first player taking
+    white in the even game and black in the odd one.
+
+    Returns:
+        dict: the record of selfplay.play_game() with the game number, the
+        opening number and the score of the first player added
+    Raises:
+        ValueError: if the game did not end in a win, a tie or at the turn
+            limit
+
+    """
+    opening = (game // 2) % len(openings)
+    white, black = (first, second) if game % 2 == 0 else (second, first)
+    record = play_game(white, black, game_seed(seed, game), max_turns,
+                       openings[opening])
+    if record['result'] not in _WHITE_SCORES:
+        raise ValueError("game {} ended with {}".format(game,
+                                                        record['result']))
+    score = _WHITE_SCORES[record['result']]
+    record.update(game=game, opening=opening,
+                  score=score if game % 2 == 0 else 1.0 - score)
+    return record
+
+
+def _play_pair(first_game, first, second, openings, seed, max_turns, done):
+    # runs in the pool: the games of a pair that are not in done
+    return [match_game(game, first, second, openings, seed, max_turns)
+            for game in (first_game, first_game + 1) if game not in done]
+
+
+def _resume(path, first, second):
+    # the records already in the output file, by game number
+    played = {}
+    if not os.path.exists(path):
+        return played
+    with open(path, 'r+b') as f:
+        end = 0
+        for line in f:
+            if not line.endswith(b'\n'):
+                # cut short by a crash: drop it, the game is played again
+                f.truncate(end)
+                break
+            end += len(line)
+            record = json.loads(line.decode())
+            players = {record['white'], record['black']}
+            if players != {first, second}:
+                raise ValueError("{} holds games of {} against {}".format(
+                    path, record['white'], record['black']))
+            played[record['game']] = record
+    return played
+
+
+class _Tally:
+    # wins, draws and losses of the first player and the test on them
+
+    def __init__(self, sprt_bounds):
+        self.counts = [0, 0, 0]
+        self.sprt_bounds = sprt_bounds
+
+    def add(self, score):
+        self.counts[0 if score == 1.0 else 1 if score == 0.5 else 2] += 1
+
+    def result(self):
+        wins, draws, losses = self.counts
+        rating, margin = elo(wins, draws, losses)
+        llr = decision = None
+        if self.sprt_bounds is not None:
+            llr, decision = sprt(wins, draws, losses, *self.sprt_bounds)
+        return MatchResult(wins + draws + losses, wins, draws, losses,
+                           rating, margin, llr, decision)
+
+
+def run(first, second, output, games=1000, openings=None, sprt_bounds=None,
+        seed=0, workers=None, max_turns=400, progress=None):
+    """Play a match between two players in a pool of worker processes
+
+    Every finished game is appended to the file at output as one JSON line,
+    and games already in the file are not played again, so a run that was
+    stopped carries on where it was. The players alternate colours on each
+    opening, and games are the same whatever the number of workers.
+
+    Args:
+        first (str): player spec of the player being tested, as for
+            selfplay.make_player()
+        second (str): player spec of the reference player
+        output (str): path of the JSON lines file of the games
+        games (int): most games to play
+        openings (list): openings as lists of [origin, destination]
+            Coordinate names; default_openings() if None
+        sprt_bounds (tuple): (elo0, elo1) or (elo0, elo1, alpha, beta) of a
+            sequential probability ratio test that ends the match once it
+            decides; no test if None
+        seed (int): seed of the match; game n uses game_seed(seed, n)
+        workers (int): processes to use, os.cpu_count() by default
+        max_turns (int): turn limit for every game, which is a draw if it
+            reaches it
+        progress (function): called with the MatchResult after every
+            finished pair of games
+    Returns:
+        MatchResult: the result of the games in output
+    Raises:
+        ValueError: if a spec is wrong, output holds games between other
+            players or a game ends without a result
+
+    """
+    make_player(first, random.Random())
+    make_player(second, random.Random())
+    if openings is None:
+        openings = default_openings()
+    played = _resume(output, first, second)
+    tally = _Tally(sprt_bounds)
+    for record in played.values():
+        tally.add(record['score'])
+    workers = workers or os.cpu_count() or 1
+    pairs = [game for game in range(0, games, 2)
+             if game not in played or
+             (game + 1 < games and game + 1 not in played)]
+    pairs.reverse()
+    with open(output, 'a') as f, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        while pairs or pending:
+            while pairs and len(pending) < 2 * workers and \
+                    tally.result().decision is None:
+                game = pairs.pop()
+                done = {n for n in (game, game + 1)
+                        if n in played or n >= games}
+                pending.add(pool.submit(_play_pair, game, first, second,
+                                        openings, seed, max_turns, done))
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                for record in future.result():
+                    f.write(json.dumps(record) + '\n')
+                    tally.add(record['score'])
+                f.flush()
+                if progress is not None:
+                    progress(tally.result())
+    return tally.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m checkers.tournament',
+        description='Play a match between two players in parallel and '
+                    'report the Elo difference.')
+    parser.add_argument('first', help="player spec being tested, e.g. "
+                                      "'engine:depth=5'")
+    parser.add_argument('second', help='player spec it is compared with')
+    parser.add_argument('--games', type=int, default=1000,
+                        help='most games to play (default 1000)')
+    parser.add_argument('--openings',
+                        help='file of openings, one line of hops each; '
+                             'every two-turn opening by default')
+    parser.add_argument('--sprt', type=float, nargs=2,
+                        metavar=('ELO0', 'ELO1'),
+                        help='stop when a test of ELO0 against ELO1 decides')
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-turns', type=int, default=400)
+    parser.add_argument('--output', required=True,
+                        help='file the games are appended to; a run with '
+                             'the same output resumes')
+    args = parser.parse_args(argv)
+    openings = None
+    if args.openings:
+        with open(args.openings) as f:
+            openings = read_openings(f)
+    bounds = None
+    if args.sprt:
+        bounds = tuple(args.sprt) + (args.alpha, args.beta)
+    reported = []
+    def report(result):
+        reported.append(result)
+        line = '{} games +{} ={} -{}  elo {:.1f} +- {:.1f}'.format(
+            result.games, result.wins, result.draws, result.losses,
+            result.elo, result.margin)
+        if result.llr is not None:
+            line += '  llr {:.2f}'.format(result.llr)
+        print(line)
+    result = run(args.first, args.second, args.output, args.games, openings,
+                 bounds, args.seed, args.workers, args.max_turns, report)
+    if not reported: # every game was already in the output
+        report(result)
+    if result.decision is not None:
+        print('SPRT accepts {}'.format(result.decision))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+# Copyright (c) 2015 Gamda Software, LLC
+#
+# See the file LICENSE.txt for copying permission.
+
+from array import array
+
+# kinds of score kept in the table
+EXACT, LOWER, UPPER = range(3)
+
+ENTRY_BYTES = 16 # 8 for the key, 8 for the packed data
+
+
+class TranspositionTable:
+    """Fixed-size table of search results indexed by position key
+
+    Entries are kept in buckets of two slots. The first slot keeps the
+    deepest result seen for the bucket during the current search, the
+    second one always takes the newest result that did not fit in the
+    first. Results from previous searches are replaced first.
+
+    Args:
+        megabytes (float): memory used by the entries; the number of buckets
+            is rounded down to a power of two
+
+    """
+
+    def __init__(self, megabytes=8):
+        entries = max(2, int(megabytes * 2 ** 20) // ENTRY_BYTES)
+        buckets = 1 << ((entries // 2).bit_length() - 1)
+        self.capacity = 2 * buckets
+        self._mask = buckets - 1
+        self._keys = array('Q', bytes(8 * self.capacity))
+        self._data = array('Q', bytes(8 * self.capacity))
+        self._age = 0
+
+    def clear(self):
+        self._keys = array('Q', bytes(8 * self.capacity))
+        self._data = array('Q', bytes(8 * self.capacity))
+
+    def new_search(self):
+        """Mark every stored result as coming from an older search"""
+        self._age = (self._age + 1) & 0xFF
+
+    def store(self, key, depth, flag, score, move=None):
+        """Save a search result
+
+        Args:
+            key (int): 64-bit key of the position
+            depth (int): depth the position was searched to, 0 to 255
+            flag (int): EXACT, LOWER or UPPER bound
+            score (int): score found, must fit in 32 bits
+            move (tuple): (origin, destination) squares of the best move
+        """
+        packed = (score + 0x80000000) << 32 | self._age << 24 | \
+                 depth << 16 | flag << 14
+        if move is not None:
+            packed |= 0x1000 | move[0] << 6 | move[1]
+        slot = (key & self._mask) << 1
+        keys, data = self._keys, self._data
+        if keys[slot] != key and data[slot] and \
+                data[slot] >> 24 & 0xFF == self._age and \
+                data[slot] >> 16 & 0xFF > depth:
+            slot += 1 # keep the deeper result
+        keys[slot] = key
+        data[slot] = packed
+
+    def probe(self, key):
+        """Return (depth, flag, score, move) stored for key, or None
+
+        move is an (origin, destination) tuple of square numbers, or None.
+
+        """
+        slot = (key & self._mask) << 1
+        if self._keys[slot] != key or not self._data[slot]:
+            slot += 1
+            if self._keys[slot] != key or not self._data[slot]:
+                return None
+        packed = self._data[slot]
+        move = (packed >> 6 & 0x3F, packed & 0x3F) if packed & 0x1000 \
+               else None
+        return (packed >> 16 & 0xFF, packed >> 14 & 0x3,
+                (packed >> 32) - 0x80000000, move)
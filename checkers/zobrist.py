@@ -0,0 +1,50 @@
+# Copyright (c) 2015 Gamda Software, LLC
+#
+# See the file LICENSE.txt for copying permission.
+
+import random
+
+# The tables come from a fixed seed so a key means the same position in
+# every process and every run, and keys can be stored in files.
+_random = random.Random(0x636865636B657273)
+
+WHITE_SOLDIER, WHITE_QUEEN, BLACK_SOLDIER, BLACK_QUEEN = range(4)
+
+# PIECES[piece][bit] for each of the four kinds of chip on each square
+PIECES = tuple(tuple(_random.getrandbits(64) for b in range(32))
+               for piece in range(4))
+# CURRENT_CHIP[bit] marks the chip that must keep jumping
+CURRENT_CHIP = tuple(_random.getrandbits(64) for b in range(32))
+WHITE_TO_MOVE = _random.getrandbits(64)
+
+
+def piece_on(position, bit):
+    """Return the index in PIECES of the chip on bit of position"""
+    mask = 1 << bit
+    piece = WHITE_SOLDIER if position.white & mask else BLACK_SOLDIER
+    return piece + 1 if position.queens & mask else piece
+
+
+def position_key(position, current_chip=None):
+    """Return the 64-bit key of position, computed from scratch
+
+    Args:
+        position (Position): the chips and the side to move
+        current_chip (int): bit of the chip that must keep jumping, if any
+    Returns:
+        int: the key
+
+    """
+    key = WHITE_TO_MOVE if position.white_to_move else 0
+    for piece, mask in ((WHITE_SOLDIER, position.white & ~position.queens),
+                        (WHITE_QUEEN, position.white & position.queens),
+                        (BLACK_SOLDIER, position.black & ~position.queens),
+                        (BLACK_QUEEN, position.black & position.queens)):
+        table = PIECES[piece]
+        while mask:
+            low = mask & -mask
+            key ^= table[low.bit_length() - 1]
+            mask ^= low
+    if current_chip is not None:
+        key ^= CURRENT_CHIP[current_chip]
+    return key
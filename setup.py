@@ -23,6 +23,9 @@ setup(name='checkers',
           'gameboard',
           'pygame'
       ],
+      extras_require={
+          'batch': ['numpy']
+      },
       include_package_data=True,
       zip_safe=False,
       test_suite='nose.collector',